@@ -0,0 +1,413 @@
+import argparse
+import queue
+import time
+
+import numpy as np
+import torch
+import torch.multiprocessing as mp
+import torch.nn.functional as F
+from stable_baselines3 import PPO
+from stable_baselines3.common.callbacks import BaseCallback
+from stable_baselines3.common.policies import ActorCriticCnnPolicy
+from stable_baselines3.common.vec_env import VecTransposeImage
+
+from train_agent import PPO_HYPERPARAMS, create_pacman_env
+
+# Indices into each actor's shared stats array
+STAT_ENV_STEPS = 0
+STAT_ENV_TIME = 1
+STAT_INFERENCE_TIME = 2
+STAT_QUEUE_WAIT_TIME = 3
+STAT_SYNC_TIME = 4
+N_STATS = 5
+
+
+def make_policy(observation_space, action_space, learning_rate):
+    # Same architecture as PPO("CnnPolicy") so weights can be saved as a PPO model
+    return ActorCriticCnnPolicy(
+        VecTransposeImage.transpose_space(observation_space),
+        action_space,
+        lr_schedule=lambda _: learning_rate,
+    )
+
+
+def to_channels_first(obs):
+    return np.ascontiguousarray(np.transpose(obs, (2, 0, 1)))
+
+
+def collect_trajectory(env, policy, obs, episode_return, unroll_length, policy_version, stats=None):
+    # Steps one env for unroll_length steps with the given policy; obs is channels-first.
+    # Returns the trajectory plus the obs and running episode return to continue from.
+    observations = np.empty((unroll_length + 1,) + obs.shape, dtype=np.uint8)
+    actions = np.empty(unroll_length, dtype=np.int64)
+    rewards = np.empty(unroll_length, dtype=np.float32)
+    dones = np.empty(unroll_length, dtype=np.float32)
+    behaviour_log_probs = np.empty(unroll_length, dtype=np.float32)
+    episode_returns = []
+    inference_time = 0.0
+    env_time = 0.0
+
+    for t in range(unroll_length):
+        observations[t] = obs
+
+        inference_start = time.time()
+        with torch.no_grad():
+            obs_tensor = torch.as_tensor(obs[None])
+            distribution = policy.get_distribution(obs_tensor)
+            action = distribution.get_actions(deterministic=False)
+            log_prob = distribution.log_prob(action)
+        inference_time += time.time() - inference_start
+
+        env_start = time.time()
+        obs, reward, terminated, truncated, _ = env.step(int(action[0]))
+        done = terminated or truncated
+        episode_return += reward
+        if done:
+            episode_returns.append(episode_return)
+            episode_return = 0.0
+            obs, _ = env.reset()
+        obs = to_channels_first(obs)
+        env_time += time.time() - env_start
+
+        actions[t] = int(action[0])
+        rewards[t] = reward
+        dones[t] = float(done)
+        behaviour_log_probs[t] = float(log_prob[0])
+
+    observations[unroll_length] = obs
+    if stats is not None:
+        stats[STAT_ENV_STEPS] += unroll_length
+        stats[STAT_ENV_TIME] += env_time
+        stats[STAT_INFERENCE_TIME] += inference_time
+
+    trajectory = {
+        'observations': observations,
+        'actions': actions,
+        'rewards': rewards,
+        'dones': dones,
+        'behaviour_log_probs': behaviour_log_probs,
+        'policy_version': policy_version,
+        'episode_returns': episode_returns,
+    }
+    return trajectory, obs, episode_return
+
+
+def actor_loop(actor_id, shared_policy, policy_lock, policy_version, trajectory_queue,
+               stop_event, stats, unroll_length, seed):
+    torch.set_num_threads(1)
+    env = create_pacman_env()
+    policy = make_policy(env.observation_space, env.action_space, PPO_HYPERPARAMS['learning_rate'])
+    policy.set_training_mode(False)
+    local_version = -1
+
+    obs, _ = env.reset(seed=seed + actor_id)
+    obs = to_channels_first(obs)
+    episode_return = 0.0
+
+    while not stop_event.is_set():
+        # Pick up the learner's latest weights; the copy may be a few updates stale
+        sync_start = time.time()
+        if policy_version.value != local_version:
+            with policy_lock:
+                policy.load_state_dict(shared_policy.state_dict())
+                local_version = policy_version.value
+        stats[STAT_SYNC_TIME] += time.time() - sync_start
+
+        trajectory, obs, episode_return = collect_trajectory(env, policy, obs, episode_return, unroll_length,
+                                                             local_version, stats)
+
+        # Block while the learner is behind, but keep checking for shutdown
+        wait_start = time.time()
+        while not stop_event.is_set():
+            try:
+                trajectory_queue.put(trajectory, timeout=0.1)
+                break
+            except queue.Full:
+                continue
+        stats[STAT_QUEUE_WAIT_TIME] += time.time() - wait_start
+
+    env.close()
+
+
+def vtrace_targets(behaviour_log_probs, target_log_probs, rewards, dones, values, bootstrap_value,
+                   gamma, rho_clip=1.0, c_clip=1.0):
+    # All inputs are time-major tensors of shape (T, B); see Espeholt et al., IMPALA (2018)
+    rhos = torch.exp(target_log_probs - behaviour_log_probs)
+    clipped_rhos = torch.clamp(rhos, max=rho_clip)
+    cs = torch.clamp(rhos, max=c_clip)
+    discounts = gamma * (1.0 - dones)
+
+    values_t_plus_1 = torch.cat([values[1:], bootstrap_value[None]], dim=0)
+    deltas = clipped_rhos * (rewards + discounts * values_t_plus_1 - values)
+
+    accumulator = torch.zeros_like(bootstrap_value)
+    vs_minus_v = []
+    for t in reversed(range(rewards.shape[0])):
+        accumulator = deltas[t] + discounts[t] * cs[t] * accumulator
+        vs_minus_v.append(accumulator)
+    vs_minus_v = torch.stack(vs_minus_v[::-1], dim=0)
+    vs = values + vs_minus_v
+
+    vs_t_plus_1 = torch.cat([vs[1:], bootstrap_value[None]], dim=0)
+    pg_advantages = clipped_rhos * (rewards + discounts * vs_t_plus_1 - values)
+    return vs, pg_advantages
+
+
+class ActorLearner:
+
+    def __init__(self, n_actors=4, unroll_length=64, batch_size=8, learner_threads=None, seed=0):
+        self.n_actors = n_actors
+        self.unroll_length = unroll_length
+        self.batch_size = batch_size
+        self.learner_threads = learner_threads
+        self.seed = seed
+        self.gamma = PPO_HYPERPARAMS['gamma']
+        self.ent_coef = PPO_HYPERPARAMS['ent_coef']
+        self.vf_coef = PPO_HYPERPARAMS['vf_coef']
+        self.max_grad_norm = PPO_HYPERPARAMS['max_grad_norm']
+
+        env = create_pacman_env()
+        self.observation_space = env.observation_space
+        self.action_space = env.action_space
+        env.close()
+
+        self.policy = make_policy(self.observation_space, self.action_space, PPO_HYPERPARAMS['learning_rate'])
+
+        # Actors read weights from this copy; only the learner writes to it
+        self.shared_policy = make_policy(self.observation_space, self.action_space, PPO_HYPERPARAMS['learning_rate'])
+        self.shared_policy.load_state_dict(self.policy.state_dict())
+        self.shared_policy.share_memory()
+
+    def _publish_weights(self, ctx_lock, policy_version):
+        with ctx_lock:
+            self.shared_policy.load_state_dict(self.policy.state_dict())
+            policy_version.value += 1
+
+    def _update(self, trajectories):
+        # Stack into time-major (T, B, ...) tensors
+        observations = torch.as_tensor(np.stack([tr['observations'] for tr in trajectories], axis=1))
+        actions = torch.as_tensor(np.stack([tr['actions'] for tr in trajectories], axis=1))
+        rewards = torch.as_tensor(np.stack([tr['rewards'] for tr in trajectories], axis=1))
+        dones = torch.as_tensor(np.stack([tr['dones'] for tr in trajectories], axis=1))
+        behaviour_log_probs = torch.as_tensor(np.stack([tr['behaviour_log_probs'] for tr in trajectories], axis=1))
+
+        T, B = actions.shape
+        flat_obs = observations.reshape((T + 1) * B, *observations.shape[2:])
+        flat_actions = torch.cat([actions.reshape(T * B), torch.zeros(B, dtype=actions.dtype)])
+
+        values, log_probs, entropy = self.policy.evaluate_actions(flat_obs, flat_actions)
+        values = values.reshape(T + 1, B)
+        target_log_probs = log_probs.reshape(T + 1, B)[:-1]
+        entropy = entropy.reshape(T + 1, B)[:-1]
+
+        with torch.no_grad():
+            vs, pg_advantages = vtrace_targets(
+                behaviour_log_probs, target_log_probs.detach(), rewards, dones,
+                values[:-1].detach(), values[-1].detach(), self.gamma
+            )
+
+        policy_loss = -(pg_advantages * target_log_probs).mean()
+        value_loss = F.mse_loss(values[:-1], vs)
+        entropy_loss = -entropy.mean()
+        loss = policy_loss + self.vf_coef * value_loss + self.ent_coef * entropy_loss
+
+        self.policy.optimizer.zero_grad()
+        loss.backward()
+        torch.nn.utils.clip_grad_norm_(self.policy.parameters(), self.max_grad_norm)
+        self.policy.optimizer.step()
+
+        return float(loss.item())
+
+    @staticmethod
+    def _get_trajectory(trajectory_queue, actors, poll_seconds=1.0):
+        # Polls, so an actor that crashed stops training instead of blocking the learner forever
+        while True:
+            try:
+                return trajectory_queue.get(timeout=poll_seconds)
+            except queue.Empty:
+                dead = [(actor_id, actor.exitcode) for actor_id, actor in enumerate(actors) if not actor.is_alive()]
+                if dead:
+                    raise RuntimeError(f"Actor processes exited during training (actor, exit code): {dead}")
+
+    def learn(self, total_timesteps):
+        if self.learner_threads:
+            torch.set_num_threads(self.learner_threads)
+
+        ctx = mp.get_context("spawn")
+        policy_lock = ctx.Lock()
+        policy_version = ctx.Value('l', 0)
+        trajectory_queue = ctx.Queue(maxsize=self.batch_size * 2)
+        stop_event = ctx.Event()
+        actor_stats = [ctx.Array('d', N_STATS) for _ in range(self.n_actors)]
+
+        actors = []
+        for actor_id in range(self.n_actors):
+            actor = ctx.Process(
+                target=actor_loop,
+                args=(actor_id, self.shared_policy, policy_lock, policy_version, trajectory_queue,
+                      stop_event, actor_stats[actor_id], self.unroll_length, self.seed),
+                daemon=True,
+            )
+            actor.start()
+            actors.append(actor)
+
+        print(f"Actor-learner training with {self.n_actors} actors for {total_timesteps} timesteps...")
+
+        consumed_steps = 0
+        updates = 0
+        learner_busy_time = 0.0
+        learner_wait_time = 0.0
+        version_lags = []
+        episode_returns = []
+        start_time = time.time()
+
+        try:
+            while consumed_steps < total_timesteps:
+                wait_start = time.time()
+                trajectories = [self._get_trajectory(trajectory_queue, actors) for _ in range(self.batch_size)]
+                learner_wait_time += time.time() - wait_start
+
+                busy_start = time.time()
+                loss = self._update(trajectories)
+                self._publish_weights(policy_lock, policy_version)
+                learner_busy_time += time.time() - busy_start
+
+                updates += 1
+                consumed_steps += self.batch_size * self.unroll_length
+                version_lags.extend(policy_version.value - 1 - tr['policy_version'] for tr in trajectories)
+                for tr in trajectories:
+                    episode_returns.extend(tr['episode_returns'])
+
+                if updates % 50 == 0:
+                    elapsed = time.time() - start_time
+                    recent = episode_returns[-10:]
+                    avg_return = f"{np.mean(recent):.2f}" if recent else "N/A"
+                    print(f"Update {updates}: Steps={consumed_steps} | Steps/sec={consumed_steps / elapsed:.0f} | "
+                          f"Avg Return={avg_return} | Loss={loss:.4f}")
+        finally:
+            stop_event.set()
+            for actor in actors:
+                actor.join(timeout=5)
+                if actor.is_alive():
+                    actor.terminate()
+
+        wall_time = time.time() - start_time
+        actor_totals = np.sum([np.frombuffer(stats.get_obj()) for stats in actor_stats], axis=0)
+        actor_time = wall_time * self.n_actors
+
+        report = {
+            'mode': 'actor_learner',
+            'timesteps': consumed_steps,
+            'wall_time': wall_time,
+            'steps_per_sec': consumed_steps / wall_time,
+            'generated_steps_per_sec': actor_totals[STAT_ENV_STEPS] / wall_time,
+            'learner_utilization': learner_busy_time / wall_time,
+            'learner_wait_fraction': learner_wait_time / wall_time,
+            'actor_env_fraction': actor_totals[STAT_ENV_TIME] / actor_time,
+            'actor_inference_fraction': actor_totals[STAT_INFERENCE_TIME] / actor_time,
+            'actor_queue_wait_fraction': actor_totals[STAT_QUEUE_WAIT_TIME] / actor_time,
+            'actor_sync_fraction': actor_totals[STAT_SYNC_TIME] / actor_time,
+            'mean_policy_lag': float(np.mean(version_lags)) if version_lags else 0.0,
+            'updates': updates,
+        }
+        return report
+
+    def save(self, model_path):
+        # Wrap the weights in a PPO model so evaluate_model() and AgentPlayMode can load them
+        env = create_pacman_env()
+        model = PPO("CnnPolicy", env, verbose=0, **PPO_HYPERPARAMS)
+        model.policy.load_state_dict(self.policy.state_dict())
+        model.save(model_path)
+        env.close()
+        print(f"Model saved as '{model_path}'")
+
+
+# Callback that splits synchronous PPO wall time into rollout and update phases
+class PhaseTimerCallback(BaseCallback):
+
+    def __init__(self, verbose=0):
+        super(PhaseTimerCallback, self).__init__(verbose)
+        self.rollout_time = 0.0
+        self.update_time = 0.0
+        self.rollout_start = None
+        self.rollout_end = None
+
+    def _on_rollout_start(self):
+        now = time.time()
+        if self.rollout_end is not None:
+            self.update_time += now - self.rollout_end
+        self.rollout_start = now
+
+    def _on_rollout_end(self):
+        self.rollout_end = time.time()
+        self.rollout_time += self.rollout_end - self.rollout_start
+
+    def _on_step(self):
+        return True
+
+    def _on_training_end(self):
+        if self.rollout_end is not None:
+            self.update_time += time.time() - self.rollout_end
+
+
+def benchmark_sync(total_timesteps):
+    # Same setup as train(), timed over a short run
+    env = create_pacman_env()
+    model = PPO("CnnPolicy", env, verbose=0, **PPO_HYPERPARAMS)
+    phase_timer = PhaseTimerCallback()
+
+    start_time = time.time()
+    model.learn(total_timesteps=total_timesteps, callback=phase_timer)
+    wall_time = time.time() - start_time
+    env.close()
+
+    return {
+        'mode': 'sync_ppo',
+        'timesteps': model.num_timesteps,
+        'wall_time': wall_time,
+        'steps_per_sec': model.num_timesteps / wall_time,
+        'rollout_fraction': phase_timer.rollout_time / wall_time,
+        'learner_utilization': phase_timer.update_time / wall_time,
+    }
+
+
+def print_report(report):
+    print(f"\n{report['mode']} results:")
+    for key, value in report.items():
+        if key == 'mode':
+            continue
+        if isinstance(value, float):
+            print(f"  {key}: {value:.3f}")
+        else:
+            print(f"  {key}: {value}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Asynchronous actor-learner training for Pacman")
+    parser.add_argument("--actors", type=int, default=4)
+    parser.add_argument("--unroll-length", type=int, default=64)
+    parser.add_argument("--batch-size", type=int, default=8, help="Trajectories per learner update")
+    parser.add_argument("--timesteps", type=int, default=200_000)
+    parser.add_argument("--learner-threads", type=int, default=None)
+    parser.add_argument("--model-path", default="ppo_pacman_actor_learner.zip")
+    parser.add_argument("--compare", action="store_true", help="Also time the synchronous train() path")
+    args = parser.parse_args()
+
+    learner = ActorLearner(
+        n_actors=args.actors,
+        unroll_length=args.unroll_length,
+        batch_size=args.batch_size,
+        learner_threads=args.learner_threads,
+    )
+    report = learner.learn(args.timesteps)
+    learner.save(args.model_path)
+    print_report(report)
+
+    if args.compare:
+        sync_report = benchmark_sync(args.timesteps)
+        print_report(sync_report)
+        print(f"\nSpeedup (steps/sec): {report['steps_per_sec'] / sync_report['steps_per_sec']:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+import math
+
+import numpy as np
+import torch
+
+
+def predict_with_uncertainty(model, observation):
+    # Deterministic action, normalized action entropy and value estimate from one forward pass
+    # (the same work model.predict does, plus the critic head on the shared features)
+    policy = model.policy
+    policy.set_training_mode(False)
+    obs_tensor, _ = policy.obs_to_tensor(observation)
+    with torch.no_grad():
+        features = policy.extract_features(obs_tensor)
+        if policy.share_features_extractor:
+            latent_pi, latent_vf = policy.mlp_extractor(features)
+        else:
+            pi_features, vf_features = features
+            latent_pi = policy.mlp_extractor.forward_actor(pi_features)
+            latent_vf = policy.mlp_extractor.forward_critic(vf_features)
+        distribution = policy._get_action_dist_from_latent(latent_pi)
+        action = distribution.mode()
+        entropy = distribution.entropy()
+        value = policy.value_net(latent_vf)
+    # 0 = certain, 1 = uniform over the actions
+    uncertainty = float(entropy[0]) / math.log(model.action_space.n)
+    return int(action[0]), uncertainty, float(value[0])
+
+
+# The original trigger: ask every `frequency` steps
+class ScheduleTrigger:
+
+    name = "schedule"
+    needs_uncertainty = False
+
+    def __init__(self, frequency=50):
+        self.frequency = frequency
+        self.suppressed = 0
+
+    def should_request(self, step, session_seconds, uncertainty=None):
+        return step > 0 and step % self.frequency == 0
+
+
+# Ask when the policy's normalized action entropy reaches `threshold`, at most once every
+# `min_interval_steps` steps and at most `max_per_minute` times per minute of session time
+# (token bucket holding up to `burst` requests)
+class UncertaintyTrigger:
+
+    name = "uncertainty"
+    needs_uncertainty = True
+
+    def __init__(self, threshold=0.5, min_interval_steps=10, max_per_minute=6.0, burst=2):
+        self.threshold = threshold
+        self.min_interval_steps = min_interval_steps
+        self.max_per_minute = max_per_minute
+        self.burst = burst
+        self.tokens = float(burst)
+        self.last_refill = 0.0
+        self.last_request_step = None
+        self.suppressed = 0
+
+    def should_request(self, step, session_seconds, uncertainty=None):
+        self.tokens = min(self.burst, self.tokens + (session_seconds - self.last_refill) * self.max_per_minute / 60)
+        self.last_refill = session_seconds
+        if uncertainty is None or uncertainty < self.threshold:
+            return False
+        if (self.last_request_step is not None and step - self.last_request_step < self.min_interval_steps) \
+                or self.tokens < 1:
+            self.suppressed += 1
+            return False
+        self.tokens -= 1
+        self.last_request_step = step
+        return True
+
+
+def make_trigger(kind, advice_frequency=50, **kwargs):
+    if kind == "schedule":
+        return ScheduleTrigger(advice_frequency)
+    if kind == "uncertainty":
+        return UncertaintyTrigger(**kwargs)
+    raise ValueError(f"Unknown advice trigger: {kind}")
+
+
+# Every interruption of play for advice, to compare triggers by how much human time they cost.
+# An interruption is wasted when it ended with the agent's own action: the countdown expired
+# or the human advised what the agent would have done anyway.
+class InterruptionLog:
+
+    def __init__(self):
+        self.steps = []
+        self.stall_seconds = []
+        self.wasted = []
+        self.uncertainties = []
+
+    def record(self, step, stall_seconds, advised_action, agent_action, uncertainty=None):
+        self.steps.append(step)
+        self.stall_seconds.append(stall_seconds)
+        self.wasted.append(advised_action is None or advised_action == agent_action)
+        self.uncertainties.append(np.nan if uncertainty is None else uncertainty)
+
+    def report(self, trigger, session_seconds, step_count, schedule_frequency):
+        minutes = max(session_seconds, 1e-9) / 60
+        stall = np.asarray(self.stall_seconds, dtype=np.float64)
+        wasted = np.asarray(self.wasted, dtype=bool)
+        mean_stall = float(stall.mean()) if len(stall) else 0.0
+        report = {
+            'trigger': trigger.name,
+            'interruptions': len(stall),
+            'interruptions_per_minute': len(stall) / minutes,
+            'stall_seconds': float(stall.sum()),
+            'wasted_interruptions': int(wasted.sum()),
+            'wasted_stall_seconds': float(stall[wasted].sum()),
+            'mean_stall_seconds': mean_stall,
+            'suppressed_by_rate_limit': trigger.suppressed,
+        }
+        if trigger.needs_uncertainty and len(stall):
+            report['mean_uncertainty_at_request'] = float(np.nanmean(self.uncertainties))
+        # What the fixed schedule would have cost over the same steps, at this session's mean stall
+        baseline_interruptions = max(step_count - 1, 0) // schedule_frequency
+        report['schedule_baseline'] = {
+            'interruptions': baseline_interruptions,
+            'interruptions_per_minute': baseline_interruptions / minutes,
+            'estimated_stall_seconds': baseline_interruptions * mean_stall,
+        }
+        return report
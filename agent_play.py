@@ -3,17 +3,25 @@ import os
 import pygame
 import numpy as np
 from PIL import Image
-import gymnasium as gym
-import ale_py
-import threading
 from stable_baselines3 import PPO
-from stable_baselines3.common.atari_wrappers import AtariWrapper
-
-gym.register_envs(ale_py)
+from advice_trigger import InterruptionLog, make_trigger, predict_with_uncertainty
+from env_factory import create_env
+from frame_stack import infer_n_stack
+from inference_cache import CachedPolicy
+from instrumentation import FrameProfiler
+from metrics_store import METRICS_DB_PATH, close_run, open_run
+from recorder import FrameRecorder
+from session_clock import DeadlineScheduler, SessionClock
+from session_log import SessionLog, SOURCE_ADVICE, SOURCE_AGENT, session_path
+from policy_reloader import PolicyReloader
 
 class AgentPlayMode:
     
-    def __init__(self, model_path="ppo_pacman.zip", time_limit_minutes=10, countdown_seconds=5, freeze_mode_first=True, window_size=None):
+    def __init__(self, model_path="ppo_pacman.zip", time_limit_minutes=10, countdown_seconds=5, freeze_mode_first=True, window_size=None,
+                 inference_cache_size=None, profile_frames=False, trace_path=None,
+                 watch_model=False, record_dir=None, record_video=True, seed=None, record_format="mp4",
+                 metrics_path=METRICS_DB_PATH, advice_trigger="schedule", uncertainty_threshold=0.5,
+                 min_advice_interval_steps=10, max_advice_per_minute=6.0):
         self.model_path = model_path
         self.time_limit_minutes = time_limit_minutes
         self.countdown_seconds = countdown_seconds
@@ -24,32 +32,59 @@ class AgentPlayMode:
             self.window_size = (int(info.current_w * 0.6), int(info.current_h * 0.8))
         else:
             self.window_size = window_size
-        self.start_time = None
+        # Pause-aware monotonic session time; time limit, mode switch and advice countdown are deadlines on it
+        self.session_clock = SessionClock()
+        self.scheduler = DeadlineScheduler(self.session_clock)
         self.elapsed_time = 0
-        self.pause_start_time = None
-        self.total_pause_time = 0
-        self.game_timer = None
         self.time_expired = False
         self.paused = False
-        self.total_reward = 0
+        self.total_reward = 0  # Game points, comparable with human play
+        self.total_clipped_reward = 0  # What the agent was trained on
         self.step_count = 0
         self.actions_taken = []
         
         # Advice system variables
-        self.advice_frequency = 50  # Ask for advice every 50 steps
+        self.advice_frequency = 50  # Fixed schedule: ask for advice every 50 steps
+        # "schedule" asks every advice_frequency steps; "uncertainty" asks when the policy's
+        # normalized action entropy reaches uncertainty_threshold, within the rate limits
+        self.advice_trigger = make_trigger(advice_trigger, self.advice_frequency, threshold=uncertainty_threshold,
+                                           min_interval_steps=min_advice_interval_steps,
+                                           max_per_minute=max_advice_per_minute)
+        self.interruptions = InterruptionLog()
         self.waiting_for_advice = False
         self.human_advice_count = 0
         self.agent_action_count = 0
         self.current_advice_mode = "freeze" if freeze_mode_first else "countdown"  # Current mode: "freeze" or "countdown"
         self.mode_switch_time = (self.time_limit_minutes * 60) / 2  # Switch modes at halfway point
+        self.mode_switch_due = False
+        self.advice_expired = False
+        
+        # Frame timing and input latency instrumentation
+        self.target_fps = 3
+        self.profiler = FrameProfiler(self.target_fps, enabled=profile_frames or trace_path is not None,
+                                      trace_path=trace_path)
+        
+        # Session recording: a replayable per-step log plus an optional video encoded in the background
+        self.seed = seed if seed is not None else int(np.random.SeedSequence().entropy % (2**31))
+        self.record_dir = record_dir
+        self.record_video = record_video
+        # "mp4" video, or "frames" for a lossless frame_codec stream with random access by step
+        self.record_format = record_format
+        self.session_log = SessionLog("agent", self.seed, {'fps': self.target_fps, 'model_path': model_path,
+                                                           'rewards': "raw"}) if record_dir else None
+        self.recorder = None
+        
+        # Session metrics go to the shared store through a background writer
+        self.metrics_path = metrics_path
+        self.metrics_store = None
+        self.metrics_run = None
+        self.episode_reward = 0
         
         pygame.init()
         self.display = pygame.display.set_mode(self.window_size)
         pygame.display.set_caption("Pac-Man Agent Play Mode")
         self.clock = pygame.time.Clock()
         
-        self.env = self.create_pacman_env()
-        
         try:
             self.agent = PPO.load(model_path)
             print(f"Successfully loaded agent from {model_path}")
@@ -58,6 +93,20 @@ class AgentPlayMode:
             print("Please make sure the model file exists and is valid.")
             raise
         
+        # The env stacks as many frames as the agent was trained on
+        self.frame_stack = infer_n_stack(self.agent.observation_space)
+        self.env = self.create_pacman_env()
+        
+        # Optional LRU cache of deterministic predictions keyed by the (stacked) observation
+        self.inference_cache_size = inference_cache_size
+        self.policy = self.wrap_policy(self.agent)
+        
+        # Optional hot reload: a newer model file is loaded in the background and swapped in between steps
+        self.reloader = PolicyReloader(model_path) if watch_model else None
+        self.model_version = self.reloader.current_version if self.reloader else None
+        self.model_switches = []
+        self.steps_per_model_version = {}
+        
         # Font setup
         self.font_large = pygame.font.Font(None, 48)
         self.font_medium = pygame.font.Font(None, 36)
@@ -81,37 +130,68 @@ class AgentPlayMode:
             pygame.K_SPACE: 0,  # NOOP
         }
     
+    def wrap_policy(self, agent):
+        if not self.inference_cache_size:
+            return agent
+        return CachedPolicy(agent, max_size=self.inference_cache_size)
+    
+    def swap_model_if_ready(self):
+        swapped = self.reloader.swap_if_ready()
+        if swapped is None:
+            return
+        
+        model, version, load_seconds = swapped
+        if model.observation_space.shape != self.agent.observation_space.shape:
+            print(f"\nIgnoring model version {version}: it expects observations of shape "
+                  f"{model.observation_space.shape}, not {self.agent.observation_space.shape}")
+            return
+        previous_version = self.model_version
+        cache_statistics = self.policy.get_statistics() if isinstance(self.policy, CachedPolicy) else None
+        
+        # A plain reference swap between steps; cached actions belong to the old weights
+        self.agent = model
+        self.policy = self.wrap_policy(model)
+        self.model_version = version
+        self.model_switches.append({
+            'from_version': previous_version,
+            'to_version': version,
+            'step': self.step_count,
+            'elapsed_time_seconds': self.elapsed_time,
+            'load_seconds': load_seconds,
+            'previous_inference_cache': cache_statistics,
+        })
+        print(f"\nStep {self.step_count}: switched model {previous_version} -> {version} "
+              f"(loaded in background in {load_seconds:.2f}s)")
+    
     def create_pacman_env(self):
-        env = gym.make("ALE/Pacman-v5", render_mode="rgb_array")
-        
-        env = AtariWrapper(
-            env,
-            frame_skip=4,        # Skip 4 frames
-            terminal_on_life_loss=False,  # Don't end episode on life loss
-            clip_reward=True     # Clip rewards to [-1, 1]
-        )
-        
-        return env
+        # Same dynamics and preprocessing as training, plus RGB frames for the window
+        return create_env("interactive", frame_stack=self.frame_stack, raw_reward_info=True)
     
     def start_timer(self):
-        def timer_function():
-            elapsed = 0
-            while elapsed < self.time_limit_minutes * 60 and not self.time_expired:
-                time.sleep(0.1)  # Check every 100ms
-                if not self.paused:  # Only count time when not paused
-                    elapsed += 0.1
-            if elapsed >= self.time_limit_minutes * 60:
-                self.time_expired = True
-                print(f"\nTime limit reached! ({self.time_limit_minutes} minutes)")
-        
-        self.game_timer = threading.Thread(target=timer_function, daemon=True)
-        self.game_timer.start()
-        self.start_time = time.time()
+        self.session_clock.start()
+        self.scheduler.schedule(self.time_limit_minutes * 60, self.on_time_expired, "time_limit")
+        self.scheduler.schedule(self.mode_switch_time, self.on_mode_switch_due, "mode_switch")
+    
+    def on_time_expired(self):
+        self.time_expired = True
+        print(f"\nTime limit reached! ({self.time_limit_minutes} minutes)")
+    
+    def on_mode_switch_due(self):
+        self.mode_switch_due = True
+    
+    def on_advice_expired(self):
+        self.advice_expired = True
     
     def stop_timer(self):
         self.time_expired = True
-        if self.game_timer and self.game_timer.is_alive():
-            pass
+        self.scheduler.cancel_all()
+    
+    def set_paused(self, paused):
+        self.paused = paused
+        if paused:
+            self.session_clock.pause()
+        else:
+            self.session_clock.resume()
         
     def draw_text(self, text, font, color, position, center=False):
         text_surface = font.render(text, True, color)
@@ -345,8 +425,9 @@ class AgentPlayMode:
         action_counts = [self.actions_taken.count(i) for i in range(5)]
         most_common_action = max(set(self.actions_taken), key=self.actions_taken.count)
         
-        return {
+        statistics = {
             'total_reward': self.total_reward,
+            'total_clipped_reward': self.total_clipped_reward,
             'step_count': self.step_count,
             'elapsed_time_seconds': self.elapsed_time,
             'average_reward_per_step': self.total_reward / max(self.step_count, 1),
@@ -355,8 +436,20 @@ class AgentPlayMode:
             'most_common_action': most_common_action,
             'human_advice_count': self.human_advice_count,
             'agent_action_count': self.agent_action_count,
-            'advice_ratio': self.human_advice_count / max(self.step_count, 1)
+            'advice_ratio': self.human_advice_count / max(self.step_count, 1),
+            'advice_interruptions': self.interruptions.report(self.advice_trigger, self.elapsed_time,
+                                                              self.step_count, self.advice_frequency),
         }
+        
+        if isinstance(self.policy, CachedPolicy):
+            statistics['inference_cache'] = self.policy.get_statistics()
+        
+        if self.reloader:
+            statistics['model_version'] = self.model_version
+            statistics['model_switches'] = self.model_switches
+            statistics['steps_per_model_version'] = self.steps_per_model_version
+        
+        return statistics
     
     def show_end_screen(self, statistics):
         self.display.fill(self.BLACK)
@@ -414,6 +507,7 @@ class AgentPlayMode:
                 elif event.type == pygame.KEYDOWN:
                     if event.key in self.action_map:
                         action = self.action_map[event.key]
+                        self.profiler.key_down(event.key)
                         waiting = False
                         break
                     elif event.key == pygame.K_ESCAPE:
@@ -426,30 +520,36 @@ class AgentPlayMode:
         return action
     
     def request_human_advice_countdown(self):
-        start_time = time.time()
+        self.advice_expired = False
+        deadline = self.scheduler.schedule_in(self.countdown_seconds, self.on_advice_expired, "advice_countdown")
         action = None
         
-        while time.time() - start_time < self.countdown_seconds:
-            remaining_time = self.countdown_seconds - (time.time() - start_time)
+        while not self.advice_expired:
+            remaining_time = max(0.0, deadline.deadline - self.session_clock.elapsed())
             self.draw_advice_screen(countdown_time=remaining_time)
             
             for event in pygame.event.get():
                 if event.type == pygame.QUIT:
+                    self.scheduler.cancel(deadline)
                     return None
                 elif event.type == pygame.KEYDOWN:
                     if event.key in self.action_map:
                         action = self.action_map[event.key]
+                        self.profiler.key_down(event.key)
                         self.human_advice_count += 1
                         print(f"Human advised action: {action}")
                         break
                     elif event.key == pygame.K_ESCAPE:
+                        self.scheduler.cancel(deadline)
                         return None
             
             if action is not None:
                 break
             
-            self.clock.tick(60)
+            # Keep the window responsive; the countdown deadline ends the wait exactly
+            self.scheduler.sleep(1.0 / 60)
         
+        self.scheduler.cancel(deadline)
         self.waiting_for_advice = False
         
         if action is None:
@@ -466,60 +566,68 @@ class AgentPlayMode:
         if not self.show_start_screen():
             return None
         
-        obs, info = self.env.reset()
+        obs, info = self.env.reset(seed=self.seed)
         print(f"Game started! Initial info: {info}")
+        self.metrics_store, self.metrics_run = open_run(self.metrics_path, "agent_play", {
+            'model_path': self.model_path, 'time_limit_minutes': self.time_limit_minutes, 'seed': self.seed,
+            'fps': self.target_fps, 'countdown_seconds': self.countdown_seconds,
+            'freeze_mode_first': self.freeze_mode_first, 'advice_trigger': self.advice_trigger.name})
+        
+        if self.record_dir:
+            self.record_stem = session_path(self.record_dir, "agent", extension="")
+            if self.record_video:
+                self.recorder = FrameRecorder(f"{self.record_stem}.{self.record_format}", self.target_fps).start()
         
         self.show_countdown()
         
         self.start_timer()
         
+        if self.reloader:
+            self.reloader.start()
+        
         # Main game loop
         running = True
         while running:
-            if self.start_time:
-                current_time = time.time()
-                if self.paused and self.pause_start_time:
-                    self.elapsed_time = self.pause_start_time - self.start_time - self.total_pause_time
-                else:
-                    self.elapsed_time = current_time - self.start_time - self.total_pause_time
+            frame_start = time.monotonic()
+            
+            self.scheduler.poll()
+            self.elapsed_time = self.session_clock.elapsed()
             
             if self.time_expired:
                 break
             
+            self.profiler.begin_frame()
+            
             # Handle events
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT:
-                    running = False
-                    break
-                elif event.type == pygame.KEYDOWN:
-                    if event.key == pygame.K_p:
-                        # Toggle pause state
-                        self.paused = not self.paused
-                        if self.paused:
-                            # Start tracking pause time
-                            self.pause_start_time = time.time()
-                            self.draw_pause_screen()
-                        else:
-                            # End pause and add to total pause time
-                            if self.pause_start_time:
-                                self.total_pause_time += time.time() - self.pause_start_time
-                                self.pause_start_time = None
-                    elif event.key == pygame.K_ESCAPE and self.paused:
+            with self.profiler.section("events"):
+                for event in pygame.event.get():
+                    if event.type == pygame.QUIT:
                         running = False
                         break
+                    elif event.type == pygame.KEYDOWN:
+                        if event.key == pygame.K_p:
+                            # Toggle pause state; the session clock stops while paused
+                            self.set_paused(not self.paused)
+                            if self.paused:
+                                self.draw_pause_screen()
+                        elif event.key == pygame.K_ESCAPE and self.paused:
+                            running = False
+                            break
             
             if not running:
                 break
             
             if self.paused:
+                self.profiler.abandon_frame()
                 self.clock.tick(60)
                 continue
             
             # if it's time to switch modes (at halfway point)
-            if self.elapsed_time >= self.mode_switch_time and self.current_advice_mode == ("freeze" if self.freeze_mode_first else "countdown"):
+            if self.mode_switch_due:
+                self.mode_switch_due = False
+                
                 # Pause the game and timer for mode switch
-                self.paused = True
-                self.pause_start_time = time.time()
+                self.set_paused(True)
                 
                 # Switch to the other mode
                 self.current_advice_mode = "countdown" if self.freeze_mode_first else "freeze"
@@ -551,80 +659,157 @@ class AgentPlayMode:
                     break
                 
                 # Resume the game
-                self.paused = False
-                if self.pause_start_time:
-                    self.total_pause_time += time.time() - self.pause_start_time
-                    self.pause_start_time = None
+                self.set_paused(False)
+                
+                # The mode switch screen is not part of frame pacing
+                self.profiler.abandon_frame()
+                self.profiler.begin_frame()
+            
+            if self.reloader:
+                self.swap_model_if_ready()
+            
+            # The uncertainty trigger needs the policy's entropy, computed in the same forward pass as the action
+            agent_action, uncertainty = None, None
+            if self.advice_trigger.needs_uncertainty:
+                with self.profiler.section("inference"):
+                    agent_action, uncertainty, _ = predict_with_uncertainty(self.agent, obs)
             
             # Check if it's time to ask for human advice
-            if self.step_count > 0 and self.step_count % self.advice_frequency == 0:
+            action_source = SOURCE_AGENT
+            if self.advice_trigger.should_request(self.step_count, self.session_clock.elapsed(), uncertainty):
                 print(f"\nStep {self.step_count}: Requesting human advice in {self.current_advice_mode} mode...")
+                stall_start = time.monotonic()
                 advice_action = self.request_human_advice()
+                stall_seconds = time.monotonic() - stall_start
+                
+                # Time spent waiting for advice is not part of frame pacing
+                self.profiler.abandon_frame()
+                self.profiler.begin_frame()
                 
                 if advice_action is None:
                     running = False
                     break
                 
+                if agent_action is None:
+                    # Also needed to tell whether the interruption changed anything
+                    with self.profiler.section("inference"):
+                        agent_action, _ = self.policy.predict(obs, deterministic=True)
+                    agent_action = int(agent_action)
+                
                 if advice_action == "agent_action":
                     # No advice given in countdown mode, use agent's action
-                    action, _ = self.agent.predict(obs, deterministic=True)
-                    action = int(action)
+                    action = agent_action
                     self.agent_action_count += 1
                     print(f"Using agent's action: {action}")
                 else:
                     # Human gave advice
                     action = int(advice_action)
+                    action_source = SOURCE_ADVICE
                     print(f"Human advised action: {action}")
+                    if self.session_log is not None:
+                        # Snapshot before the step, so the advised and agent actions can be replayed from here
+                        self.session_log.record_advice_point(self.env.unwrapped.ale.cloneState(), obs,
+                                                             action, agent_action)
+                self.interruptions.record(self.step_count, stall_seconds,
+                                          None if advice_action == "agent_action" else action,
+                                          agent_action, uncertainty)
             else:
                 # Get action from the trained agent
-                action, _ = self.agent.predict(obs, deterministic=True)
-                action = int(action)  
+                if agent_action is None:
+                    with self.profiler.section("inference"):
+                        agent_action, _ = self.policy.predict(obs, deterministic=True)
+                action = int(agent_action)
                 self.agent_action_count += 1
                 if self.step_count % 100 == 0:
                     print(f"Agent taking action: {action}")
             
-            obs, reward, terminated, truncated, info = self.env.step(action)
+            with self.profiler.section("env_step"):
+                obs, reward, terminated, truncated, info = self.env.step(action)
             
+            # Score in raw game points like human play; the env's own reward is clipped for the policy
+            self.total_clipped_reward += reward
+            reward = info['raw_reward']
             self.total_reward += reward
+            self.episode_reward += reward
             self.step_count += 1
             self.actions_taken.append(action)
+            if self.session_log is not None:
+                self.session_log.record_step(self.elapsed_time, action, reward, terminated or truncated,
+                                             source=action_source, advice_mode=self.current_advice_mode)
+            if self.model_version:
+                self.steps_per_model_version[self.model_version] = self.steps_per_model_version.get(self.model_version, 0) + 1
             
 
             
             # Render game
-            image = self.env.render()
-            image = Image.fromarray(image, 'RGB')
-            
-            image = image.resize(self.window_size, Image.Resampling.LANCZOS)
-            
-            mode, size, data = image.mode, image.size, image.tobytes()
-            pygame_image = pygame.image.fromstring(data, size, mode)
-            
-            self.display.blit(pygame_image, (0, 0))
-            
-            self.draw_game_info()
+            with self.profiler.section("render"):
+                image = self.env.render()
+                if self.recorder:
+                    self.recorder.submit(image)
+                image = Image.fromarray(image, 'RGB')
+                
+                image = image.resize(self.window_size, Image.Resampling.LANCZOS)
+                
+                mode, size, data = image.mode, image.size, image.tobytes()
+                pygame_image = pygame.image.fromstring(data, size, mode)
+                
+                self.display.blit(pygame_image, (0, 0))
+                
+                self.draw_game_info()
             
-            pygame.display.update()
+            with self.profiler.section("flip"):
+                pygame.display.update()
+            self.profiler.end_frame()
             
             # Print progress every 100 steps
             if self.step_count % 100 == 0:
                 time_remaining = max(0, self.time_limit_minutes * 60 - self.elapsed_time)
                 print(f"Step {self.step_count}: Score={self.total_reward}, "
                       f"Time remaining: {int(time_remaining//60):02d}:{int(time_remaining%60):02d}")
+                if self.metrics_run:
+                    self.metrics_run.log('score', self.total_reward, self.step_count)
+                    self.metrics_run.log('advice_ratio', self.human_advice_count / self.step_count, self.step_count)
             
             if terminated or truncated:
                 print(f"Episode ended after {self.step_count} steps - continuing with unlimited lives!")
+                if self.metrics_run:
+                    self.metrics_run.log('episode_reward', self.episode_reward, self.step_count)
+                self.episode_reward = 0
                 obs, info = self.env.reset()
 
                 continue
             
-            target_fps = 3  # Adjust this value to control game speed
-            self.clock.tick(target_fps)
+            # Sleep out the frame (adjust target_fps in __init__ to control game speed),
+            # waking early if a session deadline falls inside it
+            self.scheduler.sleep(frame_start + 1.0 / self.target_fps - time.monotonic())
         
         self.stop_timer()
         
+        if self.reloader:
+            self.reloader.stop()
+        
         statistics = self.get_game_statistics()
         
+        if self.profiler.enabled:
+            self.profiler.print_summary()
+            self.profiler.write_trace()
+            if statistics:
+                statistics['frame_timing'] = self.profiler.get_statistics()
+        
+        if self.recorder:
+            recording = self.recorder.stop()
+            print(f"Video saved as '{recording['path']}' ({recording['frames_written']} frames, "
+                  f"{recording['frames_dropped']} dropped)")
+            if statistics:
+                statistics['recording'] = recording
+        if self.session_log is not None:
+            log_path = self.session_log.save(self.record_stem + ".npz")
+            print(f"Session log saved as '{log_path}'")
+            if statistics:
+                statistics['session_log'] = log_path
+        
+        close_run(self.metrics_store, self.metrics_run, statistics)
+        
         self.show_end_screen(statistics)
         
         self.env.close()
@@ -667,6 +852,11 @@ def main():
         else:
             print("Please enter 1 for Freeze mode first or 2 for Countdown mode first.")
     
+    # Get what triggers advice requests
+    trigger_choice = input("Ask for advice on a fixed schedule or when the agent is uncertain? "
+                           "(1 for Schedule, 2 for Uncertainty, default 1): ").strip()
+    advice_trigger = "uncertainty" if trigger_choice == "2" else "schedule"
+    
     model_path = "ppo_pacman.zip"
     if not os.path.exists(model_path):
         print(f"Error: Model file '{model_path}' not found!")
@@ -677,7 +867,8 @@ def main():
         model_path=model_path, 
         time_limit_minutes=time_limit,
         countdown_seconds=countdown_time,
-        freeze_mode_first=freeze_mode_first
+        freeze_mode_first=freeze_mode_first,
+        advice_trigger=advice_trigger
     )
     statistics = game.run()
     
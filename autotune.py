@@ -0,0 +1,163 @@
+import argparse
+import itertools
+import json
+import os
+import platform
+import time
+
+import torch
+
+from eval_cache import _write_json_atomic
+
+TRAIN_PROFILE_PATH = "train_profile.json"
+
+# Knobs that train() takes from the profile when they are not passed explicitly
+PROFILE_KEYS = ('n_envs', 'vec_env', 'n_workers', 'torch_threads', 'n_steps')
+
+
+def available_cpus():
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def host_fingerprint():
+    # A profile only applies to the machine (and core budget) it was measured on
+    return {
+        'hostname': platform.node(),
+        'cpus': available_cpus(),
+        'torch': torch.__version__,
+    }
+
+
+def load_train_profile(path=TRAIN_PROFILE_PATH, obs_type="pixel"):
+    if not path or not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        profile = json.load(f)
+    if profile.get('host') != host_fingerprint():
+        print(f"Ignoring '{path}': it was tuned on a different host or core budget")
+        return {}
+    if profile.get('obs_type') != obs_type:
+        return {}
+    return {key: value for key, value in profile['config'].items() if key in PROFILE_KEYS}
+
+
+def candidate_configs(n_envs_options=None, thread_options=None, n_steps_options=(128, 256)):
+    cpus = available_cpus()
+    n_envs_options = n_envs_options or [n for n in (1, 2, 4, 8, 16) if n <= 2 * cpus]
+    thread_options = thread_options or sorted({t for t in (1, 2, 4, cpus) if t <= cpus})
+
+    configs = []
+    for n_envs, torch_threads, n_steps in itertools.product(n_envs_options, thread_options, n_steps_options):
+        if n_envs == 1:
+            configs.append({'n_envs': 1, 'vec_env': "dummy", 'n_workers': None,
+                            'torch_threads': torch_threads, 'n_steps': n_steps})
+            continue
+        # Several envs: all in-process, or spread over shared-memory workers
+        configs.append({'n_envs': n_envs, 'vec_env': "dummy", 'n_workers': None,
+                        'torch_threads': torch_threads, 'n_steps': n_steps})
+        for n_workers in sorted({max(1, n_envs // 4), max(1, n_envs // 2), n_envs}):
+            if n_workers <= cpus:
+                configs.append({'n_envs': n_envs, 'vec_env': "shm", 'n_workers': n_workers,
+                                'torch_threads': torch_threads, 'n_steps': n_steps})
+    return configs
+
+
+def probe(config, iterations=1, obs_type="pixel"):
+    # Times `iterations` full PPO iterations (rollout + update) after one warm-up iteration
+    from stable_baselines3 import PPO
+    from actor_learner import PhaseTimerCallback
+    from train_agent import PPO_HYPERPARAMS, make_training_env
+
+    torch.set_num_threads(config['torch_threads'])
+    env = make_training_env(config['n_envs'], config['vec_env'], config['n_workers'],
+                            {'obs_type': obs_type, 'unpack_bits': False})
+    try:
+        policy = "MlpPolicy" if obs_type == "ram" else "CnnPolicy"
+        model = PPO(policy, env, verbose=0, **dict(PPO_HYPERPARAMS, n_steps=config['n_steps']))
+        steps_per_iteration = config['n_envs'] * config['n_steps']
+        model.learn(total_timesteps=steps_per_iteration)
+
+        phase_timer = PhaseTimerCallback()
+        start_timesteps = model.num_timesteps
+        start = time.time()
+        model.learn(total_timesteps=iterations * steps_per_iteration, callback=phase_timer,
+                    reset_num_timesteps=False)
+        wall_time = time.time() - start
+        timesteps = model.num_timesteps - start_timesteps
+    finally:
+        env.close()
+
+    return {
+        'config': config,
+        'iterations': iterations,
+        'steps_per_sec': timesteps / wall_time,
+        'rollout_seconds': phase_timer.rollout_time,
+        'update_seconds': phase_timer.update_time,
+    }
+
+
+def describe(config):
+    workers = f"/{config['n_workers']}w" if config['vec_env'] == "shm" else ""
+    return (f"n_envs={config['n_envs']:<3} {config['vec_env']}{workers:<5} threads={config['torch_threads']:<3} "
+            f"n_steps={config['n_steps']}")
+
+
+def autotune(configs=None, search="halving", iterations=1, eta=3, obs_type="pixel", profile_path=TRAIN_PROFILE_PATH):
+    configs = configs or candidate_configs()
+    print(f"Autotuning {len(configs)} configurations on {available_cpus()} CPUs ({search} search)")
+
+    # Grid probes every config once; halving keeps the fastest 1/eta after each round
+    # and probes the survivors again with eta times the iterations
+    results = {}
+    survivors = list(configs)
+    round_iterations = iterations
+    while True:
+        for config in survivors:
+            result = probe(config, round_iterations, obs_type)
+            results[describe(config)] = result
+            print(f"  {describe(config)} | {result['steps_per_sec']:8.0f} steps/s "
+                  f"(rollout {result['rollout_seconds']:.1f}s, update {result['update_seconds']:.1f}s)")
+        survivors.sort(key=lambda config: results[describe(config)]['steps_per_sec'], reverse=True)
+        if search == "grid" or len(survivors) <= 1:
+            break
+        survivors = survivors[:max(1, len(survivors) // eta)]
+        round_iterations *= eta
+        print(f"Keeping {len(survivors)} configuration(s), probing with {round_iterations} iterations")
+
+    best = results[describe(survivors[0])]
+    profile = {
+        'host': host_fingerprint(),
+        'obs_type': obs_type,
+        'created_at': time.strftime("%Y-%m-%d %H:%M:%S"),
+        'search': search,
+        'config': best['config'],
+        'steps_per_sec': best['steps_per_sec'],
+        'results': sorted(results.values(), key=lambda result: result['steps_per_sec'], reverse=True),
+    }
+    if profile_path:
+        _write_json_atomic(profile_path, profile)
+        print(f"Best: {describe(best['config'])} at {best['steps_per_sec']:.0f} steps/s, "
+              f"saved to '{profile_path}'")
+    return profile
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Find the fastest training configuration for this machine")
+    parser.add_argument("--search", choices=["halving", "grid"], default="halving")
+    parser.add_argument("--iterations", type=int, default=1, help="PPO iterations per probe (first round for halving)")
+    parser.add_argument("--eta", type=int, default=3)
+    parser.add_argument("--n-envs", type=int, nargs="+", default=None)
+    parser.add_argument("--threads", type=int, nargs="+", default=None)
+    parser.add_argument("--n-steps", type=int, nargs="+", default=[128, 256])
+    parser.add_argument("--obs-type", choices=["pixel", "ram"], default="pixel")
+    parser.add_argument("--profile", default=TRAIN_PROFILE_PATH)
+    args = parser.parse_args()
+
+    configs = candidate_configs(args.n_envs, args.threads, args.n_steps)
+    autotune(configs, args.search, args.iterations, args.eta, args.obs_type, args.profile)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+import csv
+import multiprocessing
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from stable_baselines3.common.callbacks import BaseCallback
+
+
+def _init_eval_worker():
+    # Each evaluator gets a single torch thread so the pool doesn't starve the learner
+    import torch
+    torch.set_num_threads(1)
+
+
+def evaluate_checkpoint(checkpoint_path, timesteps, episodes, seed, env_kwargs=None):
+    # Imported here because train_agent imports this module
+    from stable_baselines3 import PPO
+    from train_agent import create_pacman_env, run_episode
+
+    start = time.time()
+    env = create_pacman_env(**(env_kwargs or {}))
+    model = PPO.load(checkpoint_path, device="cpu")
+
+    rewards = []
+    lengths = []
+    for episode in range(episodes):
+        episode_reward, episode_length = run_episode(model, env, seed=seed + episode)
+        rewards.append(episode_reward)
+        lengths.append(episode_length)
+    env.close()
+
+    return {
+        'checkpoint_path': checkpoint_path,
+        'timesteps': timesteps,
+        'mean_reward': float(np.mean(rewards)),
+        'std_reward': float(np.std(rewards)),
+        'mean_length': float(np.mean(lengths)),
+        'eval_seconds': time.time() - start,
+    }
+
+
+# Callback that evaluates checkpoints in a background process pool
+class CheckpointEvalCallback(BaseCallback):
+
+    CURVE_FIELDS = ['timesteps', 'mean_reward', 'std_reward', 'mean_length', 'eval_seconds', 'wall_time']
+
+    def __init__(self, eval_freq=250_000, eval_episodes=5, n_workers=2, checkpoint_dir="checkpoints",
+                 best_model_path="ppo_pacman_best.zip", curve_path=None, seed=0,
+                 keep_checkpoints=False, env_kwargs=None, verbose=0):
+        super(CheckpointEvalCallback, self).__init__(verbose)
+        self.eval_freq = eval_freq
+        self.eval_episodes = eval_episodes
+        self.n_workers = n_workers
+        self.checkpoint_dir = checkpoint_dir
+        self.best_model_path = best_model_path
+        self.curve_path = curve_path or os.path.join(checkpoint_dir, "learning_curve.csv")
+        self.seed = seed
+        self.keep_checkpoints = keep_checkpoints
+        self.env_kwargs = env_kwargs
+        self.executor = None
+        self.pending = []
+        self.learning_curve = []
+        self.best_mean_reward = -np.inf
+        self.last_checkpoint_timesteps = 0
+        self.start_time = None
+
+    def _init_callback(self):
+        os.makedirs(self.checkpoint_dir, exist_ok=True)
+        # Spawn so workers don't inherit the learner's torch threads and env handles
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.n_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_eval_worker,
+        )
+        self.start_time = time.time()
+        with open(self.curve_path, "w", newline="") as f:
+            csv.writer(f).writerow(self.CURVE_FIELDS)
+
+    def _on_step(self):
+        if self.num_timesteps - self.last_checkpoint_timesteps >= self.eval_freq:
+            self.last_checkpoint_timesteps = self.num_timesteps
+            self._submit_checkpoint()
+
+        self._collect_results(wait=False)
+        return True
+
+    def _on_training_end(self):
+        # Evaluate the final weights too, then drain the pool
+        if self.num_timesteps != self.last_checkpoint_timesteps:
+            self.last_checkpoint_timesteps = self.num_timesteps
+            self._submit_checkpoint()
+        self._collect_results(wait=True)
+        self.executor.shutdown()
+
+        if self.learning_curve:
+            print(f"Best checkpoint: mean reward {self.best_mean_reward:.2f} saved as '{self.best_model_path}'")
+
+    def _submit_checkpoint(self):
+        checkpoint_path = os.path.join(self.checkpoint_dir, f"ppo_pacman_{self.num_timesteps}.zip")
+        self.model.save(checkpoint_path)
+        future = self.executor.submit(
+            evaluate_checkpoint, checkpoint_path, self.num_timesteps, self.eval_episodes, self.seed,
+            self.env_kwargs
+        )
+        self.pending.append(future)
+
+    def _collect_results(self, wait):
+        still_pending = []
+        for future in self.pending:
+            if wait or future.done():
+                self._record_result(future.result())
+            else:
+                still_pending.append(future)
+        self.pending = still_pending
+
+    def _record_result(self, result):
+        result['wall_time'] = time.time() - self.start_time
+        self.learning_curve.append(result)
+
+        with open(self.curve_path, "a", newline="") as f:
+            csv.writer(f).writerow([result[field] for field in self.CURVE_FIELDS])
+
+        self.logger.record("eval/mean_reward", result['mean_reward'])
+        self.logger.record("eval/mean_ep_length", result['mean_length'])
+
+        is_best = result['mean_reward'] > self.best_mean_reward
+        if is_best:
+            self.best_mean_reward = result['mean_reward']
+            # Copy then rename so the best model on disk is never half written
+            tmp_path = self.best_model_path + ".tmp"
+            shutil.copyfile(result['checkpoint_path'], tmp_path)
+            os.replace(tmp_path, self.best_model_path)
+
+        if not self.keep_checkpoints:
+            os.remove(result['checkpoint_path'])
+
+        print(f"[Eval] Timesteps={result['timesteps']} | Mean Reward={result['mean_reward']:.2f} "
+              f"+/- {result['std_reward']:.2f} | Mean Length={result['mean_length']:.1f}"
+              f"{' | New best!' if is_best else ''}")
@@ -0,0 +1,238 @@
+import argparse
+import tempfile
+
+import gymnasium as gym
+import numpy as np
+from gymnasium import spaces
+from stable_baselines3.common.buffers import BaseBuffer, RolloutBuffer
+from stable_baselines3.common.type_aliases import RolloutBufferSamples
+from stable_baselines3.common.vec_env import DummyVecEnv
+
+from frame_stack import RingFrameStack, infer_n_stack
+
+MB = 1024 * 1024
+
+
+# PPO rollout buffer that keeps observations in their own dtype (uint8 for pixels) instead of
+# float32. With ring-stacked frames, consecutive stacks share k - 1 frames, so only the newest
+# frame of each step is stored and stacks are rebuilt when minibatches are sampled. When the
+# storage does not fit in memory_budget_mb, the frames are spilled to a memory-mapped temp file.
+class CompactRolloutBuffer(RolloutBuffer):
+
+    def __init__(self, buffer_size, observation_space, action_space, device="auto", gae_lambda=1,
+                 gamma=0.99, n_envs=1, memory_budget_mb=None, spill=True, spill_dir=None, dedup_frames=True):
+        # Set before RolloutBuffer.__init__, which calls reset()
+        self.n_stack = infer_n_stack(observation_space) if dedup_frames else 1
+        self.memory_budget_mb = memory_budget_mb
+        self.spill = spill
+        self.spill_dir = spill_dir
+        self.frames = None
+        self.spilled = False
+        super().__init__(buffer_size, observation_space, action_space, device=device, gae_lambda=gae_lambda,
+                         gamma=gamma, n_envs=n_envs)
+
+    def _allocate_frames(self):
+        # Step t's newest frame is at index t + n_stack - 1; the first stack fills 0..n_stack - 1
+        frame_shape = tuple(self.obs_shape)
+        if self.n_stack > 1:
+            frame_shape = (frame_shape[0] // self.n_stack,) + frame_shape[1:]
+        shape = (self.buffer_size + self.n_stack - 1, self.n_envs) + frame_shape
+        dtype = np.dtype(self.observation_space.dtype)
+        frame_bytes = int(np.prod(shape)) * dtype.itemsize
+        other_bytes = self._other_bytes()
+
+        if self.memory_budget_mb is not None and frame_bytes + other_bytes > self.memory_budget_mb * MB:
+            if not self.spill or other_bytes > self.memory_budget_mb * MB:
+                raise ValueError(
+                    f"Rollout storage needs {(frame_bytes + other_bytes) / MB:.1f} MB "
+                    f"({(frame_bytes + other_bytes) / (self.buffer_size * self.n_envs):.0f} bytes/transition), "
+                    f"more than the {self.memory_budget_mb} MB budget; reduce n_envs or n_steps"
+                    + ("" if self.spill else " or allow spilling"))
+            # The temp file is deleted once the memmap and buffer are gone
+            self.frames = np.memmap(tempfile.TemporaryFile(dir=self.spill_dir), dtype=dtype, mode="w+", shape=shape)
+            self.spilled = True
+        else:
+            self.frames = np.zeros(shape, dtype=dtype)
+        # Number of frames of each stack that belong to the current episode (older ones are zero)
+        self.stack_lengths = np.zeros((self.buffer_size, self.n_envs), dtype=np.int16)
+
+    def _other_bytes(self):
+        # Actions plus the seven per-step float32 arrays RolloutBuffer keeps
+        return self.buffer_size * self.n_envs * 4 * (self.action_dim + 7)
+
+    def reset(self):
+        # Same as RolloutBuffer.reset() except for the observations, which are not reallocated
+        if self.frames is None:
+            self._allocate_frames()
+        self.actions = np.zeros((self.buffer_size, self.n_envs, self.action_dim), dtype=np.float32)
+        self.rewards = np.zeros((self.buffer_size, self.n_envs), dtype=np.float32)
+        self.returns = np.zeros((self.buffer_size, self.n_envs), dtype=np.float32)
+        self.episode_starts = np.zeros((self.buffer_size, self.n_envs), dtype=np.float32)
+        self.values = np.zeros((self.buffer_size, self.n_envs), dtype=np.float32)
+        self.log_probs = np.zeros((self.buffer_size, self.n_envs), dtype=np.float32)
+        self.advantages = np.zeros((self.buffer_size, self.n_envs), dtype=np.float32)
+        self.generator_ready = False
+        BaseBuffer.reset(self)
+
+    def _store_observation(self, obs, episode_start):
+        obs = np.asarray(obs)
+        k = self.n_stack
+        if k == 1:
+            self.frames[self.pos] = obs
+            return
+        stacks = obs.reshape((self.n_envs, k, -1) + tuple(self.obs_shape[1:]))
+        if self.pos == 0:
+            self.frames[:k] = stacks.swapaxes(0, 1)
+            self.stack_lengths[0] = np.where(episode_start, 1, k)
+        else:
+            self.frames[self.pos + k - 1] = stacks[:, -1]
+            self.stack_lengths[self.pos] = np.where(episode_start, 1,
+                                                    np.minimum(self.stack_lengths[self.pos - 1] + 1, k))
+
+    def add(self, obs, action, reward, episode_start, value, log_prob):
+        if len(log_prob.shape) == 0:
+            log_prob = log_prob.reshape(-1, 1)
+        if isinstance(self.observation_space, spaces.Discrete):
+            obs = obs.reshape((self.n_envs, *self.obs_shape))
+
+        self._store_observation(obs, np.asarray(episode_start, dtype=bool))
+        self.actions[self.pos] = np.array(action).reshape((self.n_envs, self.action_dim))
+        self.rewards[self.pos] = np.array(reward)
+        self.episode_starts[self.pos] = np.array(episode_start)
+        self.values[self.pos] = value.clone().cpu().numpy().flatten()
+        self.log_probs[self.pos] = log_prob.clone().cpu().numpy()
+        self.pos += 1
+        if self.pos == self.buffer_size:
+            self.full = True
+
+    def get(self, batch_size=None):
+        assert self.full, ""
+        indices = np.random.permutation(self.buffer_size * self.n_envs)
+        # Observations stay in (step, env) layout; everything else is flattened like RolloutBuffer does
+        if not self.generator_ready:
+            for name in ("actions", "values", "log_probs", "advantages", "returns"):
+                self.__dict__[name] = self.swap_and_flatten(self.__dict__[name])
+            self.generator_ready = True
+
+        if batch_size is None:
+            batch_size = self.buffer_size * self.n_envs
+
+        start_idx = 0
+        while start_idx < self.buffer_size * self.n_envs:
+            yield self._get_samples(indices[start_idx:start_idx + batch_size])
+            start_idx += batch_size
+
+    def observations_at(self, flat_indices):
+        # Flat index env * buffer_size + step, the order swap_and_flatten uses
+        steps = flat_indices % self.buffer_size
+        envs = flat_indices // self.buffer_size
+        k = self.n_stack
+        if k == 1:
+            return np.asarray(self.frames[steps, envs])
+        offsets = np.arange(k)
+        stacks = np.asarray(self.frames[steps[:, None] + offsets, envs[:, None]])
+        # Frames from before the episode started are zero, as in the live stack
+        stacks[offsets[None, :] < (k - self.stack_lengths[steps, envs])[:, None]] = 0
+        return stacks.reshape((len(flat_indices),) + tuple(self.obs_shape))
+
+    def _get_samples(self, batch_inds, env=None):
+        data = (
+            self.observations_at(batch_inds),
+            self.actions[batch_inds],
+            self.values[batch_inds].flatten(),
+            self.log_probs[batch_inds].flatten(),
+            self.advantages[batch_inds].flatten(),
+            self.returns[batch_inds].flatten(),
+        )
+        return RolloutBufferSamples(*tuple(map(self.to_torch, data)))
+
+    def get_storage_report(self):
+        transitions = self.buffer_size * self.n_envs
+        frame_bytes = self.frames.nbytes
+        other_bytes = self._other_bytes() + self.stack_lengths.nbytes
+        float32_bytes = transitions * int(np.prod(self.obs_shape)) * 4 + self._other_bytes()
+        return {
+            'transitions': transitions,
+            'bytes_per_transition': (frame_bytes + other_bytes) / transitions,
+            'rollout_buffer_bytes_per_transition': float32_bytes / transitions,
+            'in_memory_mb': (other_bytes + (0 if self.spilled else frame_bytes)) / MB,
+            'spilled_mb': frame_bytes / MB if self.spilled else 0.0,
+            'frame_dedup': self.n_stack,
+        }
+
+
+def rollout_buffer_kwargs(memory_budget_mb=None, spill=True, spill_dir=None):
+    # PPO(..., **rollout_buffer_kwargs(...)) switches a model to compact rollout storage
+    return {
+        'rollout_buffer_class': CompactRolloutBuffer,
+        'rollout_buffer_kwargs': {'memory_budget_mb': memory_budget_mb, 'spill': spill, 'spill_dir': spill_dir},
+    }
+
+
+# Random frames and random episode ends, so every stored stack differs from its neighbours
+class _RandomFrames(gym.Env):
+
+    observation_space = spaces.Box(low=0, high=255, shape=(84, 84, 1), dtype=np.uint8)
+    action_space = spaces.Discrete(5)
+
+    def __init__(self, done_probability=0.05, seed=0):
+        self.done_probability = done_probability
+        self.rng = np.random.default_rng(seed)
+
+    def _frame(self):
+        return self.rng.integers(0, 255, size=self.observation_space.shape, dtype=np.uint8)
+
+    def reset(self, seed=None, options=None):
+        return self._frame(), {}
+
+    def step(self, action):
+        return self._frame(), 0.0, bool(self.rng.random() < self.done_probability), False, {}
+
+
+def check_reconstruction(n_envs=4, n_steps=64, n_stack=4, done_probability=0.05, seed=0, **kwargs):
+    # Collects a rollout the way PPO.collect_rollouts does (step the env, then add the previous
+    # observation) from a RingFrameStack over a VecEnv into RolloutBuffer and CompactRolloutBuffer,
+    # and compares the observations both hand out. Stacks that alias the ring would fail here.
+    import torch
+
+    rng = np.random.default_rng(seed)
+    venv = RingFrameStack(DummyVecEnv([lambda i=i: _RandomFrames(done_probability, seed + i) for i in range(n_envs)]),
+                          n_stack)
+    reference = RolloutBuffer(n_steps, venv.observation_space, venv.action_space, device="cpu", n_envs=n_envs)
+    compact = CompactRolloutBuffer(n_steps, venv.observation_space, venv.action_space, device="cpu", n_envs=n_envs,
+                                   **kwargs)
+
+    last_obs = venv.reset()
+    last_episode_starts = np.ones(n_envs, dtype=bool)
+    for _ in range(n_steps):
+        actions = rng.integers(5, size=n_envs)
+        new_obs, rewards, dones, _ = venv.step(actions)
+        args = (actions, rewards.astype(np.float32), last_episode_starts, torch.zeros(n_envs), torch.zeros(n_envs))
+        reference.add(last_obs, *args)
+        compact.add(last_obs, *args)
+        last_obs, last_episode_starts = new_obs, dones
+    venv.close()
+
+    np.random.seed(seed)
+    reference_obs = next(reference.get()).observations.numpy()
+    np.random.seed(seed)
+    compact_obs = next(compact.get()).observations.numpy()
+    return bool(np.array_equal(reference_obs, compact_obs.astype(np.float32))), compact.get_storage_report()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rollout storage size and reconstruction check for a configuration")
+    parser.add_argument("--n-envs", type=int, default=64)
+    parser.add_argument("--n-steps", type=int, default=256)
+    parser.add_argument("--frame-stack", type=int, default=4)
+    parser.add_argument("--budget-mb", type=float, default=None)
+    parser.add_argument("--spill-dir", default=None)
+    args = parser.parse_args()
+
+    matches, report = check_reconstruction(args.n_envs, args.n_steps, args.frame_stack,
+                                           memory_budget_mb=args.budget_mb, spill_dir=args.spill_dir)
+    print(f"{args.n_envs} envs x {args.n_steps} steps, {args.frame_stack} stacked frames:")
+    print(f"  RolloutBuffer:        {report['rollout_buffer_bytes_per_transition']:10.0f} bytes/transition")
+    print(f"  CompactRolloutBuffer: {report['bytes_per_transition']:10.0f} bytes/transition "
+          f"({report['in_memory_mb']:.1f} MB in memory, {report['spilled_mb']:.1f} MB spilled)")
+    print(f"  observations identical: {matches}")
@@ -0,0 +1,228 @@
+import argparse
+import csv
+import glob
+import json
+import multiprocessing
+import os
+import pickle
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from frame_stack import RingFrameStackEnv, infer_n_stack
+from session_log import ADVICE_MODES, load_advice_points, load_arrays
+from tournament import confidence_interval
+
+# Value of human advice, measured offline: every advice point of a recorded agent session is
+# replayed from its emulator snapshot twice, once stepping the advised action and once the
+# agent's own action, then the agent plays on for `horizon` steps in both arms. Sticky actions
+# make rollouts stochastic, so each point is repeated over several env seeds, paired between arms.
+ARMS = ("advice", "agent")
+
+# Per-worker state: one warm env and the policy
+_worker_env = None
+_worker_model = None
+
+
+def _init_worker(model_path):
+    global _worker_env, _worker_model
+    import torch
+    from stable_baselines3 import PPO
+
+    from env_factory import create_env
+
+    torch.set_num_threads(1)
+    _worker_model = PPO.load(model_path, device="cpu")
+    _worker_env = create_env("eval", frame_stack=infer_n_stack(_worker_model.observation_space))
+
+
+def rollout(first_action, ale_state, observation, horizon, seed):
+    env = _worker_env
+    env.reset(seed=seed)
+    ale = env.unwrapped.ale
+    # Reset seeds the sticky-action RNG; the snapshot restores everything else
+    ale.restoreState(pickle.loads(ale_state))
+    if isinstance(env, RingFrameStackEnv):
+        env.restore(observation)
+    lives = ale.lives()
+
+    total_reward, steps, action = 0.0, 0, first_action
+    for steps in range(1, horizon + 1):
+        obs, reward, terminated, truncated, _ = env.step(action)
+        total_reward += reward
+        if terminated or truncated:
+            break
+        action = int(_worker_model.predict(obs, deterministic=True)[0])
+    return {'return': total_reward, 'steps': steps, 'lives_lost': lives - ale.lives()}
+
+
+def play_advice_point(key, point, horizon, seeds):
+    results = []
+    for seed in seeds:
+        for arm in ARMS:
+            first_action = point['advised_action'] if arm == "advice" else point['agent_action']
+            result = rollout(first_action, point['ale_state'], point['observation'], horizon, seed)
+            result.update({'arm': arm, 'seed': seed})
+            results.append(result)
+    return key, results
+
+
+def collect_advice_points(pattern):
+    # Advice points from agent sessions, with the advice mode they were given in
+    points = {}
+    model_paths = set()
+    for path in sorted(glob.glob(pattern)):
+        if path.endswith((".mp4", ".frames")):
+            continue
+        metadata, arrays = load_arrays(path)
+        if metadata['mode'] != "agent":
+            continue
+        model_paths.add(metadata.get('model_path'))
+        for index, point in enumerate(load_advice_points(path)):
+            point['advice_mode'] = ADVICE_MODES[arrays['advice_modes'][point['step']]]
+            points[(path, index)] = point
+    return points, model_paths
+
+
+def value_of_advice(rollouts):
+    # Paired by seed: advice-arm return minus agent-arm return
+    by_seed = defaultdict(dict)
+    for result in rollouts:
+        by_seed[result['seed']][result['arm']] = result
+    diffs = [arms['advice']['return'] - arms['agent']['return'] for _, arms in sorted(by_seed.items())]
+    lives = [arms['agent']['lives_lost'] - arms['advice']['lives_lost'] for _, arms in sorted(by_seed.items())]
+    mean, half_width = confidence_interval(diffs)
+    return {
+        'value': mean,
+        'ci_low': mean - half_width,
+        'ci_high': mean + half_width,
+        'advice_return': float(np.mean([arms['advice']['return'] for arms in by_seed.values()])),
+        'agent_return': float(np.mean([arms['agent']['return'] for arms in by_seed.values()])),
+        'lives_saved': float(np.mean(lives)),
+        'rollouts': len(diffs),
+    }
+
+
+def evaluate_advice(pattern, model_path=None, horizon=100, repeats=8, seed=0, workers=None):
+    points, session_model_paths = collect_advice_points(pattern)
+    if not points:
+        print(f"No advice points found for '{pattern}' (agent sessions recorded with record_dir)")
+        return [], {}
+    if model_path is None:
+        session_model_paths.discard(None)
+        if len(session_model_paths) != 1:
+            raise ValueError(f"Sessions were played with models {sorted(session_model_paths)}; pass model_path")
+        model_path = session_model_paths.pop()
+
+    # Advice identical to the agent's choice has no counterfactual; it is counted, not replayed
+    to_replay = {key: point for key, point in points.items() if point['advised_action'] != point['agent_action']}
+    seeds = [seed + i for i in range(repeats)]
+    workers = workers or os.cpu_count()
+    print(f"Counterfactual advice: {len(to_replay)} advice points ({len(points) - len(to_replay)} matched the agent) "
+          f"x {repeats} seeds x {len(ARMS)} arms, {horizon}-step rollouts with '{model_path}' on {workers} workers")
+
+    point_rollouts = {}
+    start = time.time()
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx, initializer=_init_worker,
+                             initargs=(model_path,)) as pool:
+        futures = [pool.submit(play_advice_point, key, point, horizon, seeds) for key, point in to_replay.items()]
+        for completed, future in enumerate(as_completed(futures), start=1):
+            key, results = future.result()
+            point_rollouts[key] = results
+            if completed % 10 == 0 or completed == len(futures):
+                print(f"Advice points {completed}/{len(futures)} done ({time.time() - start:.0f}s)")
+
+    rows = []
+    for key, point in points.items():
+        row = {
+            'session': key[0],
+            'step': point['step'],
+            'advice_mode': point['advice_mode'],
+            'advised_action': point['advised_action'],
+            'agent_action': point['agent_action'],
+        }
+        if key in point_rollouts:
+            row.update(value_of_advice(point_rollouts[key]))
+        else:
+            row.update({'value': 0.0, 'ci_low': 0.0, 'ci_high': 0.0, 'rollouts': 0})
+        rows.append(row)
+    return rows, summarize_advice(rows, horizon, repeats)
+
+
+def summarize_advice(rows, horizon, repeats):
+    # Aggregate CIs treat advice points as the samples; per-point CIs come from the seeds
+    summary = {'horizon': horizon, 'repeats': repeats, 'groups': {}}
+    groups = {'all': rows}
+    for mode in ADVICE_MODES[1:]:
+        mode_rows = [row for row in rows if row['advice_mode'] == mode]
+        if mode_rows:
+            groups[mode] = mode_rows
+    for name, group_rows in groups.items():
+        replayed = [row for row in group_rows if row['rollouts']]
+        values = [row['value'] for row in group_rows]
+        mean, half_width = confidence_interval(values)
+        replayed_mean, replayed_half_width = confidence_interval([row['value'] for row in replayed]) \
+            if replayed else (0.0, 0.0)
+        summary['groups'][name] = {
+            'advice_points': len(group_rows),
+            'matched_agent': len(group_rows) - len(replayed),
+            'value': mean,
+            'ci_low': mean - half_width,
+            'ci_high': mean + half_width,
+            'value_when_different': replayed_mean,
+            'different_ci_low': replayed_mean - replayed_half_width,
+            'different_ci_high': replayed_mean + replayed_half_width,
+            'better': sum(row['ci_low'] > 0 for row in replayed),
+            'worse': sum(row['ci_high'] < 0 for row in replayed),
+        }
+    return summary
+
+
+def print_advice_report(rows, summary):
+    replayed = sorted((row for row in rows if row['rollouts']), key=lambda row: row['value'])
+    if replayed:
+        print(f"\n{'Step':>6} | {'Mode':>9} | {'Advice':>6} | {'Agent':>5} | {'Value':>7} | {'95% CI':>17} | Session")
+        for row in replayed:
+            print(f"{row['step']:>6} | {row['advice_mode']:>9} | {row['advised_action']:>6} | {row['agent_action']:>5} | "
+                  f"{row['value']:>+7.2f} | [{row['ci_low']:>+6.2f}, {row['ci_high']:>+6.2f}] | {row['session']}")
+
+    print(f"\nValue of advice over {summary['horizon']}-step rollouts ({summary['repeats']} seeds per point):")
+    print(f"{'Group':>9} | {'Points':>6} | {'Matched':>7} | {'Value':>7} | {'95% CI':>17} | "
+          f"{'When different':>15} | {'Better':>6} | {'Worse':>5}")
+    for name, group in summary['groups'].items():
+        print(f"{name:>9} | {group['advice_points']:>6} | {group['matched_agent']:>7} | {group['value']:>+7.2f} | "
+              f"[{group['ci_low']:>+6.2f}, {group['ci_high']:>+6.2f}] | {group['value_when_different']:>+15.2f} | "
+              f"{group['better']:>6} | {group['worse']:>5}")
+
+
+def write_advice_report(rows, summary, csv_path, json_path):
+    fields = ['session', 'step', 'advice_mode', 'advised_action', 'agent_action', 'value', 'ci_low', 'ci_high',
+              'advice_return', 'agent_return', 'lives_saved', 'rollouts']
+    with open(csv_path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=fields, extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(rows)
+    with open(json_path, "w") as f:
+        json.dump({'summary': summary, 'advice_points': rows}, f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay advice points with and without the advice to value human advice")
+    parser.add_argument("sessions", help="Session logs glob, e.g. 'recordings/agent_*.npz'")
+    parser.add_argument("--model", default=None, help="Defaults to the model the sessions were played with")
+    parser.add_argument("--horizon", type=int, default=100, help="Steps per rollout")
+    parser.add_argument("--repeats", type=int, default=8, help="Seeds per advice point and arm")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--csv", default="advice_value.csv")
+    parser.add_argument("--json", default="advice_value.json")
+    args = parser.parse_args()
+
+    rows, summary = evaluate_advice(args.sessions, args.model, args.horizon, args.repeats, args.seed, args.workers)
+    if rows:
+        print_advice_report(rows, summary)
+        write_advice_report(rows, summary, args.csv, args.json)
+        print(f"\nWrote {args.csv} and {args.json}")
@@ -0,0 +1,185 @@
+import argparse
+import time
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+from stable_baselines3 import PPO
+
+from autotune import available_cpus
+
+
+def _to_channels_last(module, args):
+    obs = args[0]
+    if obs.dim() == 4:
+        return (obs.contiguous(memory_format=torch.channels_last),) + args[1:]
+    return None
+
+
+# PPO whose gradient phase is tuned for CPU-only nodes: compiled feature extractor and
+# MLP heads, channels-last convolutions, explicit intra-/inter-op threads and fewer,
+# larger minibatches. Saved models are ordinary PPO zips.
+class CpuOptimizedPPO(PPO):
+
+    def __init__(self, *args, compile_policy=True, channels_last=True, intra_op_threads=None,
+                 inter_op_threads=1, fused_minibatches=4, **kwargs):
+        # Set before PPO.__init__, which calls _setup_model()
+        self.compile_policy = compile_policy
+        self.channels_last = channels_last
+        self.intra_op_threads = intra_op_threads
+        self.inter_op_threads = inter_op_threads
+        self.fused_minibatches = fused_minibatches
+        self.update_seconds = []
+        # Fewer, larger minibatches unless batch_size was given explicitly
+        self._explicit_batch_size = 'batch_size' in kwargs
+        super().__init__(*args, **kwargs)
+
+    def _setup_model(self):
+        if not self._explicit_batch_size and self.fused_minibatches:
+            rollout_size = self.n_steps * self.n_envs
+            self.batch_size = max(64, rollout_size // self.fused_minibatches)
+
+        super()._setup_model()
+        self._apply_cpu_settings()
+
+    def _apply_cpu_settings(self):
+        torch.set_num_threads(self.intra_op_threads or available_cpus())
+        if self.inter_op_threads:
+            try:
+                torch.set_num_interop_threads(self.inter_op_threads)
+            except RuntimeError:
+                # Only settable before the first parallel op in the process
+                pass
+
+        extractors = [self.policy.features_extractor]
+        if not self.policy.share_features_extractor:
+            extractors += [self.policy.pi_features_extractor, self.policy.vf_features_extractor]
+
+        if self.channels_last:
+            # Weights and conv inputs in NHWC, which oneDNN convolutions run faster on
+            self.policy.to(memory_format=torch.channels_last)
+            for extractor in extractors:
+                extractor.register_forward_pre_hook(_to_channels_last)
+
+        # In-place compile keeps the state dict keys, so saving and loading are unaffected
+        if self.compile_policy and hasattr(torch.nn.Module, "compile"):
+            for module in extractors + [self.policy.mlp_extractor]:
+                module.compile()
+        elif self.compile_policy:
+            print("torch.compile needs torch>=2.2, using eager execution")
+
+    def train(self):
+        start = time.time()
+        super().train()
+        self.update_seconds.append(time.time() - start)
+        self.logger.record("time/update_seconds", self.update_seconds[-1])
+
+    def get_update_statistics(self):
+        if not self.update_seconds:
+            return {}
+        # The first update includes compilation, so it is reported separately
+        steady = self.update_seconds[1:] or self.update_seconds
+        return {
+            'iterations': len(self.update_seconds),
+            'first_update_seconds': self.update_seconds[0],
+            'mean_update_seconds': float(np.mean(steady)),
+            'batch_size': self.batch_size,
+        }
+
+
+def compute_losses(model, rollout_data):
+    # The PPO loss of SB3's PPO.train() for one batch, without taking a gradient step
+    with torch.no_grad():
+        actions = rollout_data.actions.long().flatten()
+        values, log_prob, entropy = model.policy.evaluate_actions(rollout_data.observations, actions)
+        advantages = rollout_data.advantages
+        if model.normalize_advantage and len(advantages) > 1:
+            advantages = (advantages - advantages.mean()) / (advantages.std() + 1e-8)
+        clip_range = model.clip_range(model._current_progress_remaining)
+        ratio = torch.exp(log_prob - rollout_data.old_log_prob)
+        policy_loss = -torch.min(advantages * ratio, advantages * torch.clamp(ratio, 1 - clip_range, 1 + clip_range)).mean()
+        value_loss = F.mse_loss(rollout_data.returns, values.flatten())
+        entropy_loss = -torch.mean(entropy)
+        loss = policy_loss + model.ent_coef * entropy_loss + model.vf_coef * value_loss
+    return {
+        'policy_loss': float(policy_loss),
+        'value_loss': float(value_loss),
+        'entropy_loss': float(entropy_loss),
+        'loss': float(loss),
+    }
+
+
+def check_loss_parity(n_envs=1, seed=0, rtol=1e-4, **cpu_kwargs):
+    # Both learners score the same rollout with the same weights; only execution differs
+    from train_agent import PPO_HYPERPARAMS, make_training_env
+
+    env = make_training_env(n_envs, "dummy")
+    reference = PPO("CnnPolicy", env, seed=seed, verbose=0, **PPO_HYPERPARAMS)
+    reference.learn(total_timesteps=reference.n_steps * n_envs)
+    optimized = CpuOptimizedPPO("CnnPolicy", env, seed=seed, verbose=0, **PPO_HYPERPARAMS, **cpu_kwargs)
+    optimized.policy.load_state_dict(reference.policy.state_dict())
+
+    rollout_data = next(reference.rollout_buffer.get(batch_size=None))
+    reference_losses = compute_losses(reference, rollout_data)
+    optimized_losses = compute_losses(optimized, rollout_data)
+    env.close()
+
+    differences = {name: abs(optimized_losses[name] - reference_losses[name]) for name in reference_losses}
+    within_tolerance = all(differences[name] <= rtol * max(abs(reference_losses[name]), 1.0)
+                           for name in differences)
+    return {
+        'reference': reference_losses,
+        'optimized': optimized_losses,
+        'abs_difference': differences,
+        'within_tolerance': within_tolerance,
+    }
+
+
+def time_updates(model_class, iterations, n_envs, seed=0, **kwargs):
+    from actor_learner import PhaseTimerCallback
+    from train_agent import PPO_HYPERPARAMS, make_training_env
+
+    env = make_training_env(n_envs, "dummy")
+    model = model_class("CnnPolicy", env, seed=seed, verbose=0, **PPO_HYPERPARAMS, **kwargs)
+    # One warm-up iteration (and compilation) before timing
+    model.learn(total_timesteps=model.n_steps * n_envs)
+    phase_timer = PhaseTimerCallback()
+    model.learn(total_timesteps=iterations * model.n_steps * n_envs, callback=phase_timer,
+                reset_num_timesteps=False)
+    env.close()
+    return {
+        'batch_size': model.batch_size,
+        'update_seconds_per_iteration': phase_timer.update_time / iterations,
+        'rollout_seconds_per_iteration': phase_timer.rollout_time / iterations,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the CPU-optimized PPO learner with the default one")
+    parser.add_argument("--iterations", type=int, default=5)
+    parser.add_argument("--n-envs", type=int, default=8)
+    parser.add_argument("--threads", type=int, default=None, help="Intra-op threads (default: all available CPUs)")
+    parser.add_argument("--fused-minibatches", type=int, default=4)
+    parser.add_argument("--no-compile", action="store_true")
+    args = parser.parse_args()
+
+    cpu_kwargs = {'compile_policy': not args.no_compile, 'intra_op_threads': args.threads,
+                  'fused_minibatches': args.fused_minibatches}
+
+    parity = check_loss_parity(n_envs=args.n_envs, **cpu_kwargs)
+    print("Loss parity on the same rollout and weights:")
+    for name in parity['reference']:
+        print(f"  {name:<13} default={parity['reference'][name]:.6f} cpu={parity['optimized'][name]:.6f} "
+              f"|diff|={parity['abs_difference'][name]:.2e}")
+    print(f"  within tolerance: {parity['within_tolerance']}")
+
+    default = time_updates(PPO, args.iterations, args.n_envs)
+    optimized = time_updates(CpuOptimizedPPO, args.iterations, args.n_envs, **cpu_kwargs)
+    print(f"\nUpdate phase per iteration ({args.n_envs} envs, {args.iterations} iterations):")
+    print(f"  default: {default['update_seconds_per_iteration']:.3f}s (batch size {default['batch_size']})")
+    print(f"  cpu:     {optimized['update_seconds_per_iteration']:.3f}s (batch size {optimized['batch_size']})")
+    print(f"  speedup: {default['update_seconds_per_iteration'] / optimized['update_seconds_per_iteration']:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
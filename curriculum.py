@@ -0,0 +1,168 @@
+import argparse
+import os
+import time
+from collections import deque
+
+import gymnasium as gym
+import numpy as np
+
+# Where episodes may start: a normal reset, or a snapshot of one of three kinds of moments
+START_KINDS = ("reset", "death", "bonus", "late")
+
+DEFAULT_START_WEIGHTS = {'reset': 0.5, 'death': 0.2, 'bonus': 0.15, 'late': 0.15}
+
+
+# Start-state curriculum on the raw ALE env (inside the preprocessing, which still applies
+# noop starts and frame skipping after a restore). While playing it snapshots the emulator:
+# - death: the state from `death_lookback` captures before a life was lost
+# - bonus: right after a reward of at least `bonus_reward` (power pills, ghosts, fruit)
+# - late: every time the episode's raw score passes another multiple of `late_score_step`
+# Each kind keeps the newest `pool_size` snapshots, so the pools refresh as the agent improves.
+# Each reset starts from a normal reset or a random snapshot, by `start_weights`.
+class StartStateCurriculum(gym.Wrapper):
+
+    def __init__(self, env, start_weights=None, pool_size=64, capture_interval=32, death_lookback=4,
+                 bonus_reward=5, late_score_step=100, seed=None):
+        super().__init__(env)
+        self.ale = env.unwrapped.ale
+        self.start_weights = dict(start_weights or DEFAULT_START_WEIGHTS)
+        self.pools = {kind: deque(maxlen=pool_size) for kind in START_KINDS[1:]}
+        self.capture_interval = capture_interval
+        self.bonus_reward = bonus_reward
+        self.late_score_step = late_score_step
+        self.recent_states = deque(maxlen=death_lookback)
+        self.rng = np.random.default_rng(seed)
+        self.starts = {kind: 0 for kind in START_KINDS}
+        self.captured = {kind: 0 for kind in START_KINDS[1:]}
+        self._frames = 0
+        self._score = 0.0
+        self._next_late_score = late_score_step
+        self._lives = 0
+
+    def _capture(self, kind, state=None):
+        self.pools[kind].append(self.ale.cloneState() if state is None else state)
+        self.captured[kind] += 1
+
+    def _choose_start(self):
+        kinds = [kind for kind in START_KINDS if kind == "reset" or self.pools[kind]]
+        weights = np.array([self.start_weights.get(kind, 0.0) for kind in kinds])
+        if weights.sum() <= 0:
+            return "reset"
+        return kinds[self.rng.choice(len(kinds), p=weights / weights.sum())]
+
+    def reset(self, **kwargs):
+        obs, info = self.env.reset(**kwargs)
+        kind = self._choose_start()
+        self.starts[kind] += 1
+        if kind != "reset":
+            pool = self.pools[kind]
+            self.ale.restoreState(pool[self.rng.integers(len(pool))])
+            obs = self.env.unwrapped._get_obs()
+            info = dict(info, lives=self.ale.lives())
+        info['curriculum_start'] = kind
+
+        self.recent_states.clear()
+        self._frames = 0
+        # Snapshots carry their score implicitly; late captures count from where this episode starts
+        self._score = 0.0
+        self._next_late_score = self.late_score_step
+        self._lives = self.ale.lives()
+        return obs, info
+
+    def step(self, action):
+        obs, reward, terminated, truncated, info = self.env.step(action)
+        if terminated or truncated:
+            return obs, reward, terminated, truncated, info
+
+        self._frames += 1
+        if self._frames % self.capture_interval == 0:
+            self.recent_states.append(self.ale.cloneState())
+
+        lives = self.ale.lives()
+        if lives < self._lives and self.recent_states:
+            self._capture("death", self.recent_states[0])
+            self.recent_states.clear()
+        self._lives = lives
+
+        if reward >= self.bonus_reward:
+            self._capture("bonus")
+
+        self._score += reward
+        if self._score >= self._next_late_score:
+            self._capture("late")
+            self._next_late_score += self.late_score_step
+        return obs, reward, terminated, truncated, info
+
+    def get_curriculum_statistics(self):
+        total_starts = max(sum(self.starts.values()), 1)
+        return {
+            'starts': dict(self.starts),
+            'start_fractions': {kind: count / total_starts for kind, count in self.starts.items()},
+            'captured': dict(self.captured),
+            'pool_sizes': {kind: len(pool) for kind, pool in self.pools.items()},
+        }
+
+
+def summarize_curriculum(statistics):
+    # Sums the per-env statistics returned by env_method("get_curriculum_statistics")
+    starts = {kind: sum(s['starts'][kind] for s in statistics) for kind in START_KINDS}
+    captured = {kind: sum(s['captured'][kind] for s in statistics) for kind in START_KINDS[1:]}
+    return {'starts': starts, 'captured': captured}
+
+
+def time_to_target(learning_curve, target_score):
+    # First checkpoint whose mean evaluation reward reaches the target
+    for result in sorted(learning_curve, key=lambda result: result['timesteps']):
+        if result['mean_reward'] >= target_score:
+            return result['timesteps'], result['wall_time']
+    return None, None
+
+
+def compare_curriculum(target_score, timesteps=2_000_000, eval_freq=100_000, eval_episodes=5, eval_workers=2,
+                       output_dir="curriculum_compare", curriculum=None, **train_kwargs):
+    # Trains with standard resets and with the curriculum, both evaluated from normal resets
+    from checkpoint_eval import CheckpointEvalCallback
+    from train_agent import train
+
+    results = []
+    for name, run_curriculum in (("standard", None), ("curriculum", curriculum or {})):
+        run_dir = os.path.join(output_dir, name)
+        eval_callback = CheckpointEvalCallback(
+            eval_freq=eval_freq, eval_episodes=eval_episodes, n_workers=eval_workers,
+            checkpoint_dir=os.path.join(run_dir, "checkpoints"),
+            best_model_path=os.path.join(run_dir, "ppo_pacman_best.zip"),
+        )
+        start = time.time()
+        train(model_path=os.path.join(run_dir, "ppo_pacman.zip"), total_timesteps=timesteps,
+              extra_callbacks=[eval_callback], curriculum=run_curriculum, **train_kwargs)
+        target_timesteps, target_seconds = time_to_target(eval_callback.learning_curve, target_score)
+        results.append({
+            'run': name,
+            'timesteps_to_target': target_timesteps,
+            'seconds_to_target': target_seconds,
+            'best_mean_reward': eval_callback.best_mean_reward,
+            'train_seconds': time.time() - start,
+        })
+
+    print(f"\nTime to a mean evaluation reward of {target_score}:")
+    print(f"{'Run':>10} | {'Timesteps':>10} | {'Wall time':>9} | {'Best reward':>11}")
+    for result in results:
+        if result['timesteps_to_target'] is None:
+            timesteps_text, seconds_text = "not reached", "-"
+        else:
+            timesteps_text, seconds_text = str(result['timesteps_to_target']), f"{result['seconds_to_target']:.0f}s"
+        print(f"{result['run']:>10} | {timesteps_text:>10} | {seconds_text:>9} | {result['best_mean_reward']:>11.2f}")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare time to a target score with and without the start-state curriculum")
+    parser.add_argument("--target-score", type=float, required=True, help="Mean evaluation reward (clipped, as in evaluate_model)")
+    parser.add_argument("--timesteps", type=int, default=2_000_000)
+    parser.add_argument("--eval-freq", type=int, default=100_000)
+    parser.add_argument("--eval-episodes", type=int, default=5)
+    parser.add_argument("--n-envs", type=int, default=None)
+    parser.add_argument("--output-dir", default="curriculum_compare")
+    args = parser.parse_args()
+    compare_curriculum(args.target_score, args.timesteps, args.eval_freq, args.eval_episodes,
+                       output_dir=args.output_dir, n_envs=args.n_envs)
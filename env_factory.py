@@ -0,0 +1,192 @@
+import argparse
+
+import ale_py
+import gymnasium as gym
+import numpy as np
+from stable_baselines3.common.atari_wrappers import AtariWrapper
+
+from curriculum import StartStateCurriculum
+from frame_stack import RingFrameStackEnv
+from ram_pipeline import wrap_ram_env
+
+# Register ALE environments
+gym.register_envs(ale_py)
+
+# Environment settings shared by every profile (also part of the eval cache key).
+# The ALE itself steps single frames; the preprocessing backend repeats each action frame_skip times.
+ENV_CONFIG = {
+    'env_id': "ALE/Pacman-v5",
+    'frameskip': 1,
+    'frame_skip': 4,
+    'terminal_on_life_loss': False,
+    'clip_reward': True,
+}
+
+# Profiles only choose how an env is rendered and preprocessed by default;
+# what the agent sees and how the game advances per step is the same in all of them
+ENV_PROFILES = {
+    'train': {'render_mode': None, 'preprocessing': "sb3"},
+    'eval': {'render_mode': None, 'preprocessing': "sb3"},
+    'interactive': {'render_mode': "rgb_array", 'preprocessing': "sb3"},
+    'headless': {'render_mode': "rgb_array", 'preprocessing': "sb3"},
+}
+
+PREPROCESSING_BACKENDS = ("sb3", "gymnasium", "none")
+
+
+def _gymnasium_preprocessing(env):
+    # Gymnasium's equivalent of AtariWrapper: noop starts, max-pooled skip, 84x84 grayscale
+    from gymnasium.wrappers import AtariPreprocessing, TransformReward
+
+    env = AtariPreprocessing(
+        env,
+        noop_max=30,
+        frame_skip=ENV_CONFIG['frame_skip'],
+        screen_size=84,
+        terminal_on_life_loss=ENV_CONFIG['terminal_on_life_loss'],
+        grayscale_obs=True,
+        grayscale_newaxis=True,
+        scale_obs=False,
+    )
+    if ENV_CONFIG['clip_reward']:
+        env = TransformReward(env, lambda reward: float(np.sign(reward)))
+    return env
+
+
+# Innermost: sums the raw ALE rewards of the frames RawRewardInfo has not collected yet
+class _RawRewardTap(gym.Wrapper):
+
+    def __init__(self, env):
+        super().__init__(env)
+        self.pending = 0.0
+
+    def step(self, action):
+        obs, reward, terminated, truncated, info = self.env.step(action)
+        self.pending += reward
+        return obs, reward, terminated, truncated, info
+
+
+# Outside the preprocessing: adds the unclipped reward of each step (all its skipped frames) as
+# info['raw_reward'], so play sessions can report game points next to the clipped training reward
+class RawRewardInfo(gym.Wrapper):
+
+    def __init__(self, env, tap):
+        super().__init__(env)
+        self.tap = tap
+
+    def step(self, action):
+        self.tap.pending = 0.0
+        obs, reward, terminated, truncated, info = self.env.step(action)
+        info['raw_reward'] = self.tap.pending
+        return obs, reward, terminated, truncated, info
+
+
+def create_env(profile="train", render_mode=None, preprocessing=None, obs_type="pixel", unpack_bits=False,
+               frame_stack=1, curriculum=None, raw_reward_info=False):
+    # curriculum: StartStateCurriculum settings (a dict, {} for the defaults) for training envs
+    env = _create_env(profile, render_mode, preprocessing, obs_type, unpack_bits, curriculum, raw_reward_info)
+    if frame_stack > 1:
+        if obs_type == "ram" or preprocessing == "none":
+            raise ValueError("Frame stacking needs preprocessed pixel observations")
+        env = RingFrameStackEnv(env, frame_stack)
+    return env
+
+
+def _create_env(profile, render_mode, preprocessing, obs_type, unpack_bits, curriculum, raw_reward_info):
+    if profile not in ENV_PROFILES:
+        raise ValueError(f"Unknown env profile: {profile}")
+    settings = ENV_PROFILES[profile]
+    render_mode = render_mode or settings['render_mode']
+    preprocessing = preprocessing or settings['preprocessing']
+    if preprocessing not in PREPROCESSING_BACKENDS:
+        raise ValueError(f"Unknown preprocessing backend: {preprocessing}")
+
+    if obs_type == "ram":
+        # 128-byte console RAM instead of screen pixels: no rendering, grayscale or resize
+        env = gym.make(ENV_CONFIG['env_id'], frameskip=ENV_CONFIG['frameskip'], obs_type="ram",
+                       render_mode=render_mode)
+        if curriculum is not None:
+            env = StartStateCurriculum(env, **curriculum)
+        env = tap = _RawRewardTap(env) if raw_reward_info else env
+        env = wrap_ram_env(
+            env,
+            frame_skip=ENV_CONFIG['frame_skip'],
+            clip_reward=ENV_CONFIG['clip_reward'],
+            unpack_bits=unpack_bits
+        )
+        return RawRewardInfo(env, tap) if raw_reward_info else env
+
+    if preprocessing == "none":
+        # Raw frames and unclipped rewards for people, at the same 4-frame step as the agent
+        return gym.make(ENV_CONFIG['env_id'], frameskip=ENV_CONFIG['frame_skip'], render_mode=render_mode)
+
+    env = gym.make(ENV_CONFIG['env_id'], frameskip=ENV_CONFIG['frameskip'], render_mode=render_mode)
+    if curriculum is not None:
+        # Innermost, so noop starts and frame skipping also apply to restored snapshots
+        env = StartStateCurriculum(env, **curriculum)
+    env = tap = _RawRewardTap(env) if raw_reward_info else env
+    if preprocessing == "gymnasium":
+        env = _gymnasium_preprocessing(env)
+    else:
+        env = AtariWrapper(
+            env,
+            frame_skip=ENV_CONFIG['frame_skip'],
+            terminal_on_life_loss=ENV_CONFIG['terminal_on_life_loss'],  # Don't end episode on life loss
+            clip_reward=ENV_CONFIG['clip_reward']
+        )
+    return RawRewardInfo(env, tap) if raw_reward_info else env
+
+
+def check_parity(variants=None, steps=1000, seed=0):
+    # Steps every variant with the same seed and action sequence. Rewards and episode ends
+    # must match exactly; observations must match exactly within a backend, while across
+    # backends the grayscale conversion may differ slightly, so the mean difference is reported.
+    variants = variants or [(profile, "sb3") for profile in ENV_PROFILES] + [("train", "gymnasium")]
+    envs = [create_env(profile, preprocessing=backend) for profile, backend in variants]
+    reference_profile, reference_backend = variants[0]
+    rng = np.random.default_rng(seed)
+    actions = rng.integers(envs[0].action_space.n, size=steps)
+
+    reference_obs, _ = envs[0].reset(seed=seed)
+    others = [env.reset(seed=seed)[0] for env in envs[1:]]
+    results = [{'profile': profile, 'preprocessing': backend, 'mismatched_rewards': 0, 'mismatched_dones': 0,
+                'mismatched_obs': int(not np.array_equal(obs, reference_obs)),
+                'obs_mean_abs_diff': [float(np.mean(np.abs(obs.astype(np.int16) - reference_obs)))]}
+               for (profile, backend), obs in zip(variants[1:], others)]
+
+    for action in actions:
+        reference_obs, reference_reward, terminated, truncated, _ = envs[0].step(action)
+        reference_done = terminated or truncated
+        for env, result in zip(envs[1:], results):
+            obs, reward, terminated, truncated, _ = env.step(action)
+            done = terminated or truncated
+            result['mismatched_rewards'] += int(reward != reference_reward)
+            result['mismatched_dones'] += int(done != reference_done)
+            result['mismatched_obs'] += int(not np.array_equal(obs, reference_obs))
+            result['obs_mean_abs_diff'].append(float(np.mean(np.abs(obs.astype(np.int16) - reference_obs))))
+            if done:
+                env.reset()
+        if reference_done:
+            reference_obs, _ = envs[0].reset()
+
+    for env in envs:
+        env.close()
+
+    for result in results:
+        result['obs_mean_abs_diff'] = float(np.mean(result['obs_mean_abs_diff']))
+        same_backend = result['preprocessing'] == reference_backend
+        result['identical_dynamics'] = result['mismatched_rewards'] == 0 and result['mismatched_dones'] == 0
+        result['passed'] = result['identical_dynamics'] and (result['mismatched_obs'] == 0 or not same_backend)
+        print(f"{reference_profile}/{reference_backend} vs {result['profile']}/{result['preprocessing']}: "
+              f"reward mismatches={result['mismatched_rewards']}, done mismatches={result['mismatched_dones']}, "
+              f"obs mismatches={result['mismatched_obs']} (mean |diff| {result['obs_mean_abs_diff']:.3f}) "
+              f"-> {'OK' if result['passed'] else 'FAILED'}")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check that all env profiles and backends share the same dynamics")
+    parser.add_argument("--steps", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    check_parity(steps=args.steps, seed=args.seed)
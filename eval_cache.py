@@ -0,0 +1,109 @@
+import hashlib
+import json
+import os
+import tempfile
+
+import numpy as np
+
+
+CACHE_VERSION = 1
+
+
+def file_sha256(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def summarize_episodes(rewards, lengths):
+    return {
+        'episodes': len(rewards),
+        'mean_reward': float(np.mean(rewards)),
+        'std_reward': float(np.std(rewards)),
+        'mean_length': float(np.mean(lengths)),
+        'best_reward': float(max(rewards)),
+        'worst_reward': float(min(rewards)),
+    }
+
+
+def _write_json_atomic(path, data):
+    # Write to a temp file in the same directory so os.replace is atomic
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(data, f, indent=2)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class EvaluationCache:
+
+    def __init__(self, cache_dir=".eval_cache"):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+        self.hash_index_path = os.path.join(cache_dir, "model_hashes.json")
+
+    def model_hash(self, model_path):
+        # Re-hashing a large zip on every run is avoidable: remember the hash
+        # for a given (path, size, mtime) and only recompute when they change
+        stat = os.stat(model_path)
+        abs_path = os.path.abspath(model_path)
+        index = self._read_json(self.hash_index_path) or {}
+        entry = index.get(abs_path)
+        if entry and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+            return entry['sha256']
+
+        sha = file_sha256(model_path)
+        index[abs_path] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': sha}
+        _write_json_atomic(self.hash_index_path, index)
+        return sha
+
+    def make_key(self, model_path, env_config, seed, deterministic=True):
+        # The episode count is deliberately not part of the key: episode i always
+        # runs with seed + i, so a longer evaluation extends a shorter one
+        key_data = {
+            'version': CACHE_VERSION,
+            'model_sha256': self.model_hash(model_path),
+            'env_config': env_config,
+            'seed': seed,
+            'deterministic': deterministic,
+        }
+        payload = json.dumps(key_data, sort_keys=True)
+        return hashlib.sha256(payload.encode()).hexdigest()[:32], key_data
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def _read_json(self, path):
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            # A corrupt entry is treated as a miss and overwritten later
+            return None
+
+    def load(self, key):
+        entry = self._read_json(self._entry_path(key))
+        if entry is None:
+            return []
+        return entry.get('episodes', [])
+
+    def save(self, key, key_data, episodes):
+        rewards = [ep['reward'] for ep in episodes]
+        lengths = [ep['length'] for ep in episodes]
+        entry = {
+            'key': key_data,
+            'episodes': episodes,
+            'summary': summarize_episodes(rewards, lengths) if episodes else {},
+        }
+        _write_json_atomic(self._entry_path(key), entry)
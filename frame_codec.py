@@ -0,0 +1,316 @@
+import argparse
+import glob
+import json
+import os
+import struct
+import time
+import zlib
+
+import numpy as np
+
+# Episode frame streams as keyframes plus XOR deltas against the previous frame, each
+# zlib-compressed. Consecutive Pacman frames differ in a few sprites, so a delta is almost
+# all zero bytes and compresses to a few hundred bytes.
+#
+# File layout: MAGIC, u32 header length, JSON header (shape, dtype, keyframe interval),
+# then one record per frame (u8 type, u32 length, payload), then an index record with the
+# offset and type of every frame record, and a footer with the index offset. A file whose
+# writer never closed has no index; readers then rebuild it by scanning the records.
+FRAME_CODEC_EXTENSION = ".frames"
+MAGIC = b"PMFC"
+RECORD_HEADER = struct.Struct("!BI")
+FOOTER = struct.Struct("!Q4s")
+
+RECORD_KEYFRAME = 0
+RECORD_DELTA = 1
+RECORD_INDEX = 2
+
+
+class FrameWriter:
+
+    def __init__(self, path, keyframe_interval=64, level=1):
+        self.path = path
+        self.keyframe_interval = keyframe_interval
+        self.level = level
+        self.frames_written = 0
+        self.raw_bytes = 0
+        self._file = None
+        self._previous = None
+        self._offsets = []
+        self._types = []
+
+    def _open(self, frame):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file = open(self.path, "wb")
+        header = json.dumps({'shape': list(frame.shape), 'dtype': str(frame.dtype),
+                             'keyframe_interval': self.keyframe_interval}).encode()
+        self._file.write(MAGIC + struct.pack("!I", len(header)) + header)
+
+    def write(self, frame):
+        frame = np.ascontiguousarray(frame)
+        if self._file is None:
+            self._open(frame)
+        elif frame.shape != self._previous.shape:
+            raise ValueError(f"Frame shape {frame.shape} differs from the stream's {self._previous.shape}")
+
+        if self.frames_written % self.keyframe_interval == 0:
+            record_type, data = RECORD_KEYFRAME, frame
+        else:
+            record_type, data = RECORD_DELTA, np.bitwise_xor(frame, self._previous)
+        payload = zlib.compress(data.tobytes(), self.level)
+
+        self._offsets.append(self._file.tell())
+        self._types.append(record_type)
+        self._file.write(RECORD_HEADER.pack(record_type, len(payload)) + payload)
+        # Copy, since callers often reuse their frame buffer
+        self._previous = frame.copy()
+        self.frames_written += 1
+        self.raw_bytes += frame.nbytes
+
+    def close(self):
+        if self._file is None:
+            return
+        index = np.asarray(self._offsets, dtype=">u8").tobytes() + np.asarray(self._types, dtype=np.uint8).tobytes()
+        index_offset = self._file.tell()
+        self._file.write(RECORD_HEADER.pack(RECORD_INDEX, len(index)) + index)
+        self._file.write(FOOTER.pack(index_offset, MAGIC))
+        self._file.close()
+        self._file = None
+
+    def get_statistics(self):
+        size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        return {
+            'path': self.path,
+            'frames': self.frames_written,
+            'raw_bytes': self.raw_bytes,
+            'file_bytes': size,
+            'compression_ratio': self.raw_bytes / max(size, 1),
+        }
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _read_header(f):
+    if f.read(4) != MAGIC:
+        raise ValueError(f"'{f.name}' is not a frame stream")
+    (header_length,) = struct.unpack("!I", f.read(4))
+    header = json.loads(f.read(header_length))
+    return tuple(header['shape']), np.dtype(header['dtype']), header
+
+
+def _read_record(f):
+    # (type, payload), or None at the end of a complete or truncated stream
+    record_header = f.read(RECORD_HEADER.size)
+    if len(record_header) < RECORD_HEADER.size:
+        return None
+    record_type, length = RECORD_HEADER.unpack(record_header)
+    payload = f.read(length)
+    if len(payload) < length:
+        return None
+    return record_type, payload
+
+
+def iter_frames(path):
+    # Streaming decode: one record and one previous frame in memory at a time
+    with open(path, "rb") as f:
+        shape, dtype, _ = _read_header(f)
+        previous = None
+        while True:
+            record = _read_record(f)
+            if record is None or record[0] == RECORD_INDEX:
+                return
+            record_type, payload = record
+            frame = np.frombuffer(zlib.decompress(payload), dtype=dtype).reshape(shape)
+            if record_type == RECORD_DELTA:
+                frame = np.bitwise_xor(frame, previous)
+            previous = frame
+            yield frame
+
+
+# Random access by step index: decodes from the nearest keyframe at or before the step,
+# or from the last decoded frame when that is closer, so sequential reads cost one delta each
+class FrameReader:
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        self.shape, self.dtype, self.header = _read_header(self._file)
+        self.offsets, self.types = self._load_index()
+        self.keyframes = np.flatnonzero(self.types == RECORD_KEYFRAME)
+        self._cached_step = None
+        self._cached_frame = None
+
+    def _load_index(self):
+        f = self._file
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        if size >= FOOTER.size:
+            f.seek(size - FOOTER.size)
+            index_offset, magic = FOOTER.unpack(f.read(FOOTER.size))
+            if magic == MAGIC and index_offset < size:
+                f.seek(index_offset)
+                record = _read_record(f)
+                if record is not None and record[0] == RECORD_INDEX:
+                    n_frames = len(record[1]) // 9
+                    offsets = np.frombuffer(record[1][:8 * n_frames], dtype=">u8").astype(np.int64)
+                    types = np.frombuffer(record[1][8 * n_frames:], dtype=np.uint8)
+                    return offsets, types
+        # No index (the writer did not close): scan the records
+        f.seek(0)
+        _read_header(f)
+        offsets, types = [], []
+        while True:
+            offset = f.tell()
+            record = _read_record(f)
+            if record is None or record[0] == RECORD_INDEX:
+                break
+            offsets.append(offset)
+            types.append(record[0])
+        return np.asarray(offsets, dtype=np.int64), np.asarray(types, dtype=np.uint8)
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def _decode(self, step, previous):
+        self._file.seek(self.offsets[step])
+        record_type, payload = _read_record(self._file)
+        frame = np.frombuffer(zlib.decompress(payload), dtype=self.dtype).reshape(self.shape)
+        if record_type == RECORD_DELTA:
+            frame = np.bitwise_xor(frame, previous)
+        return frame
+
+    def __getitem__(self, step):
+        if step < 0:
+            step += len(self)
+        if not 0 <= step < len(self):
+            raise IndexError(f"Step {step} out of range for {len(self)} frames")
+        keyframe = self.keyframes[np.searchsorted(self.keyframes, step, side="right") - 1]
+        if self._cached_step is not None and keyframe <= self._cached_step <= step:
+            start, frame = self._cached_step + 1, self._cached_frame
+        else:
+            start, frame = keyframe, None
+        for i in range(start, step + 1):
+            frame = self._decode(i, frame)
+        self._cached_step, self._cached_frame = step, frame
+        return frame
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def write_frames(path, frames, keyframe_interval=64, level=1):
+    with FrameWriter(path, keyframe_interval, level) as writer:
+        for frame in frames:
+            writer.write(frame)
+    return writer.get_statistics()
+
+
+def _session_frames(session_path, max_steps=None):
+    # Replays a recorded session and returns its raw RGB frames and its preprocessed observations
+    from env_factory import create_env
+    from session_log import SessionLog
+
+    log = SessionLog.load(session_path)
+    # Human sessions were played on raw frames; preprocessed observations come from a second env
+    raw_env = create_env("headless", preprocessing="none" if log.metadata['mode'] == "human" else None)
+    obs_env = create_env("eval")
+    raw_env.reset(seed=log.metadata['seed'])
+    obs, _ = obs_env.reset(seed=log.metadata['seed'])
+    raw_frames, observations = [], [obs]
+    for action in log.actions[:max_steps]:
+        _, _, terminated, truncated, _ = raw_env.step(action)
+        raw_frames.append(raw_env.render())
+        if terminated or truncated:
+            raw_env.reset()
+        obs, _, terminated, truncated, _ = obs_env.step(action)
+        observations.append(obs)
+        if terminated or truncated:
+            obs, _ = obs_env.reset()
+    raw_env.close()
+    obs_env.close()
+    return {'rgb_210x160': raw_frames, 'obs_84x84': observations}
+
+
+def benchmark_stream(frames, path, keyframe_interval=64, level=1, random_reads=200, seed=0):
+    raw_bytes = sum(frame.nbytes for frame in frames)
+
+    start = time.perf_counter()
+    statistics = write_frames(path, frames, keyframe_interval, level)
+    encode_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    decoded = sum(1 for _ in iter_frames(path))
+    stream_seconds = time.perf_counter() - start
+
+    steps = np.random.default_rng(seed).integers(len(frames), size=random_reads)
+    with FrameReader(path) as reader:
+        start = time.perf_counter()
+        for step in steps:
+            reader[int(step)]
+        random_seconds = time.perf_counter() - start
+        lossless = all(np.array_equal(reader[i], frames[i]) for i in range(0, len(frames), 97))
+
+    # The npz alternative the session logs use, for reference
+    npz_path = path + ".npz"
+    np.savez_compressed(npz_path, frames=np.stack(frames))
+    npz_bytes = os.path.getsize(npz_path)
+    os.remove(npz_path)
+
+    return {
+        'frames': len(frames),
+        'raw_mb': raw_bytes / 1e6,
+        'file_mb': statistics['file_bytes'] / 1e6,
+        'compression_ratio': statistics['compression_ratio'],
+        'npz_compression_ratio': raw_bytes / npz_bytes,
+        'encode_fps': len(frames) / encode_seconds,
+        'stream_decode_fps': decoded / stream_seconds,
+        'random_access_fps': random_reads / random_seconds,
+        'lossless': lossless,
+    }
+
+
+def benchmark(pattern, keyframe_interval=64, level=1, max_steps=None, output_dir="recordings/codec_benchmark"):
+    session_paths = sorted(glob.glob(pattern))
+    if not session_paths:
+        print(f"No sessions found for '{pattern}'")
+        return []
+
+    results = []
+    for session_path in session_paths:
+        streams = _session_frames(session_path, max_steps)
+        stem = os.path.splitext(os.path.basename(session_path))[0]
+        for name, frames in streams.items():
+            if not frames:
+                continue
+            path = os.path.join(output_dir, f"{stem}_{name}{FRAME_CODEC_EXTENSION}")
+            result = benchmark_stream(frames, path, keyframe_interval, level)
+            result.update({'session': session_path, 'stream': name})
+            results.append(result)
+            print(f"{stem} {name}: {result['frames']} frames, {result['raw_mb']:.1f} MB -> {result['file_mb']:.2f} MB "
+                  f"(ratio {result['compression_ratio']:.0f}x, npz {result['npz_compression_ratio']:.0f}x) | "
+                  f"encode {result['encode_fps']:.0f} fps, stream decode {result['stream_decode_fps']:.0f} fps, "
+                  f"random access {result['random_access_fps']:.0f} fps | lossless={result['lossless']}")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the keyframe/XOR-delta frame codec on recorded sessions")
+    parser.add_argument("sessions", help="Session log or glob, e.g. 'recordings/*.npz'")
+    parser.add_argument("--keyframe-interval", type=int, default=64)
+    parser.add_argument("--level", type=int, default=1, help="zlib level")
+    parser.add_argument("--max-steps", type=int, default=None)
+    parser.add_argument("--output-dir", default="recordings/codec_benchmark")
+    args = parser.parse_args()
+    benchmark(args.sessions, args.keyframe_interval, args.level, args.max_steps, args.output_dir)
@@ -0,0 +1,189 @@
+import argparse
+import time
+import tracemalloc
+import zipfile
+
+import gymnasium as gym
+import numpy as np
+from gymnasium import spaces
+from stable_baselines3.common.save_util import json_to_data
+from stable_baselines3.common.vec_env import DummyVecEnv, VecEnvWrapper, VecFrameStack
+
+
+# Last k frames of one or more envs in a mirrored ring: every frame is written to slot j and
+# j + k of a 2k-slot buffer, so the current window is always the contiguous slice
+# [start, start + k) and a stacked observation is one contiguous copy instead of a shift.
+# Frames come in as (H, W, C) and are stacked channels-first, (k * C, H, W), which CnnPolicy
+# takes without VecTransposeImage. stacked() is a view that the next advance() overwrites, so
+# the wrappers hand out copies: SB3 adds the previous observation to the rollout buffer only
+# after stepping, when a view would already show the next frame.
+class FrameRing:
+
+    def __init__(self, n_envs, n_stack, frame_shape, dtype):
+        height, width, channels = frame_shape
+        self.n_stack = n_stack
+        self.channels = channels
+        self.buffer = np.zeros((n_envs, 2 * n_stack * channels, height, width), dtype=dtype)
+        self.start = 0
+
+    def _newest_slots(self):
+        slot = (self.start + self.n_stack - 1) % self.n_stack
+        c = self.channels
+        return slice(slot * c, (slot + 1) * c), slice((slot + self.n_stack) * c, (slot + self.n_stack + 1) * c)
+
+    def advance(self, frames):
+        # frames: (n_envs, H, W, C); two frame writes per env, independent of k
+        self.start = (self.start + 1) % self.n_stack
+        chw = np.moveaxis(frames, -1, 1)
+        for slots in self._newest_slots():
+            self.buffer[:, slots] = chw
+
+    def reset(self, env_index, frame):
+        # Zero history and the new frame last, like VecFrameStack
+        self.buffer[env_index] = 0
+        chw = np.moveaxis(frame, -1, 0)
+        for slots in self._newest_slots():
+            self.buffer[env_index, slots] = chw
+
+    def stacked(self):
+        c = self.channels
+        return self.buffer[:, self.start * c:(self.start + self.n_stack) * c]
+
+
+def stacked_space(frame_space, n_stack):
+    height, width, channels = frame_space.shape
+    return spaces.Box(low=0, high=255, shape=(n_stack * channels, height, width), dtype=frame_space.dtype)
+
+
+def infer_n_stack(observation_space, channels=1):
+    # Models trained on ring-stacked frames see (k * C, 84, 84); single frames are (84, 84, C)
+    shape = observation_space.shape
+    if len(shape) == 3 and shape[0] < shape[-1]:
+        return shape[0] // channels
+    return 1
+
+
+def saved_n_stack(model_path, channels=1):
+    # Same as infer_n_stack, but reads only the saved spaces instead of loading the policy
+    with zipfile.ZipFile(model_path) as archive:
+        data = json_to_data(archive.read("data").decode())
+    return infer_n_stack(data['observation_space'], channels)
+
+
+class RingFrameStack(VecEnvWrapper):
+
+    def __init__(self, venv, n_stack):
+        frame_space = venv.observation_space
+        self.ring = FrameRing(venv.num_envs, n_stack, frame_space.shape, frame_space.dtype)
+        super().__init__(venv, observation_space=stacked_space(frame_space, n_stack))
+
+    def reset(self):
+        obs = self.venv.reset()
+        self.ring.start = 0
+        for env_index in range(self.num_envs):
+            self.ring.reset(env_index, obs[env_index])
+        return self.ring.stacked().copy()
+
+    def step_wait(self):
+        obs, rewards, dones, infos = self.venv.step_wait()
+        self.ring.advance(obs)
+        for env_index in np.flatnonzero(dones):
+            # obs already holds the reset frame; the terminal stack is the history plus the terminal frame
+            terminal_frame = infos[env_index].get('terminal_observation')
+            if terminal_frame is not None:
+                history = self.ring.stacked()[env_index, :-self.ring.channels]
+                infos[env_index]['terminal_observation'] = np.concatenate(
+                    [history, np.moveaxis(terminal_frame, -1, 0)], axis=0)
+            self.ring.reset(env_index, obs[env_index])
+        return self.ring.stacked().copy(), rewards, dones, infos
+
+
+# Single-env version for evaluation and the play modes
+class RingFrameStackEnv(gym.Wrapper):
+
+    def __init__(self, env, n_stack):
+        super().__init__(env)
+        self.ring = FrameRing(1, n_stack, env.observation_space.shape, env.observation_space.dtype)
+        self.observation_space = stacked_space(env.observation_space, n_stack)
+
+    def reset(self, **kwargs):
+        obs, info = self.env.reset(**kwargs)
+        self.ring.start = 0
+        self.ring.reset(0, obs)
+        return self.ring.stacked()[0].copy(), info
+
+    def step(self, action):
+        obs, reward, terminated, truncated, info = self.env.step(action)
+        self.ring.advance(obs[None])
+        return self.ring.stacked()[0].copy(), reward, terminated, truncated, info
+
+    def restore(self, stacked_obs):
+        # Continue from a saved stacked observation, e.g. after restoring an emulator snapshot
+        self.ring.start = 0
+        n = len(stacked_obs)
+        self.ring.buffer[0, :n] = stacked_obs
+        self.ring.buffer[0, n:] = stacked_obs
+
+
+# Cheap stand-in for the Atari env so the benchmark measures stacking, not emulation
+class _FrameSource(gym.Env):
+
+    def __init__(self, episode_length=500):
+        self.observation_space = spaces.Box(low=0, high=255, shape=(84, 84, 1), dtype=np.uint8)
+        self.action_space = spaces.Discrete(5)
+        self.episode_length = episode_length
+        self.frame = np.random.default_rng(0).integers(0, 255, size=(84, 84, 1), dtype=np.uint8)
+        self.t = 0
+
+    def reset(self, seed=None, options=None):
+        self.t = 0
+        return self.frame, {}
+
+    def step(self, action):
+        self.t += 1
+        return self.frame, 0.0, self.t >= self.episode_length, False, {}
+
+
+def _measure(wrap, n_envs, steps):
+    venv = DummyVecEnv([_FrameSource for _ in range(n_envs)])
+    actions = np.zeros(n_envs, dtype=np.int64)
+
+    # Peak covers the wrapper's persistent state plus whatever it allocates per step
+    tracemalloc.start()
+    env = wrap(venv) if wrap else venv
+    env.reset()
+    start = time.perf_counter()
+    for _ in range(steps):
+        env.step(actions)
+    elapsed = time.perf_counter() - start
+    _, peak_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    env.close()
+    return elapsed / steps, peak_bytes
+
+
+def benchmark(n_envs=8, n_stack=4, steps=5000):
+    base_seconds, base_peak = _measure(None, n_envs, steps)
+    results = {}
+    for name, wrap in (("VecFrameStack", lambda venv: VecFrameStack(venv, n_stack)),
+                       ("RingFrameStack", lambda venv: RingFrameStack(venv, n_stack))):
+        step_seconds, peak_bytes = _measure(wrap, n_envs, steps)
+        results[name] = {
+            'overhead_us_per_step': (step_seconds - base_seconds) * 1e6,
+            'peak_bytes': peak_bytes - base_peak,
+        }
+
+    print(f"Frame stacking of {n_envs} envs x {n_stack} frames, {steps} steps (synthetic env):")
+    for name, result in results.items():
+        print(f"  {name:<15} overhead {result['overhead_us_per_step']:8.1f} us/step | "
+              f"peak memory {result['peak_bytes'] / 1e6:6.2f} MB")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark ring-buffer frame stacking against VecFrameStack")
+    parser.add_argument("--n-envs", type=int, default=8)
+    parser.add_argument("--n-stack", type=int, default=4)
+    parser.add_argument("--steps", type=int, default=5000)
+    args = parser.parse_args()
+    benchmark(args.n_envs, args.n_stack, args.steps)
@@ -2,15 +2,18 @@ import time
 import pygame
 import numpy as np
 from PIL import Image
-import gymnasium as gym
-import ale_py
-import threading
-
-gym.register_envs(ale_py)
+from env_factory import create_env
+from instrumentation import FrameProfiler
+from metrics_store import METRICS_DB_PATH, close_run, open_run
+from recorder import FrameRecorder
+from session_clock import DeadlineScheduler, SessionClock
+from session_log import SessionLog, SOURCE_HUMAN, session_path
 
 class HumanPlayMode:
     
-    def __init__(self, time_limit_minutes=10, window_size=None):
+    def __init__(self, time_limit_minutes=10, window_size=None, profile_frames=False, trace_path=None,
+                 record_dir=None, record_video=True, seed=None, metrics_path=METRICS_DB_PATH,
+                 record_format="mp4"):
         self.time_limit_minutes = time_limit_minutes
         if window_size is None:
             pygame.init()
@@ -18,24 +21,43 @@ class HumanPlayMode:
             self.window_size = (int(info.current_w * 0.6), int(info.current_h * 0.8))
         else:
             self.window_size = window_size
-        self.start_time = None
+        # Pause-aware monotonic session time; the time limit is a deadline on it
+        self.session_clock = SessionClock()
+        self.scheduler = DeadlineScheduler(self.session_clock)
         self.elapsed_time = 0
-        self.pause_start_time = None
-        self.total_pause_time = 0
-        self.game_timer = None
         self.time_expired = False
         self.paused = False
         self.total_reward = 0
         self.step_count = 0
         self.actions_taken = []
         
+        # Frame timing and input latency instrumentation
+        self.target_fps = 20
+        self.profiler = FrameProfiler(self.target_fps, enabled=profile_frames or trace_path is not None,
+                                      trace_path=trace_path)
+        
+        # Session recording: a replayable per-step log plus an optional video encoded in the background
+        self.seed = seed if seed is not None else int(np.random.SeedSequence().entropy % (2**31))
+        self.record_dir = record_dir
+        self.record_video = record_video
+        # "mp4" video, or "frames" for a lossless frame_codec stream with random access by step
+        self.record_format = record_format
+        self.session_log = SessionLog("human", self.seed, {'fps': self.target_fps, 'rewards': "raw"}) if record_dir else None
+        self.recorder = None
+        
+        # Session metrics go to the shared store through a background writer
+        self.metrics_path = metrics_path
+        self.metrics_store = None
+        self.metrics_run = None
+        self.episode_reward = 0
+        
         pygame.init()
         self.display = pygame.display.set_mode(self.window_size)
         pygame.display.set_caption("Pac-Man Human Play Mode")
         self.clock = pygame.time.Clock()
         
-        # Create environment
-        self.env = gym.make("ALE/Pacman-v5", render_mode="rgb_array")
+        # Create environment: raw frames and scores, at the same step length as the agent
+        self.env = create_env("interactive", preprocessing="none")
         
         # Action mapping for ALE Pacman's 5-action space
         self.action_map = {
@@ -60,24 +82,23 @@ class HumanPlayMode:
         self.BLUE = (0, 0, 255)
     
     def start_timer(self):
-        def timer_function():
-            elapsed = 0
-            while elapsed < self.time_limit_minutes * 60 and not self.time_expired:
-                time.sleep(0.05)  # Check every 50ms
-                if not self.paused:  # Only count time when not paused
-                    elapsed += 0.1
-            if elapsed >= self.time_limit_minutes * 60:
-                self.time_expired = True
-                print(f"\nTime limit reached! ({self.time_limit_minutes} minutes)")
-        
-        self.game_timer = threading.Thread(target=timer_function, daemon=True)
-        self.game_timer.start()
-        self.start_time = time.time()
+        self.session_clock.start()
+        self.scheduler.schedule(self.time_limit_minutes * 60, self.on_time_expired, "time_limit")
+    
+    def on_time_expired(self):
+        self.time_expired = True
+        print(f"\nTime limit reached! ({self.time_limit_minutes} minutes)")
     
     def stop_timer(self):
         self.time_expired = True
-        if self.game_timer and self.game_timer.is_alive():
-            pass
+        self.scheduler.cancel_all()
+    
+    def set_paused(self, paused):
+        self.paused = paused
+        if paused:
+            self.session_clock.pause()
+        else:
+            self.session_clock.resume()
         
     def draw_text(self, text, font, color, position, center=False):
         text_surface = font.render(text, True, color)
@@ -275,8 +296,15 @@ class HumanPlayMode:
             return None
         
         # Reset environment
-        obs, info = self.env.reset()
+        obs, info = self.env.reset(seed=self.seed)
         print(f"Game started! Initial info: {info}")
+        self.metrics_store, self.metrics_run = open_run(self.metrics_path, "human_play", {
+            'time_limit_minutes': self.time_limit_minutes, 'seed': self.seed, 'fps': self.target_fps})
+        
+        if self.record_dir:
+            self.record_stem = session_path(self.record_dir, "human", extension="")
+            if self.record_video:
+                self.recorder = FrameRecorder(f"{self.record_stem}.{self.record_format}", self.target_fps).start()
         
         self.show_countdown()
         
@@ -285,98 +313,109 @@ class HumanPlayMode:
         # Main game loop
         running = True
         while running:
-            # Update elapsed time for display (excluding pause time)
-            if self.start_time:
-                current_time = time.time()
-                if self.paused and self.pause_start_time:
-                    self.elapsed_time = self.pause_start_time - self.start_time - self.total_pause_time
-                else:
-                    # Normal calculation excluding total pause time
-                    self.elapsed_time = current_time - self.start_time - self.total_pause_time
+            frame_start = time.monotonic()
+            
+            # Fire due deadlines, then read session time for display (excludes pauses)
+            self.scheduler.poll()
+            self.elapsed_time = self.session_clock.elapsed()
             
             # Check if time expired
             if self.time_expired:
                 break
             
+            self.profiler.begin_frame()
+            
             # Handle events
             action = 0  # Default to NOOP
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT:
-                    running = False
-                    break
-                elif event.type == pygame.KEYDOWN:
-                    if event.key == pygame.K_p:
-                        # Toggle pause state
-                        self.paused = not self.paused
-                        if self.paused:
-                            # Start tracking pause time
-                            self.pause_start_time = time.time()
-                            self.draw_pause_screen()
-                        else:
-                            # End pause and add to total pause time
-                            if self.pause_start_time:
-                                self.total_pause_time += time.time() - self.pause_start_time
-                                self.pause_start_time = None
-                    elif event.key == pygame.K_ESCAPE and self.paused:
+            with self.profiler.section("events"):
+                for event in pygame.event.get():
+                    if event.type == pygame.QUIT:
                         running = False
                         break
-                    elif not self.paused and event.key in self.action_map:
-                        action = self.action_map[event.key]
+                    elif event.type == pygame.KEYDOWN:
+                        if event.key == pygame.K_p:
+                            # Toggle pause state; the session clock stops while paused
+                            self.set_paused(not self.paused)
+                            if self.paused:
+                                self.draw_pause_screen()
+                        elif event.key == pygame.K_ESCAPE and self.paused:
+                            running = False
+                            break
+                        elif not self.paused and event.key in self.action_map:
+                            action = self.action_map[event.key]
+                            self.profiler.key_down(event.key)
             
             if not running:
                 break
             
             # If paused, skip game logic and continue loop
             if self.paused:
+                self.profiler.abandon_frame()
                 self.clock.tick(60)
                 continue
             
             # Take step in environment
-            obs, reward, terminated, truncated, info = self.env.step(action)
+            with self.profiler.section("env_step"):
+                obs, reward, terminated, truncated, info = self.env.step(action)
             
             # Update statistics
             self.total_reward += reward
+            self.episode_reward += reward
             self.step_count += 1
             self.actions_taken.append(action)
+            if self.session_log is not None:
+                self.session_log.record_step(self.elapsed_time, action, reward, terminated or truncated,
+                                             source=SOURCE_HUMAN)
             
 
             
             # Render game
-            image = self.env.render()
-            image = Image.fromarray(image, 'RGB')
-            
-            # Resize image to fit window
-            image = image.resize(self.window_size, Image.Resampling.LANCZOS)
+            with self.profiler.section("render"):
+                image = self.env.render()
+                if self.recorder:
+                    self.recorder.submit(image)
+                image = Image.fromarray(image, 'RGB')
+                
+                # Resize image to fit window
+                image = image.resize(self.window_size, Image.Resampling.LANCZOS)
+                
+                # Convert to pygame surface
+                mode, size, data = image.mode, image.size, image.tobytes()
+                pygame_image = pygame.image.fromstring(data, size, mode)
+                
+                # Display game
+                self.display.blit(pygame_image, (0, 0))
+                
+                # Draw overlay information
+                self.draw_game_info()
             
-            # Convert to pygame surface
-            mode, size, data = image.mode, image.size, image.tobytes()
-            pygame_image = pygame.image.fromstring(data, size, mode)
-            
-            # Display game
-            self.display.blit(pygame_image, (0, 0))
-            
-            # Draw overlay information
-            self.draw_game_info()
-            
-            pygame.display.update()
+            with self.profiler.section("flip"):
+                pygame.display.update()
+            self.profiler.end_frame()
             
             # Print progress every 100 steps
             if self.step_count % 100 == 0:
                 time_remaining = max(0, self.time_limit_minutes * 60 - self.elapsed_time)
                 print(f"Step {self.step_count}: Score={self.total_reward}, "
                       f"Time remaining: {int(time_remaining//60):02d}:{int(time_remaining%60):02d}")
+                if self.metrics_run:
+                    self.metrics_run.log('score', self.total_reward, self.step_count)
             
             # Check if episode ended
             if terminated or truncated:
                 print(f"Episode ended after {self.step_count} steps - continuing with unlimited lives!")
+                if self.metrics_run:
+                    self.metrics_run.log('episode_reward', self.episode_reward, self.step_count)
+                self.episode_reward = 0
                 # Reset environment to continue playing with unlimited lives
                 obs, info = self.env.reset()
 
                 # Continue the game loop
                 continue
             
-            target_fps = 20  # Adjust this value to control game speed
-            self.clock.tick(target_fps)
+            # Sleep out the frame (adjust target_fps in __init__ to control game speed),
+            # waking early if the time limit falls inside it
+            self.scheduler.sleep(frame_start + 1.0 / self.target_fps - time.monotonic())
         
         # Stop timer
         self.stop_timer()
@@ -384,6 +423,26 @@ class HumanPlayMode:
         # Get final statistics
         statistics = self.get_game_statistics()
         
+        if self.profiler.enabled:
+            self.profiler.print_summary()
+            self.profiler.write_trace()
+            if statistics:
+                statistics['frame_timing'] = self.profiler.get_statistics()
+        
+        if self.recorder:
+            recording = self.recorder.stop()
+            print(f"Video saved as '{recording['path']}' ({recording['frames_written']} frames, "
+                  f"{recording['frames_dropped']} dropped)")
+            if statistics:
+                statistics['recording'] = recording
+        if self.session_log is not None:
+            log_path = self.session_log.save(self.record_stem + ".npz")
+            print(f"Session log saved as '{log_path}'")
+            if statistics:
+                statistics['session_log'] = log_path
+        
+        close_run(self.metrics_store, self.metrics_run, statistics)
+        
         # Show end screen
         self.show_end_screen(statistics)
         
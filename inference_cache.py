@@ -0,0 +1,153 @@
+import argparse
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from stable_baselines3.common.preprocessing import maybe_transpose
+from stable_baselines3.common.utils import is_vectorized_observation
+
+
+def observation_key(obs):
+    # 128-bit BLAKE2 digest of the raw observation bytes (plus shape so views can't collide)
+    obs = np.ascontiguousarray(obs)
+    digest = hashlib.blake2b(obs.tobytes(), digest_size=16)
+    digest.update(str(obs.shape).encode())
+    return digest.digest()
+
+
+# Bounded, thread-safe LRU map from observation keys to policy outputs
+class InferenceCache:
+
+    def __init__(self, max_size=10_000):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_statistics(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'size': len(self._entries),
+                'hit_rate': self.hits / max(lookups, 1),
+            }
+
+
+# Drop-in replacement for model.predict that skips forward passes for repeated observations
+class CachedPolicy:
+
+    def __init__(self, model, cache=None, max_size=10_000, key_fn=None):
+        self.model = model
+        self.cache = cache if cache is not None else InferenceCache(max_size)
+        self.key_fn = key_fn or observation_key
+        self.forward_passes = 0
+        self.forward_passes_skipped = 0
+
+    def predict(self, observation, state=None, episode_start=None, deterministic=False):
+        # Only deterministic, stateless predictions are a pure function of the observation
+        if not deterministic or state is not None:
+            self.forward_passes += 1
+            return self.model.predict(observation, state, episode_start, deterministic)
+
+        # Channels-last frames from the env against the channels-first space CnnPolicy saves,
+        # transposed the way BasePolicy.obs_to_tensor does before it checks the shape
+        observation = maybe_transpose(np.asarray(observation), self.model.observation_space)
+        if not is_vectorized_observation(observation, self.model.observation_space):
+            key = self.key_fn(observation)
+            action = self.cache.get(key)
+            if action is None:
+                action, _ = self.model.predict(observation, deterministic=True)
+                self.cache.put(key, action)
+                self.forward_passes += 1
+            else:
+                self.forward_passes_skipped += 1
+            return action, None
+
+        # Batched observations from a vectorized env: one forward pass for all misses.
+        # key_fn describes a single env, so rows are always keyed by their content.
+        keys = [observation_key(row) for row in observation]
+        cached = [self.cache.get(key) for key in keys]
+        missing = [i for i, action in enumerate(cached) if action is None]
+        if missing:
+            actions, _ = self.model.predict(observation[missing], deterministic=True)
+            for i, action in zip(missing, actions):
+                self.cache.put(keys[i], action)
+                cached[i] = action
+            self.forward_passes += 1
+        self.forward_passes_skipped += len(keys) - len(missing)
+        return np.stack(cached), None
+
+    def get_statistics(self):
+        statistics = self.cache.get_statistics()
+        statistics['forward_passes'] = self.forward_passes
+        statistics['forward_passes_skipped'] = self.forward_passes_skipped
+        return statistics
+
+
+def check_image_observations(n_observations=16, seed=0):
+    # Saves and reloads a CnnPolicy on (84, 84, 1) frames, whose loaded space is (1, 84, 84), and
+    # compares CachedPolicy with plain predict on raw env frames, one at a time and batched
+    from stable_baselines3 import PPO
+    from stable_baselines3.common.vec_env import DummyVecEnv
+
+    from compact_rollout import _RandomFrames
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        model_path = os.path.join(tmp_dir, "cnn_policy.zip")
+        PPO("CnnPolicy", DummyVecEnv([_RandomFrames]), n_steps=8, batch_size=8, device="cpu",
+            seed=seed).save(model_path)
+        model = PPO.load(model_path, device="cpu")
+
+    observations = np.random.default_rng(seed).integers(
+        0, 255, size=(n_observations,) + _RandomFrames.observation_space.shape, dtype=np.uint8)
+    expected, _ = model.predict(observations, deterministic=True)
+    single_policy = CachedPolicy(model)
+    single = np.array([single_policy.predict(obs, deterministic=True)[0] for obs in observations])
+    batched_policy = CachedPolicy(model)
+    batched, _ = batched_policy.predict(observations, deterministic=True)
+    # Both policies answer a second pass from their caches, keyed the same way
+    repeated_single = np.array([single_policy.predict(obs, deterministic=True)[0] for obs in observations])
+    repeated_batched, _ = batched_policy.predict(observations, deterministic=True)
+    return {
+        'single_matches': bool(np.array_equal(single.reshape(expected.shape), expected)),
+        'batched_matches': bool(np.array_equal(batched, expected)),
+        'cached_matches': bool(np.array_equal(repeated_single.reshape(expected.shape), expected)
+                               and np.array_equal(repeated_batched, expected)),
+        'forward_passes_skipped': single_policy.forward_passes_skipped + batched_policy.forward_passes_skipped,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check CachedPolicy against plain predict on channels-last frames")
+    parser.add_argument("--observations", type=int, default=16)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    for name, value in check_image_observations(args.observations, args.seed).items():
+        print(f"  {name}: {value}")
@@ -0,0 +1,347 @@
+import argparse
+import multiprocessing
+import os
+import queue
+import resource
+import socket
+import tempfile
+import threading
+import time
+
+import numpy as np
+from gymnasium import spaces
+
+from instrumentation import PERCENTILES
+from wire_protocol import MSG_POLICY_INFO, recv_message, recv_rows, send_message, send_rows
+
+DEFAULT_SOCKET_PATH = os.path.join(tempfile.gettempdir(), "pacman_policy.sock")
+
+
+class _Request:
+
+    def __init__(self, observations):
+        self.observations = observations
+        self.enqueued = time.monotonic()
+        self.actions = None
+        self.done = threading.Event()
+
+
+# One loaded policy serving deterministic actions to many local processes over a Unix socket.
+# Each client connection has a thread that queues its requests; a single batcher thread takes
+# the oldest request, adds whatever else arrives within `max_latency_ms` of it (up to
+# `max_batch_size` observations) and answers them all with one forward pass. When every
+# connected client is already waiting, nothing more can arrive and the batch goes at once.
+class InferenceServer:
+
+    def __init__(self, model_path="ppo_pacman.zip", socket_path=DEFAULT_SOCKET_PATH, max_batch_size=64,
+                 max_latency_ms=2.0, device="cpu", torch_threads=None):
+        self.model_path = model_path
+        self.socket_path = socket_path
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency_ms / 1000
+        self.device = device
+        self.torch_threads = torch_threads
+        self.model = None
+        self._queue = queue.SimpleQueue()
+        self._stop_event = threading.Event()
+        self._lock = threading.Lock()
+        self._server = None
+        self._threads = []
+        self.connected_clients = 0
+        self.requests = 0
+        self.batches = 0
+        self.batch_sizes = []
+        self.forward_seconds = 0.0
+
+    def start(self):
+        import torch
+        from stable_baselines3 import PPO
+
+        if self.torch_threads:
+            torch.set_num_threads(self.torch_threads)
+        self.model = PPO.load(self.model_path, device=self.device)
+        space = self.model.observation_space
+        self.policy_info = {
+            'model_path': os.path.abspath(self.model_path),
+            'shape': list(space.shape),
+            'dtype': str(space.dtype),
+            'low': float(np.min(space.low)),
+            'high': float(np.max(space.high)),
+            'n_actions': int(self.model.action_space.n),
+        }
+        # Warm-up pass, so the first client does not pay for lazy initialization
+        self.model.predict(np.zeros(space.shape, dtype=space.dtype), deterministic=True)
+
+        # A socket file left behind by a crashed server would make bind fail
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        self._server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._server.bind(self.socket_path)
+        self._server.listen()
+        self._server.settimeout(0.5)
+        self._threads = [threading.Thread(target=self._accept_loop, daemon=True),
+                         threading.Thread(target=self._batch_loop, daemon=True)]
+        for thread in self._threads:
+            thread.start()
+        print(f"Serving '{self.model_path}' on {self.socket_path} "
+              f"(max batch {self.max_batch_size}, max latency {self.max_latency * 1000:.1f} ms)")
+        return self
+
+    def serve_forever(self):
+        self.start()
+        try:
+            while not self._stop_event.is_set():
+                time.sleep(1.0)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+            print(self.get_statistics())
+
+    def stop(self):
+        self._stop_event.set()
+        for thread in self._threads:
+            thread.join(timeout=5)
+        if self._server is not None:
+            self._server.close()
+            self._server = None
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+
+    def _accept_loop(self):
+        while not self._stop_event.is_set():
+            try:
+                conn, _ = self._server.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            threading.Thread(target=self._serve_client, args=(conn,), daemon=True).start()
+
+    def _serve_client(self, conn):
+        shape, dtype = tuple(self.policy_info['shape']), self.policy_info['dtype']
+        with self._lock:
+            self.connected_clients += 1
+        try:
+            send_message(conn, MSG_POLICY_INFO, self.policy_info)
+            while not self._stop_event.is_set():
+                request = _Request(recv_rows(conn, dtype, shape))
+                self._queue.put(request)
+                request.done.wait()
+                if request.actions is None:
+                    break
+                send_rows(conn, request.actions)
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            with self._lock:
+                self.connected_clients -= 1
+            conn.close()
+
+    def _next_batch(self):
+        try:
+            first = self._queue.get(timeout=0.5)
+        except queue.Empty:
+            return []
+        batch, rows = [first], len(first.observations)
+        deadline = first.enqueued + self.max_latency
+        while rows < self.max_batch_size and len(batch) < self.connected_clients:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                request = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            batch.append(request)
+            rows += len(request.observations)
+        return batch
+
+    def _batch_loop(self):
+        while not self._stop_event.is_set():
+            batch = self._next_batch()
+            if not batch:
+                continue
+            start = time.perf_counter()
+            try:
+                observations = np.concatenate([request.observations for request in batch])
+                actions, _ = self.model.predict(observations, deterministic=True)
+                actions = np.asarray(actions, dtype=np.int64)
+            except Exception as e:
+                # Leaves actions unset, which closes these clients' connections instead of hanging them
+                print(f"Inference failed for a batch of {len(batch)} requests: {e}")
+                actions = None
+            self.forward_seconds += time.perf_counter() - start
+
+            offset = 0
+            for request in batch:
+                n = len(request.observations)
+                if actions is not None:
+                    request.actions = actions[offset:offset + n]
+                offset += n
+                request.done.set()
+            self.requests += len(batch)
+            self.batches += 1
+            self.batch_sizes.append(offset)
+
+    def get_statistics(self):
+        batch_sizes = np.asarray(self.batch_sizes, dtype=np.float64)
+        return {
+            'requests': self.requests,
+            'batches': self.batches,
+            'mean_batch_size': float(batch_sizes.mean()) if len(batch_sizes) else 0.0,
+            'max_batch_size': int(batch_sizes.max()) if len(batch_sizes) else 0,
+            'forward_seconds': self.forward_seconds,
+        }
+
+
+# Drop-in replacement for model.predict that asks an InferenceServer instead of running the model
+class RemotePolicy:
+
+    def __init__(self, socket_path=DEFAULT_SOCKET_PATH, timeout=None):
+        self.socket_path = socket_path
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(timeout)
+        self.sock.connect(socket_path)
+        msg_type, info, _ = recv_message(self.sock)
+        if msg_type != MSG_POLICY_INFO:
+            raise ConnectionError(f"Unexpected message type {msg_type} from {socket_path}")
+        self.model_path = info['model_path']
+        self.observation_space = spaces.Box(low=info['low'], high=info['high'], shape=tuple(info['shape']),
+                                            dtype=np.dtype(info['dtype']))
+        self.action_space = spaces.Discrete(info['n_actions'])
+
+    def predict(self, observation, state=None, episode_start=None, deterministic=False):
+        # The server runs the deterministic policy only
+        if not deterministic or state is not None:
+            raise ValueError("RemotePolicy only serves deterministic, stateless predictions")
+        observation = np.asarray(observation, dtype=self.observation_space.dtype)
+        shape = self.observation_space.shape
+        single = observation.ndim == len(shape)
+        if observation.shape[-len(shape):] != shape:
+            # Env-layout (H, W, C) images; the model is channels-first, as SB3's predict would transpose
+            observation = np.moveaxis(observation, -1, -3)
+        send_rows(self.sock, observation[None] if single else observation)
+        actions = recv_rows(self.sock, np.int64)
+        return (actions[0] if single else actions), None
+
+    def close(self):
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _client_main(mode, model_path, socket_path, n_requests, warmup, seed, barrier, results):
+    # One benchmark client: its own PPO copy ("local") or a connection to the server ("remote").
+    # Only local clients import torch, so the remote clients' RSS shows what the server saves.
+    if mode == "local":
+        import torch
+        from stable_baselines3 import PPO
+
+        torch.set_num_threads(1)
+        policy = PPO.load(model_path, device="cpu")
+    else:
+        policy = RemotePolicy(socket_path)
+    space = policy.observation_space
+    rng = np.random.default_rng(seed)
+    observations = rng.integers(0, 256, size=(16,) + space.shape).astype(space.dtype)
+    for i in range(warmup):
+        policy.predict(observations[i % 16], deterministic=True)
+
+    barrier.wait()
+    latencies = np.empty(n_requests)
+    start = time.time()
+    for i in range(n_requests):
+        request_start = time.perf_counter()
+        policy.predict(observations[i % 16], deterministic=True)
+        latencies[i] = time.perf_counter() - request_start
+    end = time.time()
+    results.put({'latencies': latencies.tolist(), 'start': start, 'end': end,
+                 'max_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024})
+
+
+def _run_clients(mode, model_path, socket_path, n_clients, n_requests, warmup):
+    ctx = multiprocessing.get_context("spawn")
+    barrier = ctx.Barrier(n_clients)
+    results = ctx.Queue()
+    clients = [ctx.Process(target=_client_main, args=(mode, model_path, socket_path, n_requests, warmup, i,
+                                                      barrier, results))
+               for i in range(n_clients)]
+    for client in clients:
+        client.start()
+    client_results = [results.get() for _ in clients]
+    for client in clients:
+        client.join()
+
+    latencies_ms = np.concatenate([result['latencies'] for result in client_results]) * 1000
+    wall_seconds = max(r['end'] for r in client_results) - min(r['start'] for r in client_results)
+    row = {
+        'mode': mode,
+        'clients': n_clients,
+        'requests': len(latencies_ms),
+        'throughput': len(latencies_ms) / wall_seconds,
+        'client_rss_mb': sum(result['max_rss_mb'] for result in client_results),
+    }
+    row.update({f"p{p}_ms": float(np.percentile(latencies_ms, p)) for p in PERCENTILES})
+    return row
+
+
+def benchmark(model_path="ppo_pacman.zip", client_counts=(1, 4, 16), n_requests=500, warmup=20, max_batch_size=64,
+              max_latency_ms=2.0, socket_path=DEFAULT_SOCKET_PATH, server_threads=None):
+    # Per-process PPO.predict against the same clients calling one server
+    rows = []
+    for n_clients in client_counts:
+        rows.append(_run_clients("local", model_path, socket_path, n_clients, n_requests, warmup))
+        server = InferenceServer(model_path, socket_path, max_batch_size, max_latency_ms,
+                                 torch_threads=server_threads).start()
+        try:
+            row = _run_clients("remote", model_path, socket_path, n_clients, n_requests, warmup)
+        finally:
+            server.stop()
+        statistics = server.get_statistics()
+        row['mean_batch_size'] = statistics['mean_batch_size']
+        # The model copy lives in this process for the remote runs
+        row['server_rss_mb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        rows.append(row)
+
+    print(f"\n{'Mode':>6} | {'Clients':>7} | {'Req/s':>8} | {'p50 ms':>7} | {'p95 ms':>7} | {'p99 ms':>7} | "
+          f"{'Batch':>5} | {'Client RSS MB':>13}")
+    for row in rows:
+        batch = f"{row['mean_batch_size']:.1f}" if 'mean_batch_size' in row else "1"
+        print(f"{row['mode']:>6} | {row['clients']:>7} | {row['throughput']:>8.0f} | {row['p50_ms']:>7.2f} | "
+              f"{row['p95_ms']:>7.2f} | {row['p99_ms']:>7.2f} | {batch:>5} | {row['client_rss_mb']:>13.0f}")
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Micro-batching policy inference server for local processes")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = subparsers.add_parser("serve", help="Serve a model until interrupted")
+    serve_parser.add_argument("--model", default="ppo_pacman.zip")
+    serve_parser.add_argument("--socket", default=DEFAULT_SOCKET_PATH)
+    serve_parser.add_argument("--max-batch-size", type=int, default=64)
+    serve_parser.add_argument("--max-latency-ms", type=float, default=2.0)
+    serve_parser.add_argument("--device", default="cpu")
+    serve_parser.add_argument("--torch-threads", type=int, default=None)
+
+    benchmark_parser = subparsers.add_parser("benchmark", help="Compare with per-process PPO.predict")
+    benchmark_parser.add_argument("--model", default="ppo_pacman.zip")
+    benchmark_parser.add_argument("--socket", default=DEFAULT_SOCKET_PATH)
+    benchmark_parser.add_argument("--clients", type=int, nargs="+", default=[1, 4, 16])
+    benchmark_parser.add_argument("--requests", type=int, default=500, help="Requests per client")
+    benchmark_parser.add_argument("--max-batch-size", type=int, default=64)
+    benchmark_parser.add_argument("--max-latency-ms", type=float, default=2.0)
+    benchmark_parser.add_argument("--torch-threads", type=int, default=None, help="Server torch threads")
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        InferenceServer(args.model, args.socket, args.max_batch_size, args.max_latency_ms, args.device,
+                        args.torch_threads).serve_forever()
+    else:
+        benchmark(args.model, args.clients, args.requests, max_batch_size=args.max_batch_size,
+                  max_latency_ms=args.max_latency_ms, socket_path=args.socket, server_threads=args.torch_threads)
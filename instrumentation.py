@@ -0,0 +1,165 @@
+import json
+import os
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+PERCENTILES = (50, 95, 99)
+
+
+def format_histogram(values_ms, bins=10, width=40):
+    values_ms = np.asarray(values_ms)
+    if len(values_ms) == 0:
+        return []
+    # Clip the tail at p99 so one outlier doesn't flatten every other bar
+    upper = max(np.percentile(values_ms, 99), values_ms.min() + 1e-6)
+    counts, edges = np.histogram(np.clip(values_ms, None, upper), bins=bins)
+    peak = max(counts.max(), 1)
+    lines = []
+    for count, low, high in zip(counts, edges[:-1], edges[1:]):
+        bar = "#" * int(round(width * count / peak))
+        lines.append(f"  {low:8.2f}-{high:8.2f} ms | {bar} {count}")
+    return lines
+
+
+# Records per-frame section timings and keydown-to-present latency for the play loops
+class FrameProfiler:
+
+    def __init__(self, target_fps, enabled=True, trace_path=None):
+        self.target_fps = target_fps
+        self.enabled = enabled
+        self.trace_path = trace_path
+        self.session_start = time.perf_counter()
+        self.frames = []
+        self.latencies = []
+        self.pending_keys = []
+        self.current = None
+        self.last_frame_start = None
+
+    def begin_frame(self):
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        self.current = {'start': now, 'sections': {}, 'spans': []}
+
+    def abandon_frame(self):
+        # Paused or skipped frames don't count towards pacing
+        self.current = None
+        self.last_frame_start = None
+
+    @contextmanager
+    def section(self, name):
+        if not self.enabled or self.current is None:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            self.current['sections'][name] = self.current['sections'].get(name, 0.0) + (end - start)
+            self.current['spans'].append((name, start, end))
+
+    def key_down(self, key=None):
+        # pygame events carry no timestamp, so a key counts from when the event was polled
+        if self.enabled:
+            self.pending_keys.append((key, time.perf_counter()))
+
+    def end_frame(self):
+        if not self.enabled or self.current is None:
+            return
+        now = time.perf_counter()
+        frame = self.current
+        frame['end'] = now
+        frame['work'] = now - frame['start']
+        frame['interval'] = frame['start'] - self.last_frame_start if self.last_frame_start is not None else None
+        self.last_frame_start = frame['start']
+
+        # Keys polled before this frame presented are visible once the flip is done
+        for key, pressed_at in self.pending_keys:
+            self.latencies.append({'key': key, 'pressed_at': pressed_at, 'presented_at': now,
+                                   'latency': now - pressed_at})
+        self.pending_keys = []
+
+        self.frames.append(frame)
+        self.current = None
+
+    def _percentiles(self, values):
+        values_ms = np.asarray(values) * 1000
+        return {f"p{p}": float(np.percentile(values_ms, p)) for p in PERCENTILES}
+
+    def get_statistics(self):
+        if not self.frames:
+            return {}
+        section_names = sorted({name for frame in self.frames for name in frame['sections']})
+        intervals = [frame['interval'] for frame in self.frames if frame['interval'] is not None]
+        budget = 1.0 / self.target_fps
+
+        statistics = {
+            'frames': len(self.frames),
+            'target_fps': self.target_fps,
+            'achieved_fps': 1.0 / np.mean(intervals) if intervals else None,
+            'frames_over_budget': int(sum(interval > budget * 1.1 for interval in intervals)),
+            'frame_interval_ms': self._percentiles(intervals) if intervals else {},
+            'frame_work_ms': self._percentiles([frame['work'] for frame in self.frames]),
+            'sections_ms': {
+                name: self._percentiles([frame['sections'].get(name, 0.0) for frame in self.frames])
+                for name in section_names
+            },
+        }
+        if self.latencies:
+            statistics['input_latency_ms'] = self._percentiles([entry['latency'] for entry in self.latencies])
+            statistics['input_events'] = len(self.latencies)
+        return statistics
+
+    def print_summary(self):
+        statistics = self.get_statistics()
+        if not statistics:
+            return
+        print("\nFrame Timing (ms):")
+        print(f"  Target FPS: {self.target_fps} | Achieved FPS: {statistics['achieved_fps'] or 0:.1f} | "
+              f"Frames over budget: {statistics['frames_over_budget']}/{statistics['frames']}")
+        rows = [('frame interval', statistics['frame_interval_ms']), ('frame work', statistics['frame_work_ms'])]
+        rows += list(statistics['sections_ms'].items())
+        if 'input_latency_ms' in statistics:
+            rows.append(('key -> present', statistics['input_latency_ms']))
+        print(f"  {'':<16} {'p50':>8} {'p95':>8} {'p99':>8}")
+        for name, percentiles in rows:
+            if percentiles:
+                print(f"  {name:<16} {percentiles['p50']:>8.2f} {percentiles['p95']:>8.2f} {percentiles['p99']:>8.2f}")
+
+        intervals = [frame['interval'] * 1000 for frame in self.frames if frame['interval'] is not None]
+        if intervals:
+            print("\nFrame interval histogram:")
+            print("\n".join(format_histogram(intervals)))
+        if self.latencies:
+            print("\nKeydown-to-present latency histogram:")
+            print("\n".join(format_histogram([entry['latency'] * 1000 for entry in self.latencies])))
+
+    def write_trace(self, path=None):
+        # Chrome trace event format; open in chrome://tracing or ui.perfetto.dev
+        path = path or self.trace_path
+        if not path or not self.frames:
+            return None
+
+        def us(t):
+            return (t - self.session_start) * 1e6
+
+        events = []
+        for index, frame in enumerate(self.frames):
+            events.append({'name': "frame", 'ph': "X", 'pid': os.getpid(), 'tid': 0,
+                           'ts': us(frame['start']), 'dur': frame['work'] * 1e6, 'args': {'frame': index}})
+            for name, start, end in frame['spans']:
+                events.append({'name': name, 'ph': "X", 'pid': os.getpid(), 'tid': 0,
+                               'ts': us(start), 'dur': (end - start) * 1e6})
+        for entry in self.latencies:
+            events.append({'name': "key_to_present", 'ph': "X", 'pid': os.getpid(), 'tid': 1,
+                           'ts': us(entry['pressed_at']), 'dur': entry['latency'] * 1e6,
+                           'args': {'key': entry['key']}})
+
+        with open(path, "w") as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': "ms",
+                       'metadata': {'target_fps': self.target_fps}}, f)
+        print(f"Frame trace written to '{path}'")
+        return path
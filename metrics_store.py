@@ -0,0 +1,296 @@
+import argparse
+import json
+import numbers
+import os
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+
+from stable_baselines3.common.callbacks import BaseCallback
+
+METRICS_DB_PATH = "metrics.db"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    started_at REAL NOT NULL,
+    ended_at REAL,
+    config TEXT,
+    summary TEXT
+);
+CREATE TABLE IF NOT EXISTS metrics (
+    run_id TEXT NOT NULL,
+    name TEXT NOT NULL,
+    step INTEGER,
+    value REAL NOT NULL,
+    wall_time REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS summaries (
+    run_id TEXT NOT NULL,
+    name TEXT NOT NULL,
+    value REAL NOT NULL,
+    PRIMARY KEY (run_id, name)
+);
+CREATE INDEX IF NOT EXISTS metrics_by_name ON metrics (name, run_id);
+CREATE INDEX IF NOT EXISTS runs_by_kind ON runs (kind, started_at);
+CREATE INDEX IF NOT EXISTS summaries_by_name ON summaries (name);
+"""
+
+
+def _connect(path):
+    connection = sqlite3.connect(path, timeout=30.0)
+    # WAL lets the query CLI and several writers (e.g. sweep trials) use the file at once
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    connection.executescript(SCHEMA)
+    return connection
+
+
+def _numeric_fields(summary):
+    # Only top-level numbers are queryable; the full summary is kept as JSON on the run
+    return {name: float(value) for name, value in (summary or {}).items() if isinstance(value, numbers.Real)}
+
+
+# Append-only SQLite store for training runs, evaluations and play sessions. Writers only
+# put rows on a queue; a background thread inserts them in batched transactions, so logging
+# from a training or frame loop never waits on disk.
+class MetricsStore:
+
+    def __init__(self, path=METRICS_DB_PATH, flush_interval=1.0, batch_size=5000):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.rows_written = 0
+        self._queue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._writer, name="metrics-writer", daemon=True)
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._thread.start()
+
+    def start_run(self, kind, config=None, run_id=None):
+        run = Run(self, run_id or f"{kind}-{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}", kind)
+        self._queue.put(('run', (run.run_id, kind, time.time(), json.dumps(config or {}, default=str))))
+        return run
+
+    def _writer(self):
+        connection = _connect(self.path)
+        stopping = False
+        while not stopping:
+            items = []
+            try:
+                items.append(self._queue.get(timeout=self.flush_interval))
+                while len(items) < self.batch_size:
+                    items.append(self._queue.get_nowait())
+            except queue.Empty:
+                pass
+
+            runs, metrics, ends, waiters = [], [], [], []
+            for kind, payload in items:
+                if kind == 'run':
+                    runs.append(payload)
+                elif kind == 'metric':
+                    metrics.append(payload)
+                elif kind == 'end':
+                    ends.append(payload)
+                elif kind == 'flush':
+                    waiters.append(payload)
+                elif kind == 'stop':
+                    waiters.append(payload)
+                    stopping = True
+
+            # A run is always queued before its metrics and its end, so this order is safe
+            if runs or metrics or ends:
+                with connection:
+                    connection.executemany("INSERT OR IGNORE INTO runs (run_id, kind, started_at, config) "
+                                           "VALUES (?, ?, ?, ?)", runs)
+                    connection.executemany("INSERT INTO metrics (run_id, name, step, value, wall_time) "
+                                           "VALUES (?, ?, ?, ?, ?)", metrics)
+                    for run_id, ended_at, summary in ends:
+                        connection.execute("UPDATE runs SET ended_at = ?, summary = ? WHERE run_id = ?",
+                                           (ended_at, json.dumps(summary, default=str), run_id))
+                        connection.executemany(
+                            "INSERT OR REPLACE INTO summaries (run_id, name, value) VALUES (?, ?, ?)",
+                            [(run_id, name, value) for name, value in _numeric_fields(summary).items()])
+                self.rows_written += len(runs) + len(metrics) + len(ends)
+            for waiter in waiters:
+                waiter.set()
+        connection.close()
+
+    def _wait(self, done, timeout):
+        # A dead writer never sets done, so waits poll its liveness instead of blocking for good
+        deadline = time.monotonic() + timeout
+        while not done.wait(0.1):
+            if not self._thread.is_alive():
+                print(f"Metrics writer for '{self.path}' has stopped; queued metrics were not written")
+                return False
+            if time.monotonic() > deadline:
+                print(f"Metrics writer for '{self.path}' did not finish within {timeout:.0f}s")
+                return False
+        return True
+
+    def flush(self, timeout=30.0):
+        done = threading.Event()
+        self._queue.put(('flush', done))
+        return self._wait(done, timeout)
+
+    def close(self, timeout=30.0):
+        if not self._thread.is_alive():
+            return
+        done = threading.Event()
+        self._queue.put(('stop', done))
+        if self._wait(done, timeout):
+            self._thread.join(timeout)
+
+
+class Run:
+
+    def __init__(self, store, run_id, kind):
+        self.store = store
+        self.run_id = run_id
+        self.kind = kind
+
+    def log(self, name, value, step=None):
+        self.store._queue.put(('metric', (self.run_id, name, step, float(value), time.time())))
+
+    def log_many(self, values, step=None):
+        for name, value in values.items():
+            self.log(name, value, step)
+
+    def end(self, summary=None):
+        self.store._queue.put(('end', (self.run_id, time.time(), summary or {})))
+
+
+# Streams finished episodes and the previous update's train/* values. make_vec_env puts Monitor
+# outside AtariWrapper's reward clipping, so episode returns are sums of clipped rewards.
+class MetricsCallback(BaseCallback):
+
+    def __init__(self, run, verbose=0):
+        super().__init__(verbose)
+        self.run = run
+        self.episodes = 0
+
+    def _on_rollout_start(self):
+        # PPO records train/* during train() and dumps them after the next rollout
+        for name, value in self.model.logger.name_to_value.items():
+            if name.startswith("train/"):
+                self.run.log(name, value, self.num_timesteps)
+
+    def _on_step(self):
+        for info in self.locals.get('infos', []):
+            episode = info.get('episode')
+            if episode:
+                self.episodes += 1
+                self.run.log('episode_reward_clipped', episode['r'], self.num_timesteps)
+                self.run.log('episode_length', episode['l'], self.num_timesteps)
+        return True
+
+
+def open_run(path, kind, config=None):
+    # (store, run) for callers with an optional metrics path; (None, None) disables logging
+    if not path:
+        return None, None
+    store = MetricsStore(path)
+    return store, store.start_run(kind, config)
+
+
+def close_run(store, run, summary=None):
+    if store is None:
+        return
+    run.end(summary)
+    store.close()
+
+
+def _print_rows(header, rows):
+    widths = [max(len(str(h)), *(len(_format(row[i])) for row in rows)) if rows else len(str(h))
+              for i, h in enumerate(header)]
+    print("  ".join(str(h).ljust(w) for h, w in zip(header, widths)))
+    for row in rows:
+        print("  ".join(_format(value).ljust(w) for value, w in zip(row, widths)))
+
+
+def _format(value):
+    if isinstance(value, float):
+        return f"{value:.3f}"
+    return "" if value is None else str(value)
+
+
+def list_runs(connection, kind=None, limit=20):
+    query = "SELECT run_id, kind, datetime(started_at, 'unixepoch', 'localtime'), ended_at - started_at FROM runs"
+    params = []
+    if kind:
+        query += " WHERE kind = ?"
+        params.append(kind)
+    query += " ORDER BY started_at DESC LIMIT ?"
+    return connection.execute(query, params + [limit]).fetchall()
+
+
+def metric_per_run(connection, name, kind=None, last=None, limit=20):
+    # Per-run aggregates of one time series; `last` restricts each run to its final n points
+    where = "m.name = ?" + (" AND r.kind = ?" if kind else "")
+    params = [name] + ([kind] if kind else [])
+    source = "metrics"
+    if last:
+        source = ("(SELECT *, ROW_NUMBER() OVER (PARTITION BY run_id ORDER BY step DESC, wall_time DESC) AS recency "
+                  "FROM metrics WHERE name = ?)")
+        where += " AND m.recency <= ?"
+        params = [name] + params + [last]
+    query = (f"SELECT m.run_id, r.kind, COUNT(*), AVG(m.value), MIN(m.value), MAX(m.value) "
+             f"FROM {source} m JOIN runs r USING (run_id) WHERE {where} "
+             f"GROUP BY m.run_id ORDER BY r.started_at DESC LIMIT ?")
+    return connection.execute(query, params + [limit]).fetchall()
+
+
+def aggregate_summaries(connection, name, kind=None):
+    # One summary value (e.g. total_reward, mean_reward) across all runs, grouped by kind
+    query = ("SELECT r.kind, COUNT(*), AVG(s.value), MIN(s.value), MAX(s.value) "
+             "FROM summaries s JOIN runs r USING (run_id) WHERE s.name = ?")
+    params = [name]
+    if kind:
+        query += " AND r.kind = ?"
+        params.append(kind)
+    query += " GROUP BY r.kind ORDER BY r.kind"
+    return connection.execute(query, params).fetchall()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query training, evaluation and play metrics")
+    parser.add_argument("--db", default=METRICS_DB_PATH)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    runs_parser = subparsers.add_parser("runs", help="List recent runs")
+    runs_parser.add_argument("--kind", choices=["train", "eval", "human_play", "agent_play"])
+    runs_parser.add_argument("--limit", type=int, default=20)
+
+    metric_parser = subparsers.add_parser("metric", help="Aggregate a time series per run")
+    metric_parser.add_argument("name", help="e.g. episode_reward_clipped (train runs), episode_reward (eval and play "
+                                            "runs), train/loss, score")
+    metric_parser.add_argument("--kind")
+    metric_parser.add_argument("--last", type=int, default=None, help="Only the last N points of each run")
+    metric_parser.add_argument("--limit", type=int, default=20)
+
+    summary_parser = subparsers.add_parser("summary", help="Aggregate a summary value across runs by kind")
+    summary_parser.add_argument("name", help="e.g. mean_reward, total_reward, step_count")
+    summary_parser.add_argument("--kind")
+
+    args = parser.parse_args()
+    if not os.path.exists(args.db):
+        print(f"No metrics database at '{args.db}'")
+        return
+    connection = _connect(args.db)
+
+    if args.command == "runs":
+        _print_rows(["run_id", "kind", "started", "seconds"], list_runs(connection, args.kind, args.limit))
+    elif args.command == "metric":
+        _print_rows(["run_id", "kind", "points", "mean", "min", "max"],
+                    metric_per_run(connection, args.name, args.kind, args.last, args.limit))
+    else:
+        _print_rows(["kind", "runs", "mean", "min", "max"], aggregate_summaries(connection, args.name, args.kind))
+    connection.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+import hashlib
+import io
+import os
+import threading
+import time
+
+import numpy as np
+from stable_baselines3 import PPO
+
+
+def model_file_signature(model_path):
+    try:
+        stat = os.stat(model_path)
+    except FileNotFoundError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+# Watches a model file and loads new versions on a background thread.
+# The play loop picks them up with swap_if_ready() between steps.
+class PolicyReloader:
+
+    def __init__(self, model_path, poll_interval=1.0):
+        self.model_path = model_path
+        self.poll_interval = poll_interval
+        self.current_signature = model_file_signature(model_path)
+        with open(model_path, "rb") as f:
+            self.current_version = hashlib.sha256(f.read()).hexdigest()[:12]
+        self.failed_loads = 0
+        self._pending = None
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._watch, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.poll_interval * 2)
+
+    def _watch(self):
+        last_seen = self.current_signature
+        while not self._stop_event.wait(self.poll_interval):
+            signature = model_file_signature(self.model_path)
+            if signature is None or signature == self.current_signature:
+                last_seen = signature
+                continue
+            # Only load once the file has stopped changing for one poll interval,
+            # so a model that is still being written is never picked up
+            if signature != last_seen:
+                last_seen = signature
+                continue
+            self._load(signature)
+
+    def _load(self, signature):
+        start = time.time()
+        try:
+            # Read once so the hash and the loaded weights come from the same bytes
+            with open(self.model_path, "rb") as f:
+                data = f.read()
+            model = PPO.load(io.BytesIO(data), device="cpu")
+            # Warm up the forward pass here rather than on the first step after the swap
+            model.predict(np.zeros(model.observation_space.shape, dtype=model.observation_space.dtype),
+                          deterministic=True)
+        except Exception as e:
+            self.failed_loads += 1
+            print(f"Could not load new model from {self.model_path}: {e}")
+            self.current_signature = signature
+            return
+
+        version = hashlib.sha256(data).hexdigest()[:12]
+        self.current_signature = signature
+        if version == self.current_version:
+            return
+        with self._lock:
+            self._pending = (model, version, time.time() - start)
+
+    def swap_if_ready(self):
+        # Returns (model, version, load_seconds) once per new model, otherwise None
+        with self._lock:
+            pending, self._pending = self._pending, None
+        if pending is not None:
+            self.current_version = pending[1]
+        return pending
@@ -0,0 +1,89 @@
+import argparse
+import time
+
+import gymnasium as gym
+import numpy as np
+from gymnasium import spaces
+from stable_baselines3.common.atari_wrappers import ClipRewardEnv, NoopResetEnv
+
+
+# Repeat each action for `skip` frames and sum the rewards. Unlike
+# MaxAndSkipEnv there is no max-pooling, which only makes sense for pixels.
+class RamSkipEnv(gym.Wrapper):
+
+    def __init__(self, env, skip=4):
+        super().__init__(env)
+        self.skip = skip
+
+    def step(self, action):
+        total_reward = 0.0
+        for _ in range(self.skip):
+            obs, reward, terminated, truncated, info = self.env.step(action)
+            total_reward += float(reward)
+            if terminated or truncated:
+                break
+        return obs, total_reward, terminated, truncated, info
+
+
+# Present the 128-byte console RAM as float features in [0, 1],
+# or as 1024 individual bits when unpack_bits is set
+class RamObservation(gym.ObservationWrapper):
+
+    def __init__(self, env, unpack_bits=False):
+        super().__init__(env)
+        self.unpack_bits = unpack_bits
+        n_features = env.observation_space.shape[0] * (8 if unpack_bits else 1)
+        self.observation_space = spaces.Box(low=0.0, high=1.0, shape=(n_features,), dtype=np.float32)
+
+    def observation(self, obs):
+        if self.unpack_bits:
+            return np.unpackbits(obs.astype(np.uint8)).astype(np.float32)
+        return obs.astype(np.float32) / 255.0
+
+
+def wrap_ram_env(env, frame_skip=4, clip_reward=True, unpack_bits=False):
+    # Mirrors AtariWrapper for RAM observations: noop starts, frame skip, reward clipping
+    env = NoopResetEnv(env, noop_max=30)
+    env = RamSkipEnv(env, skip=frame_skip)
+    if clip_reward:
+        env = ClipRewardEnv(env)
+    return RamObservation(env, unpack_bits=unpack_bits)
+
+
+def compare_pipelines(timesteps=200_000, eval_episodes=10, unpack_bits=False):
+    from train_agent import evaluate_model, train
+
+    pipelines = [
+        ('pixel', "ppo_pacman_compare_pixel.zip", {}),
+        ('ram', "ppo_pacman_compare_ram.zip", {'obs_type': "ram", 'unpack_bits': unpack_bits}),
+    ]
+
+    results = []
+    for name, model_path, kwargs in pipelines:
+        start = time.time()
+        train(model_path=model_path, total_timesteps=timesteps, **kwargs)
+        train_seconds = time.time() - start
+
+        eval_results = evaluate_model(model_path=model_path, episodes=eval_episodes, use_cache=False, **kwargs)
+        results.append({
+            'pipeline': name,
+            'steps_per_sec': timesteps / train_seconds,
+            'train_seconds': train_seconds,
+            'mean_reward': eval_results['mean_reward'],
+            'score_per_hour': eval_results['mean_reward'] / (train_seconds / 3600),
+        })
+
+    print(f"\n{'Pipeline':>8} | {'Steps/sec':>9} | {'Train time':>10} | {'Mean Reward':>11} | {'Score/hour':>10}")
+    for result in results:
+        print(f"{result['pipeline']:>8} | {result['steps_per_sec']:>9.0f} | {result['train_seconds']:>9.0f}s | "
+              f"{result['mean_reward']:>11.2f} | {result['score_per_hour']:>10.2f}")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare RAM/MLP and pixel/CNN training pipelines")
+    parser.add_argument("--timesteps", type=int, default=200_000)
+    parser.add_argument("--eval-episodes", type=int, default=10)
+    parser.add_argument("--unpack-bits", action="store_true")
+    args = parser.parse_args()
+    compare_pipelines(args.timesteps, args.eval_episodes, args.unpack_bits)
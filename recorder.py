@@ -0,0 +1,163 @@
+import argparse
+import glob
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import cv2
+
+from frame_codec import FRAME_CODEC_EXTENSION, FrameWriter
+from session_log import SessionLog
+
+_STOP = object()
+
+
+# Hands frames from a play loop to a background encoder thread through a bounded queue.
+# With policy="drop" a full queue drops the frame (and counts it); with "block" the
+# producer waits, which is what headless rendering wants. Paths ending in ".frames"
+# are written with frame_codec instead of as video.
+class FrameRecorder:
+
+    def __init__(self, path, fps, max_queue=256, policy="drop", fourcc="mp4v"):
+        if policy not in ("drop", "block"):
+            raise ValueError(f"Unknown recorder policy: {policy}")
+        self.path = path
+        self.fps = fps
+        self.policy = policy
+        self.fourcc = fourcc
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.frames_submitted = 0
+        self.frames_written = 0
+        self.frames_dropped = 0
+        self.max_queue_depth = 0
+        self.encode_seconds = 0.0
+        self._writer = None
+        self._thread = None
+
+    def start(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._thread = threading.Thread(target=self._encode_loop, daemon=True)
+        self._thread.start()
+        return self
+
+    def submit(self, frame):
+        # Called from the play loop: never encodes, at most waits when policy="block"
+        self.frames_submitted += 1
+        try:
+            self.queue.put(frame, block=self.policy == "block")
+        except queue.Full:
+            self.frames_dropped += 1
+            return False
+        self.max_queue_depth = max(self.max_queue_depth, self.queue.qsize())
+        return True
+
+    def _encode_loop(self):
+        while True:
+            frame = self.queue.get()
+            if frame is _STOP:
+                break
+            start = time.perf_counter()
+            if self.path.endswith(FRAME_CODEC_EXTENSION):
+                # Lossless keyframe/delta stream with random access by step
+                if self._writer is None:
+                    self._writer = FrameWriter(self.path)
+                self._writer.write(frame)
+            else:
+                if self._writer is None:
+                    height, width = frame.shape[:2]
+                    self._writer = cv2.VideoWriter(self.path, cv2.VideoWriter_fourcc(*self.fourcc),
+                                                   self.fps, (width, height))
+                # ALE frames are RGB, OpenCV writes BGR
+                self._writer.write(cv2.cvtColor(frame, cv2.COLOR_RGB2BGR))
+            self.encode_seconds += time.perf_counter() - start
+            self.frames_written += 1
+
+    def stop(self):
+        if self._thread is None:
+            return self.get_statistics()
+        # The stop marker always waits so that every queued frame is flushed
+        self.queue.put(_STOP)
+        self._thread.join()
+        self._thread = None
+        if isinstance(self._writer, FrameWriter):
+            self._writer.close()
+        elif self._writer is not None:
+            self._writer.release()
+        return self.get_statistics()
+
+    def get_statistics(self):
+        return {
+            'path': self.path,
+            'frames_submitted': self.frames_submitted,
+            'frames_written': self.frames_written,
+            'frames_dropped': self.frames_dropped,
+            'max_queue_depth': self.max_queue_depth,
+            'encode_seconds': self.encode_seconds,
+        }
+
+
+def make_replay_env(mode):
+    # Same factory settings as HumanPlayMode and AgentPlayMode, without a window
+    from env_factory import create_env
+
+    return create_env("headless", preprocessing="none" if mode == "human" else None)
+
+
+def render_session(session_path, video_path=None, fps=None, extension=".mp4"):
+    # Replays a recorded session from its seed and actions, as fast as the emulator runs
+    log = SessionLog.load(session_path)
+    video_path = video_path or os.path.splitext(session_path)[0] + extension
+    fps = fps or log.metadata.get('fps', 20)
+
+    env = make_replay_env(log.metadata['mode'])
+    env.reset(seed=log.metadata['seed'])
+    recorder = FrameRecorder(video_path, fps, policy="block").start()
+
+    start = time.time()
+    for action, recorded_done in zip(log.actions, log.dones):
+        _, _, terminated, truncated, _ = env.step(action)
+        recorder.submit(env.render())
+        if terminated or truncated:
+            env.reset()
+        if bool(terminated or truncated) != bool(recorded_done):
+            print(f"Warning: replay of '{session_path}' diverged from the recording")
+            break
+    env.close()
+    statistics = recorder.stop()
+
+    elapsed = time.time() - start
+    session_seconds = log.times[-1] if log.times else 0.0
+    statistics['render_seconds'] = elapsed
+    statistics['speedup_vs_realtime'] = session_seconds / max(elapsed, 1e-9)
+    return statistics
+
+
+def render_sessions(pattern, workers=None, extension=".mp4"):
+    session_paths = sorted(glob.glob(pattern))
+    if not session_paths:
+        print(f"No sessions found for '{pattern}'")
+        return []
+
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx) as pool:
+        results = list(pool.map(partial(render_session, extension=extension), session_paths))
+    for result in results:
+        print(f"{result['path']}: {result['frames_written']} frames in {result['render_seconds']:.1f}s "
+              f"({result['speedup_vs_realtime']:.1f}x real time)")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Render recorded play sessions to video without a window")
+    parser.add_argument("sessions", help="Session log or glob, e.g. 'recordings/*.npz'")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--format", choices=["mp4", "frames"], default="mp4",
+                        help="mp4 video or a lossless frame_codec stream")
+    args = parser.parse_args()
+    render_sessions(args.sessions, args.workers, "." + args.format)
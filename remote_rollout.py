@@ -0,0 +1,414 @@
+import argparse
+import os
+import queue
+import socket
+import threading
+import time
+
+import numpy as np
+import torch
+import torch.multiprocessing as mp
+
+from actor_learner import ActorLearner, collect_trajectory, make_policy, print_report, to_channels_first
+from train_agent import PPO_HYPERPARAMS, create_pacman_env
+from wire_protocol import (MSG_HELLO, MSG_STOP, MSG_TRAJECTORIES, MSG_WEIGHTS, connect_with_backoff,
+                           encode_message, has_pending_message, recv_message, send_encoded, send_message)
+
+TRAJECTORY_KEYS = ('observations', 'actions', 'rewards', 'dones', 'behaviour_log_probs')
+
+
+def policy_to_arrays(policy):
+    return {name: tensor.detach().cpu().numpy() for name, tensor in policy.state_dict().items()}
+
+
+def load_policy_arrays(policy, arrays):
+    policy.load_state_dict({name: torch.as_tensor(array) for name, array in arrays.items()})
+
+
+# Runs create_pacman_env() envs on any machine that can reach the learner, and streams
+# compressed chunks of unrolls to it. Reconnects with exponential backoff whenever the
+# connection drops; env state carries over, so episodes are not cut short. Gives up once the
+# learner has been unreachable for max_reconnect_seconds.
+class RolloutWorker:
+
+    def __init__(self, host, port, worker_id=None, n_envs=1, seed=0, max_backoff=30.0, max_reconnect_seconds=300.0):
+        self.host = host
+        self.port = port
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.n_envs = n_envs
+        self.seed = seed
+        self.max_backoff = max_backoff
+        self.max_reconnect_seconds = max_reconnect_seconds
+        self.reconnects = 0
+        self.policy_version = -1
+        self.unroll_length = None
+
+    def _receive_weights(self, sock, policy):
+        msg_type, header, arrays = recv_message(sock)
+        if msg_type == MSG_STOP:
+            return False
+        if msg_type == MSG_WEIGHTS:
+            load_policy_arrays(policy, arrays)
+            self.policy_version = header['policy_version']
+            self.unroll_length = header['unroll_length']
+        return True
+
+    def run(self):
+        torch.set_num_threads(1)
+        envs = [create_pacman_env() for _ in range(self.n_envs)]
+        policy = make_policy(envs[0].observation_space, envs[0].action_space, PPO_HYPERPARAMS['learning_rate'])
+        policy.set_training_mode(False)
+        observations = [to_channels_first(env.reset(seed=self.seed + i)[0]) for i, env in enumerate(envs)]
+        episode_returns = [0.0] * self.n_envs
+
+        try:
+            while True:
+                deadline = time.time() + self.max_reconnect_seconds
+                sock = connect_with_backoff(self.host, self.port, max_delay=self.max_backoff,
+                                            should_stop=lambda: time.time() > deadline)
+                if sock is None:
+                    print(f"Worker {self.worker_id} could not reach {self.host}:{self.port} for "
+                          f"{self.max_reconnect_seconds:.0f}s, stopping")
+                    return
+                try:
+                    send_message(sock, MSG_HELLO, {'worker_id': self.worker_id, 'n_envs': self.n_envs,
+                                                   'reconnects': self.reconnects})
+                    # The learner answers with its current weights and unroll length
+                    if not self._receive_weights(sock, policy):
+                        return
+                    print(f"Worker {self.worker_id} connected to {self.host}:{self.port} "
+                          f"(policy version {self.policy_version})")
+
+                    while True:
+                        # Newer weights are pushed after a chunk; pick them up without blocking
+                        while has_pending_message(sock):
+                            if not self._receive_weights(sock, policy):
+                                return
+
+                        chunk = []
+                        for i, env in enumerate(envs):
+                            trajectory, observations[i], episode_returns[i] = collect_trajectory(
+                                env, policy, observations[i], episode_returns[i], self.unroll_length,
+                                self.policy_version)
+                            chunk.append(trajectory)
+
+                        arrays = {key: np.stack([trajectory[key] for trajectory in chunk]) for key in TRAJECTORY_KEYS}
+                        header = {
+                            'policy_version': self.policy_version,
+                            'episode_returns': [float(r) for trajectory in chunk
+                                                for r in trajectory['episode_returns']],
+                        }
+                        send_message(sock, MSG_TRAJECTORIES, header, arrays)
+                except (ConnectionError, OSError) as e:
+                    self.reconnects += 1
+                    print(f"Worker {self.worker_id} lost the learner ({e}), reconnecting")
+                finally:
+                    sock.close()
+        finally:
+            for env in envs:
+                env.close()
+
+
+def run_worker(host, port, worker_id=None, n_envs=1, seed=0, max_reconnect_seconds=300.0):
+    RolloutWorker(host, port, worker_id, n_envs, seed, max_reconnect_seconds=max_reconnect_seconds).run()
+
+
+# ActorLearner whose actors are RolloutWorkers connected over TCP, possibly on other machines.
+# Stragglers never hold up an update: a batch is trained on once batch_deadline has passed
+# since its first trajectory, and trajectories more than max_policy_lag versions behind are
+# dropped. V-trace corrects for the remaining lag, as in the local actor-learner. Training
+# stops with an error when a local worker dies or no trajectory arrives for no_data_timeout.
+class RemoteActorLearner(ActorLearner):
+
+    def __init__(self, host="0.0.0.0", port=5555, unroll_length=64, batch_size=8, learner_threads=None, seed=0,
+                 max_policy_lag=8, batch_deadline=5.0, worker_timeout=60.0, no_data_timeout=300.0):
+        super().__init__(n_actors=0, unroll_length=unroll_length, batch_size=batch_size,
+                         learner_threads=learner_threads, seed=seed)
+        self.host = host
+        self.port = port
+        self.max_policy_lag = max_policy_lag
+        self.batch_deadline = batch_deadline
+        self.worker_timeout = worker_timeout
+        self.no_data_timeout = no_data_timeout
+        self._local_workers = []
+        self._last_trajectory_time = None
+        self.policy_version = 0
+        self.worker_stats = {}
+        self._weights_message = None
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        # Open worker connections, each with a lock so weights and STOP never interleave on the wire
+        self._connections = {}
+        # Bounded, so a learner that falls behind pushes back on the workers through TCP
+        self._inbox = queue.Queue(maxsize=batch_size * 4)
+
+    def _publish_weights_remote(self):
+        # Encoded once per version and sent as-is to every worker
+        message = encode_message(MSG_WEIGHTS, {'policy_version': self.policy_version,
+                                               'unroll_length': self.unroll_length},
+                                 policy_to_arrays(self.policy))
+        with self._lock:
+            self._weights_message = (self.policy_version, message)
+
+    def _send_weights_if_newer(self, conn, sent_version):
+        with self._lock:
+            version, message = self._weights_message
+            send_lock = self._connections[conn]
+        if version > sent_version:
+            with send_lock:
+                send_encoded(conn, message)
+        return version
+
+    def _stop_workers(self):
+        # Sent on shutdown, so workers stop instead of waiting on a chunk reply and reconnecting
+        with self._lock:
+            connections = list(self._connections.items())
+        for conn, send_lock in connections:
+            try:
+                with send_lock:
+                    send_message(conn, MSG_STOP)
+            except OSError:
+                pass
+
+    def _accept_loop(self, server):
+        while not self._stop_event.is_set():
+            try:
+                conn, address = server.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            threading.Thread(target=self._serve_worker, args=(conn, address), daemon=True).start()
+
+    def _serve_worker(self, conn, address):
+        conn.settimeout(self.worker_timeout)
+        worker_id = f"{address[0]}:{address[1]}"
+        with self._lock:
+            self._connections[conn] = threading.Lock()
+        try:
+            msg_type, header, _ = recv_message(conn)
+            if msg_type != MSG_HELLO:
+                return
+            worker_id = header['worker_id']
+            with self._lock:
+                stats = self.worker_stats.setdefault(worker_id, {'connections': 0, 'chunks': 0, 'env_steps': 0,
+                                                                 'stale_trajectories': 0, 'reconnects': 0})
+                stats['connections'] += 1
+                stats['reconnects'] = header.get('reconnects', 0)
+                stats['address'] = address[0]
+            print(f"Worker {worker_id} connected from {address[0]} with {header.get('n_envs', 1)} env(s)")
+            if self._stop_event.is_set():
+                # Accepted while the learner was shutting down, after the STOP broadcast
+                send_message(conn, MSG_STOP)
+                return
+            sent_version = self._send_weights_if_newer(conn, -1)
+
+            while not self._stop_event.is_set():
+                msg_type, header, arrays = recv_message(conn)
+                if msg_type != MSG_TRAJECTORIES:
+                    continue
+                n_trajectories = len(arrays['actions'])
+                with self._lock:
+                    stats['chunks'] += 1
+                    stats['env_steps'] += int(arrays['actions'].size)
+                for i in range(n_trajectories):
+                    trajectory = {key: arrays[key][i] for key in TRAJECTORY_KEYS}
+                    trajectory['policy_version'] = header['policy_version']
+                    # Episode returns ride along with the first trajectory of the chunk
+                    trajectory['episode_returns'] = header['episode_returns'] if i == 0 else []
+                    trajectory['worker_id'] = worker_id
+                    while not self._stop_event.is_set():
+                        try:
+                            self._inbox.put(trajectory, timeout=0.5)
+                            break
+                        except queue.Full:
+                            continue
+                sent_version = self._send_weights_if_newer(conn, sent_version)
+        except socket.timeout:
+            print(f"Worker {worker_id} sent nothing for {self.worker_timeout:.0f}s, dropping it")
+        except (ConnectionError, OSError) as e:
+            if not self._stop_event.is_set():
+                print(f"Worker {worker_id} disconnected ({e})")
+        finally:
+            with self._lock:
+                self._connections.pop(conn, None)
+            conn.close()
+
+    def _check_workers(self):
+        # Called on every empty poll, so learn() raises instead of waiting forever
+        dead = [(worker.name, worker.exitcode) for worker in self._local_workers if not worker.is_alive()]
+        if dead:
+            raise RuntimeError(f"Local rollout workers exited (name, exit code): {dead}")
+        idle = time.time() - self._last_trajectory_time
+        if idle > self.no_data_timeout:
+            with self._lock:
+                connected = len(self._connections)
+            raise RuntimeError(f"No trajectories for {idle:.0f}s from {connected} connected worker(s)")
+
+    def _next_batch(self):
+        batch = []
+        deadline = None
+        while len(batch) < self.batch_size:
+            timeout = 1.0 if deadline is None else deadline - time.time()
+            if timeout <= 0:
+                self.partial_batches += 1
+                break
+            try:
+                trajectory = self._inbox.get(timeout=timeout)
+            except queue.Empty:
+                self._check_workers()
+                continue
+            self._last_trajectory_time = time.time()
+            if self.policy_version - trajectory['policy_version'] > self.max_policy_lag:
+                with self._lock:
+                    self.worker_stats[trajectory['worker_id']]['stale_trajectories'] += 1
+                self.stale_trajectories += 1
+                continue
+            batch.append(trajectory)
+            if deadline is None:
+                deadline = time.time() + self.batch_deadline
+        return batch
+
+    def learn(self, total_timesteps, local_workers=0, envs_per_worker=1):
+        if self.learner_threads:
+            torch.set_num_threads(self.learner_threads)
+
+        self.partial_batches = 0
+        self.stale_trajectories = 0
+        self._stop_event.clear()
+        self._publish_weights_remote()
+        self._last_trajectory_time = time.time()
+
+        server = socket.create_server((self.host, self.port))
+        # Wake up accept() regularly so the thread notices the end of training
+        server.settimeout(1.0)
+        accept_thread = threading.Thread(target=self._accept_loop, args=(server,), daemon=True)
+        accept_thread.start()
+        print(f"Learner listening on {self.host}:{self.port} for {total_timesteps} timesteps...")
+
+        # Local workers connect through the same TCP path as remote ones
+        ctx = mp.get_context("spawn")
+        workers = []
+        for index in range(local_workers):
+            worker = ctx.Process(target=run_worker,
+                                 args=("127.0.0.1", self.port, f"local-{index}", envs_per_worker,
+                                       self.seed + index * envs_per_worker),
+                                 daemon=True)
+            worker.start()
+            workers.append(worker)
+        self._local_workers = workers
+
+        consumed_steps = 0
+        updates = 0
+        learner_busy_time = 0.0
+        learner_wait_time = 0.0
+        version_lags = []
+        episode_returns = []
+        start_time = time.time()
+
+        try:
+            while consumed_steps < total_timesteps:
+                wait_start = time.time()
+                trajectories = self._next_batch()
+                learner_wait_time += time.time() - wait_start
+
+                busy_start = time.time()
+                loss = self._update(trajectories)
+                self.policy_version += 1
+                self._publish_weights_remote()
+                learner_busy_time += time.time() - busy_start
+
+                updates += 1
+                consumed_steps += len(trajectories) * self.unroll_length
+                version_lags.extend(self.policy_version - 1 - tr['policy_version'] for tr in trajectories)
+                for tr in trajectories:
+                    episode_returns.extend(tr['episode_returns'])
+
+                if updates % 50 == 0:
+                    elapsed = time.time() - start_time
+                    recent = episode_returns[-10:]
+                    avg_return = f"{np.mean(recent):.2f}" if recent else "N/A"
+                    print(f"Update {updates}: Steps={consumed_steps} | Steps/sec={consumed_steps / elapsed:.0f} | "
+                          f"Workers={len(self.worker_stats)} | Avg Return={avg_return} | Loss={loss:.4f}")
+        finally:
+            self._stop_event.set()
+            server.close()
+            self._stop_workers()
+            for worker in workers:
+                worker.join(timeout=10)
+                if worker.is_alive():
+                    worker.terminate()
+
+        wall_time = time.time() - start_time
+        with self._lock:
+            worker_stats = {worker_id: dict(stats) for worker_id, stats in self.worker_stats.items()}
+        generated_steps = sum(stats['env_steps'] for stats in worker_stats.values())
+
+        return {
+            'mode': 'remote_actor_learner',
+            'timesteps': consumed_steps,
+            'wall_time': wall_time,
+            'steps_per_sec': consumed_steps / wall_time,
+            'generated_steps_per_sec': generated_steps / wall_time,
+            'learner_utilization': learner_busy_time / wall_time,
+            'learner_wait_fraction': learner_wait_time / wall_time,
+            'mean_policy_lag': float(np.mean(version_lags)) if version_lags else 0.0,
+            'stale_trajectories': self.stale_trajectories,
+            'partial_batches': self.partial_batches,
+            'updates': updates,
+            'workers': worker_stats,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Actor-learner training with rollout workers over TCP")
+    subparsers = parser.add_subparsers(dest="role", required=True)
+
+    learner_parser = subparsers.add_parser("learner", help="Run the learner and accept workers")
+    learner_parser.add_argument("--host", default="0.0.0.0")
+    learner_parser.add_argument("--port", type=int, default=5555)
+    learner_parser.add_argument("--timesteps", type=int, default=200_000)
+    learner_parser.add_argument("--unroll-length", type=int, default=64)
+    learner_parser.add_argument("--batch-size", type=int, default=8, help="Trajectories per learner update")
+    learner_parser.add_argument("--max-policy-lag", type=int, default=8)
+    learner_parser.add_argument("--batch-deadline", type=float, default=5.0,
+                                help="Seconds to wait for a full batch before training on a partial one")
+    learner_parser.add_argument("--no-data-timeout", type=float, default=300.0,
+                                help="Stop with an error after this many seconds without a trajectory")
+    learner_parser.add_argument("--learner-threads", type=int, default=None)
+    learner_parser.add_argument("--local-workers", type=int, default=0,
+                                help="Also start this many workers on this machine")
+    learner_parser.add_argument("--envs-per-worker", type=int, default=1)
+    learner_parser.add_argument("--model-path", default="ppo_pacman_remote.zip")
+
+    worker_parser = subparsers.add_parser("worker", help="Run a rollout worker")
+    worker_parser.add_argument("--host", required=True, help="Address of the learner")
+    worker_parser.add_argument("--port", type=int, default=5555)
+    worker_parser.add_argument("--envs", type=int, default=1)
+    worker_parser.add_argument("--worker-id", default=None)
+    worker_parser.add_argument("--seed", type=int, default=0)
+    worker_parser.add_argument("--max-reconnect-seconds", type=float, default=300.0,
+                               help="Stop after the learner has been unreachable this long")
+    args = parser.parse_args()
+
+    if args.role == "worker":
+        run_worker(args.host, args.port, args.worker_id, args.envs, args.seed, args.max_reconnect_seconds)
+        return
+
+    learner = RemoteActorLearner(
+        host=args.host,
+        port=args.port,
+        unroll_length=args.unroll_length,
+        batch_size=args.batch_size,
+        learner_threads=args.learner_threads,
+        max_policy_lag=args.max_policy_lag,
+        batch_deadline=args.batch_deadline,
+        no_data_timeout=args.no_data_timeout,
+    )
+    report = learner.learn(args.timesteps, local_workers=args.local_workers, envs_per_worker=args.envs_per_worker)
+    learner.save(args.model_path)
+    print_report(report)
+
+
+if __name__ == "__main__":
+    main()
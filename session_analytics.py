@@ -0,0 +1,281 @@
+import argparse
+import csv
+import glob
+import json
+import multiprocessing
+import os
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from session_log import ADVICE_MODES, SOURCE_ADVICE, load_arrays
+from tournament import confidence_interval
+
+N_ACTIONS = 5
+ACTION_NAMES = ["NOOP", "UP", "RIGHT", "LEFT", "DOWN"]
+
+
+def session_metrics(path, curve_step=10.0, curve_seconds=600.0, phase_seconds=60.0):
+    # Everything one session contributes, computed with array operations in a pool worker.
+    # Curves and phases are on fixed time grids so sessions of any length can be stacked.
+    metadata, arrays = load_arrays(path)
+    times = arrays['times'].astype(np.float64)
+    rewards = arrays['rewards'].astype(np.float64)
+    actions = arrays['actions'].astype(np.int64)
+    sources = arrays['sources']
+    advice_modes = arrays['advice_modes']
+    dones = arrays['dones']
+    n_steps = len(actions)
+
+    grid = np.arange(0.0, curve_seconds + curve_step, curve_step)
+    duration = float(times[-1]) if n_steps else 0.0
+    cumulative = np.cumsum(rewards)
+    score_curve = np.interp(grid, times, cumulative, left=0.0) if n_steps else np.zeros_like(grid)
+    # Past the end of the session the curve is unknown, not flat
+    score_curve[grid > duration] = np.nan
+
+    n_phases = int(np.ceil(curve_seconds / phase_seconds))
+    # Steps past the last phase are left out rather than piled into it
+    in_phases = times < n_phases * phase_seconds
+    phase_index = (times[in_phases] // phase_seconds).astype(np.int64)
+    phase_reward = np.bincount(phase_index, weights=rewards[in_phases], minlength=n_phases)
+    phase_covered = np.clip(duration - np.arange(n_phases) * phase_seconds, 0.0, phase_seconds)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        phase_rate = np.where(phase_covered > 0, phase_reward / phase_covered * 60.0, np.nan)
+
+    advised = sources == SOURCE_ADVICE
+    advice_mode_ratio = {}
+    for mode_index, mode in enumerate(ADVICE_MODES):
+        in_mode = advice_modes == mode_index
+        if in_mode.any():
+            advice_mode_ratio[mode] = float(advised[in_mode].mean())
+
+    # Agent sessions logged clipped rewards (the sign of each reward) before they logged game points
+    rewards_kind = metadata.get('rewards', "raw" if metadata['mode'] == "human" else "clipped")
+    return {
+        'path': path,
+        'mode': metadata['mode'] if rewards_kind == "raw" else f"{metadata['mode']}_clipped",
+        'seed': metadata['seed'],
+        'started_at': metadata.get('started_at'),
+        'steps': n_steps,
+        'duration_seconds': duration,
+        'score': float(cumulative[-1]) if n_steps else 0.0,
+        'episodes': int(dones.sum()),
+        'score_per_minute': float(cumulative[-1] / duration * 60.0) if duration > 0 else 0.0,
+        'action_distribution': (np.bincount(actions, minlength=N_ACTIONS)[:N_ACTIONS] / max(n_steps, 1)).tolist(),
+        'advice_ratio': float(advised.mean()) if n_steps else 0.0,
+        'advice_ratio_by_mode': advice_mode_ratio,
+        'score_curve': score_curve.tolist(),
+        'phase_score_per_minute': phase_rate.tolist(),
+    }
+
+
+def load_sessions(pattern, workers=None, **metric_kwargs):
+    paths = sorted(glob.glob(pattern))
+    paths = [path for path in paths if not path.endswith((".mp4", ".frames"))]
+    if not paths:
+        return []
+    # A process per core: decompression and the per-session metrics run in parallel
+    ctx = multiprocessing.get_context("spawn")
+    chunk_size = max(1, len(paths) // ((workers or os.cpu_count() or 1) * 4))
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx) as pool:
+        futures = pool.map(_session_metrics_or_none, paths, [metric_kwargs] * len(paths), chunksize=chunk_size)
+        return [metrics for metrics in futures if metrics is not None]
+
+
+def _session_metrics_or_none(path, metric_kwargs):
+    try:
+        return session_metrics(path, **metric_kwargs)
+    except (OSError, KeyError, ValueError) as e:
+        print(f"Skipping '{path}': {e}")
+        return None
+
+
+def summarize(sessions, curve_step=10.0, phase_seconds=60.0):
+    # Per-mode tables and human-vs-agent gaps, all from stacked per-session arrays
+    summary = {'modes': {}, 'phase_gaps': []}
+    by_mode = {}
+    for session in sessions:
+        by_mode.setdefault(session['mode'], []).append(session)
+
+    for mode, mode_sessions in sorted(by_mode.items()):
+        scores = np.array([s['score'] for s in mode_sessions])
+        rates = np.array([s['score_per_minute'] for s in mode_sessions])
+        curves = np.array([s['score_curve'] for s in mode_sessions])
+        phases = np.array([s['phase_score_per_minute'] for s in mode_sessions])
+        mean_score, score_half_width = confidence_interval(scores)
+        mean_rate, rate_half_width = confidence_interval(rates)
+        with warnings.catch_warnings():
+            # Curve points and phases that no session of this mode reached stay NaN
+            warnings.simplefilter("ignore", RuntimeWarning)
+            summary['modes'][mode] = {
+                'sessions': len(mode_sessions),
+                'mean_score': mean_score,
+                'score_ci': score_half_width,
+                'mean_score_per_minute': mean_rate,
+                'score_per_minute_ci': rate_half_width,
+                'mean_duration_seconds': float(np.mean([s['duration_seconds'] for s in mode_sessions])),
+                'mean_episodes': float(np.mean([s['episodes'] for s in mode_sessions])),
+                'action_distribution': np.mean([s['action_distribution'] for s in mode_sessions], axis=0).tolist(),
+                'mean_advice_ratio': float(np.mean([s['advice_ratio'] for s in mode_sessions])),
+                'score_curve_mean': np.nanmean(curves, axis=0).tolist(),
+                'score_curve_sessions': np.sum(~np.isnan(curves), axis=0).tolist(),
+                'phase_score_per_minute': np.nanmean(phases, axis=0).tolist(),
+            }
+            advice_modes = sorted({mode_name for s in mode_sessions for mode_name in s['advice_ratio_by_mode']})
+            if advice_modes:
+                summary['modes'][mode]['advice_ratio_by_mode'] = {
+                    mode_name: float(np.mean([s['advice_ratio_by_mode'][mode_name] for s in mode_sessions
+                                              if mode_name in s['advice_ratio_by_mode']]))
+                    for mode_name in advice_modes
+                }
+
+    # Agent minus human points per minute in each phase, with a CI from both groups' spreads.
+    # Only sessions scored in raw game points take part; clipped agent sessions have their own row.
+    if 'human' in by_mode and 'agent' in by_mode:
+        human = np.array([s['phase_score_per_minute'] for s in by_mode['human']])
+        agent = np.array([s['phase_score_per_minute'] for s in by_mode['agent']])
+        for phase in range(human.shape[1]):
+            human_rates = human[:, phase][~np.isnan(human[:, phase])]
+            agent_rates = agent[:, phase][~np.isnan(agent[:, phase])]
+            if len(human_rates) == 0 or len(agent_rates) == 0:
+                continue
+            human_mean, human_half_width = confidence_interval(human_rates)
+            agent_mean, agent_half_width = confidence_interval(agent_rates)
+            summary['phase_gaps'].append({
+                'phase_start_seconds': phase * phase_seconds,
+                'human_sessions': len(human_rates),
+                'agent_sessions': len(agent_rates),
+                'human_score_per_minute': human_mean,
+                'agent_score_per_minute': agent_mean,
+                'gap': agent_mean - human_mean,
+                'gap_ci': float(np.hypot(human_half_width, agent_half_width)),
+            })
+    summary['curve_step'] = curve_step
+    summary['phase_seconds'] = phase_seconds
+    return summary
+
+
+def print_summary(summary):
+    print(f"{'Mode':>12} | {'Sessions':>8} | {'Score':>16} | {'Points/min':>14} | {'Minutes':>7} | {'Advice':>6} | Actions")
+    for mode, stats in summary['modes'].items():
+        actions = " ".join(f"{name}={share:.0%}" for name, share in zip(ACTION_NAMES, stats['action_distribution']))
+        print(f"{mode:>12} | {stats['sessions']:>8} | {stats['mean_score']:>8.1f} ± {stats['score_ci']:<5.1f} | "
+              f"{stats['mean_score_per_minute']:>6.1f} ± {stats['score_per_minute_ci']:<5.1f} | "
+              f"{stats['mean_duration_seconds'] / 60:>7.1f} | {stats['mean_advice_ratio']:>6.1%} | {actions}")
+        for advice_mode, ratio in stats.get('advice_ratio_by_mode', {}).items():
+            print(f"{'':>12}   advice ratio in {advice_mode} mode: {ratio:.1%}")
+
+    if summary['phase_gaps']:
+        print(f"\nAgent minus human points per minute, by {summary['phase_seconds']:.0f}s phase:")
+        print(f"{'Phase':>9} | {'Human':>7} | {'Agent':>7} | {'Gap':>16} | Sessions (h/a)")
+        for gap in summary['phase_gaps']:
+            print(f"{gap['phase_start_seconds']:>8.0f}s | {gap['human_score_per_minute']:>7.1f} | "
+                  f"{gap['agent_score_per_minute']:>7.1f} | {gap['gap']:>+8.1f} ± {gap['gap_ci']:<5.1f} | "
+                  f"{gap['human_sessions']}/{gap['agent_sessions']}")
+
+
+def write_tables(sessions, summary, output_dir):
+    os.makedirs(output_dir, exist_ok=True)
+    fields = ['path', 'mode', 'seed', 'started_at', 'steps', 'duration_seconds', 'score', 'episodes',
+              'score_per_minute', 'advice_ratio']
+    with open(os.path.join(output_dir, "sessions.csv"), "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(fields + [f"action_{name.lower()}" for name in ACTION_NAMES])
+        for session in sessions:
+            writer.writerow([session[field] for field in fields] + session['action_distribution'])
+    with open(os.path.join(output_dir, "summary.json"), "w") as f:
+        json.dump(summary, f, indent=2)
+
+
+def plot_summary(summary, output_dir):
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    os.makedirs(output_dir, exist_ok=True)
+    paths = []
+    modes = summary['modes']
+
+    fig, ax = plt.subplots(figsize=(8, 5))
+    for mode, stats in modes.items():
+        curve = np.array(stats['score_curve_mean'])
+        minutes = np.arange(len(curve)) * summary['curve_step'] / 60
+        ax.plot(minutes, curve, label=f"{mode} ({stats['sessions']} sessions)")
+    ax.set_xlabel("Session time (minutes)")
+    ax.set_ylabel("Mean cumulative score")
+    ax.set_title("Score over time")
+    ax.legend()
+    paths.append(os.path.join(output_dir, "score_curves.png"))
+    fig.savefig(paths[-1], dpi=120, bbox_inches="tight")
+    plt.close(fig)
+
+    fig, ax = plt.subplots(figsize=(8, 5))
+    width = 0.8 / max(len(modes), 1)
+    for i, (mode, stats) in enumerate(modes.items()):
+        ax.bar(np.arange(N_ACTIONS) + i * width, stats['action_distribution'], width, label=mode)
+    ax.set_xticks(np.arange(N_ACTIONS) + width * (len(modes) - 1) / 2)
+    ax.set_xticklabels(ACTION_NAMES)
+    ax.set_ylabel("Share of steps")
+    ax.set_title("Action distribution")
+    ax.legend()
+    paths.append(os.path.join(output_dir, "action_distribution.png"))
+    fig.savefig(paths[-1], dpi=120, bbox_inches="tight")
+    plt.close(fig)
+
+    fig, ax = plt.subplots(figsize=(8, 5))
+    for mode, stats in modes.items():
+        rates = np.array(stats['phase_score_per_minute'])
+        phase_minutes = np.arange(len(rates)) * summary['phase_seconds'] / 60
+        ax.plot(phase_minutes, rates, marker="o", label=mode)
+    if summary['phase_gaps']:
+        starts = np.array([gap['phase_start_seconds'] for gap in summary['phase_gaps']]) / 60
+        gaps = np.array([gap['gap'] for gap in summary['phase_gaps']])
+        cis = np.array([gap['gap_ci'] for gap in summary['phase_gaps']])
+        ax.errorbar(starts, gaps, yerr=cis, fmt="s--", capsize=3, label="agent - human")
+    ax.axhline(0, color="gray", linewidth=0.5)
+    ax.set_xlabel("Phase start (minutes)")
+    ax.set_ylabel("Points per minute")
+    ax.set_title("Score rate by phase")
+    ax.legend()
+    paths.append(os.path.join(output_dir, "phase_rates.png"))
+    fig.savefig(paths[-1], dpi=120, bbox_inches="tight")
+    plt.close(fig)
+    return paths
+
+
+def analyze(pattern, output_dir="analytics", workers=None, curve_step=10.0, curve_seconds=600.0,
+            phase_seconds=60.0, plots=True):
+    start = time.time()
+    sessions = load_sessions(pattern, workers, curve_step=curve_step, curve_seconds=curve_seconds,
+                             phase_seconds=phase_seconds)
+    if not sessions:
+        print(f"No sessions found for '{pattern}'")
+        return None
+    load_seconds = time.time() - start
+
+    summary = summarize(sessions, curve_step, phase_seconds)
+    print_summary(summary)
+    write_tables(sessions, summary, output_dir)
+    outputs = ["sessions.csv", "summary.json"]
+    if plots:
+        outputs += [os.path.basename(path) for path in plot_summary(summary, output_dir)]
+    print(f"\n{len(sessions)} sessions loaded in {load_seconds:.1f}s, done in {time.time() - start:.1f}s; "
+          f"wrote {', '.join(outputs)} to '{output_dir}'")
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Summary tables and plots over many recorded play sessions")
+    parser.add_argument("sessions", help="Session logs glob, e.g. 'recordings/*.npz'")
+    parser.add_argument("--output-dir", default="analytics")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--curve-step", type=float, default=10.0, help="Seconds between score curve points")
+    parser.add_argument("--curve-seconds", type=float, default=600.0, help="Length of score curves and phases")
+    parser.add_argument("--phase-seconds", type=float, default=60.0)
+    parser.add_argument("--no-plots", action="store_true")
+    args = parser.parse_args()
+    analyze(args.sessions, args.output_dir, args.workers, args.curve_step, args.curve_seconds,
+            args.phase_seconds, not args.no_plots)
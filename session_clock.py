@@ -0,0 +1,171 @@
+import asyncio
+import heapq
+import itertools
+import threading
+import time
+
+
+# Monotonic session time that stops while the game is paused
+class SessionClock:
+
+    def __init__(self, time_fn=time.monotonic):
+        self.time_fn = time_fn
+        self.started_at = None
+        self.paused_at = None
+        self.total_pause_time = 0.0
+        self.listeners = []
+
+    def start(self):
+        self.started_at = self.time_fn()
+        self.paused_at = None
+        self.total_pause_time = 0.0
+
+    @property
+    def running(self):
+        return self.started_at is not None
+
+    @property
+    def paused(self):
+        return self.paused_at is not None
+
+    def pause(self):
+        if self.running and self.paused_at is None:
+            self.paused_at = self.time_fn()
+            self._notify()
+
+    def resume(self):
+        if self.paused_at is not None:
+            self.total_pause_time += self.time_fn() - self.paused_at
+            self.paused_at = None
+            self._notify()
+
+    def _notify(self):
+        for listener in self.listeners:
+            listener()
+
+    def elapsed(self):
+        if self.started_at is None:
+            return 0.0
+        now = self.paused_at if self.paused_at is not None else self.time_fn()
+        return now - self.started_at - self.total_pause_time
+
+
+class ScheduledEvent:
+
+    def __init__(self, deadline, callback, name):
+        self.deadline = deadline
+        self.callback = callback
+        self.name = name
+        self.cancelled = False
+        self.fired = False
+
+
+# Fires callbacks at deadlines measured in session time, so paused time never counts.
+# Drive it with poll() from a frame loop, or await run() on an asyncio loop.
+class DeadlineScheduler:
+
+    def __init__(self, clock):
+        self.clock = clock
+        self._heap = []
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+        self._loop = None
+        self._wakeup = None
+        self._stopping = False
+        clock.listeners.append(self.notify)
+
+    def schedule(self, deadline, callback, name=None):
+        event = ScheduledEvent(deadline, callback, name)
+        with self._lock:
+            heapq.heappush(self._heap, (deadline, next(self._counter), event))
+        self.notify()
+        return event
+
+    def schedule_in(self, delay, callback, name=None):
+        return self.schedule(self.clock.elapsed() + delay, callback, name)
+
+    def cancel(self, event):
+        event.cancelled = True
+        self.notify()
+
+    def cancel_all(self):
+        with self._lock:
+            for _, _, event in self._heap:
+                event.cancelled = True
+            self._heap = []
+        self.notify()
+
+    def _pop_due(self, now):
+        with self._lock:
+            while self._heap and (self._heap[0][2].cancelled or self._heap[0][0] <= now):
+                _, _, event = heapq.heappop(self._heap)
+                if not event.cancelled:
+                    return event
+        return None
+
+    def poll(self):
+        # Fire every event whose deadline has passed, in deadline order
+        fired = []
+        now = self.clock.elapsed()
+        event = self._pop_due(now)
+        while event is not None:
+            event.fired = True
+            event.callback()
+            fired.append(event)
+            event = self._pop_due(now)
+        return fired
+
+    def time_until_next(self):
+        # Session seconds until the next deadline; None while paused or when nothing is scheduled
+        if self.clock.paused:
+            return None
+        with self._lock:
+            pending = [deadline for deadline, _, event in self._heap if not event.cancelled]
+        if not pending:
+            return None
+        return max(0.0, min(pending) - self.clock.elapsed())
+
+    def sleep(self, seconds):
+        # Blocking sleep for frame loops: deadlines inside it fire on time, then the rest of the frame is slept out
+        end = time.monotonic() + seconds
+        fired = []
+        while True:
+            remaining = end - time.monotonic()
+            until_next = self.time_until_next()
+            if until_next is not None and until_next < remaining:
+                remaining = until_next
+            if remaining > 0:
+                time.sleep(remaining)
+            fired.extend(self.poll())
+            if time.monotonic() >= end:
+                return fired
+
+    def notify(self):
+        # Wake run() after a schedule, cancel, pause or resume so it recomputes its sleep
+        if self._loop is not None and self._wakeup is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def stop(self):
+        self._stopping = True
+        self.notify()
+
+    async def run(self):
+        # Sleeps until the next deadline (or forever while paused) instead of polling;
+        # any change to the schedule or the clock wakes it early. Ends after stop().
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        try:
+            while True:
+                self.poll()
+                if self._stopping:
+                    break
+                timeout = self.time_until_next()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+        finally:
+            self._loop = None
+            self._wakeup = None
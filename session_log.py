@@ -0,0 +1,130 @@
+import json
+import os
+import pickle
+import time
+
+import numpy as np
+
+# Who chose the action of a step
+SOURCE_AGENT = 0
+SOURCE_ADVICE = 1
+SOURCE_HUMAN = 2
+
+ADVICE_MODES = ["none", "freeze", "countdown"]
+
+STEP_FIELDS = ("times", "actions", "rewards", "dones", "sources", "advice_modes")
+
+
+# Per-step record of a play session: enough to replay it exactly from its seed
+# and to analyse it offline without re-running the emulator
+class SessionLog:
+
+    def __init__(self, mode, seed, metadata=None):
+        self.metadata = {
+            'mode': mode,
+            'seed': seed,
+            'started_at': time.time(),
+        }
+        self.metadata.update(metadata or {})
+        self.times = []
+        self.actions = []
+        self.rewards = []
+        self.sources = []
+        self.advice_modes = []
+        self.dones = []
+        # Emulator snapshots where a human advised the agent, for counterfactual replays
+        self.advice_points = []
+
+    def record_step(self, elapsed_time, action, reward, done, source=SOURCE_AGENT, advice_mode="none"):
+        self.times.append(elapsed_time)
+        self.actions.append(action)
+        self.rewards.append(reward)
+        self.dones.append(done)
+        self.sources.append(source)
+        self.advice_modes.append(ADVICE_MODES.index(advice_mode))
+
+    def record_advice_point(self, ale_state, observation, advised_action, agent_action):
+        # Call before stepping the advised action; the state is serialized only on save
+        self.advice_points.append({
+            'step': len(self.actions),
+            'ale_state': ale_state,
+            'observation': np.array(observation),
+            'advised_action': advised_action,
+            'agent_action': agent_action,
+        })
+
+    def __len__(self):
+        return len(self.actions)
+
+    def save(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        np.savez_compressed(
+            path,
+            metadata=np.array(json.dumps(self.metadata)),
+            times=np.asarray(self.times, dtype=np.float64),
+            actions=np.asarray(self.actions, dtype=np.int8),
+            rewards=np.asarray(self.rewards, dtype=np.float32),
+            dones=np.asarray(self.dones, dtype=np.bool_),
+            sources=np.asarray(self.sources, dtype=np.int8),
+            advice_modes=np.asarray(self.advice_modes, dtype=np.int8),
+            **_pack_advice_points(self.advice_points),
+        )
+        return path
+
+    @classmethod
+    def load(cls, path):
+        metadata, arrays = load_arrays(path)
+        log = cls(metadata['mode'], metadata['seed'], metadata)
+        for name, values in arrays.items():
+            setattr(log, name, values.tolist())
+        log.advice_points = load_advice_points(path)
+        return log
+
+
+def load_arrays(path):
+    # The per-step records as arrays, for analysis without building Python lists
+    with np.load(path) as data:
+        metadata = json.loads(str(data['metadata']))
+        arrays = {name: data[name] for name in STEP_FIELDS}
+    return metadata, arrays
+
+
+def _pack_advice_points(advice_points):
+    if not advice_points:
+        return {}
+    # ALE states are variable-length bytes: one flat buffer plus end offsets, so no pickled arrays
+    states = [point['ale_state'] if isinstance(point['ale_state'], bytes) else pickle.dumps(point['ale_state'])
+              for point in advice_points]
+    return {
+        'advice_steps': np.array([point['step'] for point in advice_points], dtype=np.int64),
+        'advice_actions': np.array([point['advised_action'] for point in advice_points], dtype=np.int8),
+        'advice_agent_actions': np.array([point['agent_action'] for point in advice_points], dtype=np.int8),
+        'advice_observations': np.stack([point['observation'] for point in advice_points]),
+        'advice_states': np.frombuffer(b"".join(states), dtype=np.uint8),
+        'advice_state_ends': np.cumsum([len(state) for state in states]),
+    }
+
+
+def load_advice_points(path):
+    # ale_state stays as pickled bytes; pickle.loads it where ale_py is imported
+    with np.load(path) as data:
+        if 'advice_steps' not in data:
+            return []
+        states = data['advice_states'].tobytes()
+        starts = np.concatenate([[0], data['advice_state_ends'][:-1]])
+        return [{
+            'step': int(step),
+            'ale_state': states[start:end],
+            'observation': observation,
+            'advised_action': int(advised_action),
+            'agent_action': int(agent_action),
+        } for step, advised_action, agent_action, observation, start, end in zip(
+            data['advice_steps'], data['advice_actions'], data['advice_agent_actions'],
+            data['advice_observations'], starts, data['advice_state_ends'])]
+
+
+def session_path(record_dir, mode, extension=".npz"):
+    stamp = time.strftime("%Y%m%d_%H%M%S")
+    return os.path.join(record_dir, f"{mode}_{stamp}{extension}")
@@ -0,0 +1,348 @@
+import argparse
+import ctypes
+import multiprocessing
+import time
+import traceback
+
+import numpy as np
+from stable_baselines3.common.env_util import is_wrapped
+from stable_baselines3.common.vec_env import SubprocVecEnv, VecEnv
+from stable_baselines3.common.vec_env.base_vec_env import CloudpickleWrapper
+
+# Commands written to the shared command slot of each worker
+CMD_STEP = 0
+CMD_RESET = 1
+CMD_REMOTE = 2
+CMD_CLOSE = 3
+
+# Per-worker step status flags
+STEP_OK = 0
+STEP_INFOS = 1  # episode-end infos follow on the pipe
+STEP_ERROR = 2  # a WorkerError follows on the pipe
+
+
+# Sent over the pipe in place of a result when a command raised inside a worker
+class WorkerError:
+
+    def __init__(self, worker_id, traceback_text):
+        self.worker_id = worker_id
+        self.traceback_text = traceback_text
+
+
+def _shared_array(ctx, shape, dtype):
+    dtype = np.dtype(dtype)
+    nbytes = int(np.prod(shape)) * dtype.itemsize
+    return ctx.RawArray(ctypes.c_uint8, max(nbytes, 1))
+
+
+def _as_numpy(raw, shape, dtype):
+    return np.frombuffer(raw, dtype=dtype, count=int(np.prod(shape))).reshape(shape)
+
+
+def _get_env_attr(env, name):
+    if hasattr(env, "get_wrapper_attr"):
+        return env.get_wrapper_attr(name)
+    return getattr(env, name)
+
+
+def _set_env_attr(env, name, value):
+    if hasattr(env, "set_wrapper_attr"):
+        env.set_wrapper_attr(name, value)
+    else:
+        setattr(env, name, value)
+
+
+def _worker(remote, parent_remote, env_fn_wrappers, env_indices, worker_id, buffers, specs, commands,
+            info_flags, go, step_done):
+    parent_remote.close()
+    envs = [wrapper.var() for wrapper in env_fn_wrappers]
+
+    obs_buf = _as_numpy(buffers['obs'], *specs['obs'])
+    terminal_obs_buf = _as_numpy(buffers['terminal_obs'], *specs['obs'])
+    action_buf = _as_numpy(buffers['actions'], *specs['actions'])
+    reward_buf = _as_numpy(buffers['rewards'], *specs['rewards'])
+    done_buf = _as_numpy(buffers['dones'], *specs['dones'])
+
+    while True:
+        go.acquire()
+        command = commands[worker_id]
+        if command == CMD_CLOSE:
+            for env in envs:
+                env.close()
+            remote.close()
+            break
+
+        try:
+            _run_command(command, remote, envs, env_indices, worker_id, info_flags, obs_buf, terminal_obs_buf,
+                         action_buf, reward_buf, done_buf)
+        except Exception:
+            # The parent waits on the pipe or on step_done; both must hear about the failure
+            remote.send(WorkerError(worker_id, traceback.format_exc()))
+            if command == CMD_STEP:
+                info_flags[worker_id] = STEP_ERROR
+                step_done.release()
+            continue
+        if command == CMD_STEP:
+            step_done.release()
+
+
+def _run_command(command, remote, envs, env_indices, worker_id, info_flags, obs_buf, terminal_obs_buf,
+                 action_buf, reward_buf, done_buf):
+    if command == CMD_STEP:
+        finished = []
+        for env, env_idx in zip(envs, env_indices):
+            obs, reward, terminated, truncated, info = env.step(action_buf[env_idx])
+            done = terminated or truncated
+            if done:
+                terminal_obs_buf[env_idx] = obs
+                info['TimeLimit.truncated'] = truncated and not terminated
+                obs, reset_info = env.reset()
+                finished.append((env_idx, info, reset_info))
+            obs_buf[env_idx] = obs
+            reward_buf[env_idx] = reward
+            done_buf[env_idx] = done
+        # Infos only cross the pipe on episode ends; every other step is pure shared memory
+        info_flags[worker_id] = STEP_INFOS if finished else STEP_OK
+        if finished:
+            remote.send(finished)
+
+    elif command == CMD_RESET:
+        seeds, options = remote.recv()
+        reset_infos = []
+        for env, env_idx, seed, option in zip(envs, env_indices, seeds, options):
+            obs, reset_info = env.reset(seed=seed, options=option)
+            obs_buf[env_idx] = obs
+            reset_infos.append(reset_info)
+        remote.send(reset_infos)
+
+    elif command == CMD_REMOTE:
+        kind, name, args, kwargs, local_targets = remote.recv()
+        results = []
+        for local_idx in local_targets:
+            env = envs[local_idx]
+            if kind == "get_attr":
+                results.append(_get_env_attr(env, name))
+            elif kind == "set_attr":
+                _set_env_attr(env, name, args)
+                results.append(None)
+            elif kind == "env_method":
+                results.append(_get_env_attr(env, name)(*args, **kwargs))
+            elif kind == "env_is_wrapped":
+                results.append(is_wrapped(env, name))
+        remote.send(results)
+
+
+class SharedMemoryVecEnv(VecEnv):
+
+    def __init__(self, env_fns, n_workers=None, start_method=None, poll_seconds=1.0):
+        n_envs = len(env_fns)
+        n_workers = min(n_workers or n_envs, n_envs)
+
+        if start_method is None:
+            # Same default as SubprocVecEnv: forkserver is faster to start and thread-safe
+            start_method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        ctx = multiprocessing.get_context(start_method)
+
+        # Read the spaces from a throwaway env so the shared buffers can be sized up front
+        probe_env = env_fns[0]()
+        observation_space = probe_env.observation_space
+        action_space = probe_env.action_space
+        probe_env.close()
+
+        action_shape = action_space.shape or ()
+        action_dtype = action_space.dtype if action_space.dtype is not None else np.int64
+        self._specs = {
+            'obs': ((n_envs,) + observation_space.shape, observation_space.dtype),
+            'actions': ((n_envs,) + action_shape, action_dtype),
+            'rewards': ((n_envs,), np.float32),
+            'dones': ((n_envs,), np.bool_),
+        }
+        self._buffers = {
+            'obs': _shared_array(ctx, *self._specs['obs']),
+            'terminal_obs': _shared_array(ctx, *self._specs['obs']),
+            'actions': _shared_array(ctx, *self._specs['actions']),
+            'rewards': _shared_array(ctx, *self._specs['rewards']),
+            'dones': _shared_array(ctx, *self._specs['dones']),
+        }
+        self._obs = _as_numpy(self._buffers['obs'], *self._specs['obs'])
+        self._terminal_obs = _as_numpy(self._buffers['terminal_obs'], *self._specs['obs'])
+        self._actions = _as_numpy(self._buffers['actions'], *self._specs['actions'])
+        self._rewards = _as_numpy(self._buffers['rewards'], *self._specs['rewards'])
+        self._dones = _as_numpy(self._buffers['dones'], *self._specs['dones'])
+
+        self._commands = ctx.RawArray(ctypes.c_int32, n_workers)
+        self._info_flags = ctx.RawArray(ctypes.c_int8, n_workers)
+        self._go = [ctx.Semaphore(0) for _ in range(n_workers)]
+        self._step_done = ctx.Semaphore(0)
+
+        # Contiguous slices of envs per worker
+        self._worker_envs = [list(indices) for indices in np.array_split(np.arange(n_envs), n_workers)]
+        self.remotes = []
+        self.processes = []
+        for worker_id, env_indices in enumerate(self._worker_envs):
+            remote, work_remote = ctx.Pipe()
+            process = ctx.Process(
+                target=_worker,
+                args=(work_remote, remote, [CloudpickleWrapper(env_fns[i]) for i in env_indices],
+                      env_indices, worker_id, self._buffers, self._specs, self._commands,
+                      self._info_flags, self._go[worker_id], self._step_done),
+                daemon=True,
+            )
+            process.start()
+            work_remote.close()
+            self.remotes.append(remote)
+            self.processes.append(process)
+
+        self.n_workers = n_workers
+        self.poll_seconds = poll_seconds
+        self.waiting = False
+        self.closed = False
+        super().__init__(n_envs, observation_space, action_space)
+
+    def _send_command(self, worker_id, command, payload=None):
+        self._commands[worker_id] = command
+        self._go[worker_id].release()
+        if payload is not None:
+            self.remotes[worker_id].send(payload)
+
+    def _check_workers(self):
+        dead = [(worker_id, process.exitcode) for worker_id, process in enumerate(self.processes)
+                if not process.is_alive()]
+        if dead:
+            raise RuntimeError(f"SharedMemoryVecEnv workers exited (worker, exit code): {dead}")
+
+    def _recv(self, worker_id):
+        # Polls, so a worker that died does not leave the parent blocked on its pipe
+        remote = self.remotes[worker_id]
+        while not remote.poll(self.poll_seconds):
+            self._check_workers()
+        result = remote.recv()
+        if isinstance(result, WorkerError):
+            raise RuntimeError(f"SharedMemoryVecEnv worker {result.worker_id} failed:\n{result.traceback_text}")
+        return result
+
+    def reset(self):
+        for worker_id, env_indices in enumerate(self._worker_envs):
+            seeds = [self._seeds[i] for i in env_indices]
+            options = [self._options[i] for i in env_indices]
+            self._send_command(worker_id, CMD_RESET, (seeds, options))
+        for worker_id, env_indices in enumerate(self._worker_envs):
+            for env_idx, reset_info in zip(env_indices, self._recv(worker_id)):
+                self.reset_infos[env_idx] = reset_info
+        self._reset_seeds()
+        self._reset_options()
+        return self._obs.copy()
+
+    def step_async(self, actions):
+        self._actions[:] = np.asarray(actions).reshape(self._actions.shape)
+        for worker_id in range(self.n_workers):
+            self._send_command(worker_id, CMD_STEP)
+        self.waiting = True
+
+    def step_wait(self):
+        for _ in range(self.n_workers):
+            while not self._step_done.acquire(timeout=self.poll_seconds):
+                try:
+                    self._check_workers()
+                except RuntimeError:
+                    self.waiting = False
+                    raise
+        self.waiting = False
+
+        infos = [{} for _ in range(self.num_envs)]
+        # Read every worker's pipe before raising, so no message is left behind for the next step
+        errors = []
+        for worker_id in range(self.n_workers):
+            if self._info_flags[worker_id] == STEP_ERROR:
+                try:
+                    self._recv(worker_id)
+                except RuntimeError as e:
+                    errors.append(e)
+            elif self._info_flags[worker_id] == STEP_INFOS:
+                for env_idx, info, reset_info in self._recv(worker_id):
+                    info['terminal_observation'] = self._terminal_obs[env_idx].copy()
+                    infos[env_idx] = info
+                    self.reset_infos[env_idx] = reset_info
+
+        if errors:
+            raise errors[0]
+        # Copy out because workers overwrite the shared buffers on the next step
+        return self._obs.copy(), self._rewards.copy(), self._dones.copy(), infos
+
+    def close(self):
+        if self.closed:
+            return
+        if self.waiting:
+            try:
+                self.step_wait()
+            except RuntimeError:
+                pass
+        for worker_id, process in enumerate(self.processes):
+            if process.is_alive():
+                self._send_command(worker_id, CMD_CLOSE)
+        for process in self.processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        self.closed = True
+
+    def _remote_call(self, kind, name, args=None, kwargs=None, indices=None):
+        indices = self._get_indices(indices)
+        calls = []
+        for worker_id, env_indices in enumerate(self._worker_envs):
+            local_targets = [local_idx for local_idx, env_idx in enumerate(env_indices) if env_idx in indices]
+            if local_targets:
+                self._send_command(worker_id, CMD_REMOTE, (kind, name, args, kwargs or {}, local_targets))
+                calls.append(worker_id)
+        results = []
+        for worker_id in calls:
+            results.extend(self._recv(worker_id))
+        return results
+
+    def get_attr(self, attr_name, indices=None):
+        return self._remote_call("get_attr", attr_name, indices=indices)
+
+    def set_attr(self, attr_name, value, indices=None):
+        self._remote_call("set_attr", attr_name, args=value, indices=indices)
+
+    def env_method(self, method_name, *method_args, indices=None, **method_kwargs):
+        return self._remote_call("env_method", method_name, method_args, method_kwargs, indices=indices)
+
+    def env_is_wrapped(self, wrapper_class, indices=None):
+        return self._remote_call("env_is_wrapped", wrapper_class, indices=indices)
+
+    def get_images(self):
+        return self.env_method("render")
+
+
+def _time_vec_env(vec_env, steps):
+    vec_env.reset()
+    actions = np.array([vec_env.action_space.sample() for _ in range(vec_env.num_envs)])
+    start = time.time()
+    for _ in range(steps):
+        vec_env.step(actions)
+    elapsed = time.time() - start
+    vec_env.close()
+    return vec_env.num_envs * steps / elapsed
+
+
+def benchmark(worker_counts=(8, 16, 32), steps=1000):
+    from train_agent import create_pacman_env
+
+    results = []
+    print(f"{'Workers':>8} | {'SubprocVecEnv':>14} | {'SharedMemoryVecEnv':>18} | {'Speedup':>7}")
+    for n_workers in worker_counts:
+        env_fns = [create_pacman_env for _ in range(n_workers)]
+        subproc_sps = _time_vec_env(SubprocVecEnv(env_fns), steps)
+        shm_sps = _time_vec_env(SharedMemoryVecEnv(env_fns), steps)
+        results.append({'workers': n_workers, 'subproc_steps_per_sec': subproc_sps, 'shm_steps_per_sec': shm_sps})
+        print(f"{n_workers:>8} | {subproc_sps:>14.0f} | {shm_sps:>18.0f} | {shm_sps / subproc_sps:>6.2f}x")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark SharedMemoryVecEnv against SubprocVecEnv")
+    parser.add_argument("--workers", type=int, nargs="+", default=[8, 16, 32])
+    parser.add_argument("--steps", type=int, default=1000, help="Vectorized steps per configuration")
+    args = parser.parse_args()
+    benchmark(args.workers, args.steps)
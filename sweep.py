@@ -0,0 +1,269 @@
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+from stable_baselines3.common.callbacks import BaseCallback
+
+# Hyperparameters explored by the sweep: lists are sampled uniformly,
+# ("log", low, high) tuples log-uniformly
+SEARCH_SPACE = {
+    'n_steps': [64, 128, 256, 512],
+    'clip_range': [0.1, 0.2, 0.3],
+    'learning_rate': ("log", 1e-4, 1e-3),
+    'ent_coef': ("log", 1e-3, 5e-2),
+}
+
+
+def sample_config(rng):
+    config = {}
+    for name, space in SEARCH_SPACE.items():
+        if isinstance(space, tuple) and space[0] == "log":
+            config[name] = float(math.exp(rng.uniform(math.log(space[1]), math.log(space[2]))))
+        else:
+            config[name] = rng.choice(space)
+    return config
+
+
+# Callback that records (timesteps, mean recent episode reward) points
+class LearningCurveCallback(BaseCallback):
+
+    def __init__(self, window=20, verbose=0):
+        super(LearningCurveCallback, self).__init__(verbose)
+        self.window = window
+        self.episode_rewards = []
+        self.curve = []
+
+    def _on_step(self):
+        for info in self.locals.get('infos', []):
+            if 'episode' in info:
+                self.episode_rewards.append(float(info['episode']['r']))
+                recent = self.episode_rewards[-self.window:]
+                self.curve.append([int(self.num_timesteps), float(np.mean(recent))])
+        return True
+
+
+def _init_trial_worker(slot_counter, cores_per_trial):
+    # Give each pool slot its own set of cores and a matching torch thread count
+    import torch
+    with slot_counter.get_lock():
+        slot = slot_counter.value
+        slot_counter.value += 1
+    if hasattr(os, "sched_setaffinity"):
+        cpus = sorted(os.sched_getaffinity(0))
+        start = (slot * cores_per_trial) % len(cpus)
+        os.sched_setaffinity(0, cpus[start:start + cores_per_trial] or cpus)
+    torch.set_num_threads(cores_per_trial)
+
+
+def run_trial_segment(trial_dir, config, start_timesteps, target_timesteps):
+    # Imported here so pool workers only pay for it once the core budget is set
+    from train_agent import train
+
+    curve_callback = LearningCurveCallback()
+    start = time.time()
+    train(
+        model_path=os.path.join(trial_dir, "model.zip"),
+        total_timesteps=target_timesteps - start_timesteps,
+        hyperparams=config,
+        resume=start_timesteps > 0,
+        extra_callbacks=[curve_callback],
+        # Trials get their own core budget, so the host-wide autotune profile does not apply
+        profile_path=None,
+    )
+
+    recent = [point[1] for point in curve_callback.curve[-3:]]
+    return {
+        'timesteps': target_timesteps,
+        'curve': curve_callback.curve,
+        'score': float(np.mean(recent)) if recent else float("-inf"),
+        'seconds': time.time() - start,
+    }
+
+
+class SweepStore:
+
+    def __init__(self, sweep_dir):
+        self.sweep_dir = sweep_dir
+        self.trials_dir = os.path.join(sweep_dir, "trials")
+        os.makedirs(self.trials_dir, exist_ok=True)
+
+    def _write(self, path, data):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f, indent=2)
+        os.replace(tmp_path, path)
+
+    def load_settings(self):
+        path = os.path.join(self.sweep_dir, "sweep.json")
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return json.load(f)
+
+    def save_settings(self, settings):
+        self._write(os.path.join(self.sweep_dir, "sweep.json"), settings)
+
+    def trial_dir(self, trial_id):
+        path = os.path.join(self.trials_dir, trial_id)
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def load_trials(self):
+        trials = []
+        for name in sorted(os.listdir(self.trials_dir)):
+            if name.endswith(".json"):
+                with open(os.path.join(self.trials_dir, name)) as f:
+                    trials.append(json.load(f))
+        return trials
+
+    def save_trial(self, trial):
+        self._write(os.path.join(self.trials_dir, f"{trial['trial_id']}.json"), trial)
+
+
+class SuccessiveHalvingSweep:
+
+    def __init__(self, sweep_dir="sweeps/default", n_trials=27, min_timesteps=50_000, eta=3,
+                 n_rungs=4, cores_per_trial=1, max_parallel=None, seed=0):
+        self.store = SweepStore(sweep_dir)
+
+        settings = {
+            'n_trials': n_trials,
+            'min_timesteps': min_timesteps,
+            'eta': eta,
+            'n_rungs': n_rungs,
+            'seed': seed,
+        }
+        saved_settings = self.store.load_settings()
+        if saved_settings is not None:
+            # Resuming: the saved settings win so promotions stay consistent
+            if saved_settings != settings:
+                print(f"Resuming sweep in '{sweep_dir}' with its saved settings: {saved_settings}")
+            settings = saved_settings
+        else:
+            self.store.save_settings(settings)
+        self.settings = settings
+
+        self.cores_per_trial = cores_per_trial
+        available_cores = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count()
+        self.max_parallel = max_parallel or max(1, available_cores // cores_per_trial)
+
+    def rung_timesteps(self, rung):
+        return self.settings['min_timesteps'] * self.settings['eta'] ** rung
+
+    def _create_trials(self):
+        trials = self.store.load_trials()
+        if trials:
+            print(f"Loaded {len(trials)} existing trials")
+            return trials
+
+        rng = random.Random(self.settings['seed'])
+        for i in range(self.settings['n_trials']):
+            trial = {
+                'trial_id': f"trial_{i:04d}",
+                'config': sample_config(rng),
+                'status': 'running',
+                'timesteps': 0,
+                'scores': {},
+                'curve': [],
+            }
+            self.store.save_trial(trial)
+            trials.append(trial)
+        return trials
+
+    def _run_rung(self, rung, trials):
+        target = self.rung_timesteps(rung)
+        todo = [trial for trial in trials if str(rung) not in trial['scores']]
+        if not todo:
+            return
+
+        print(f"\nRung {rung}: training {len(todo)} trials to {target:,} timesteps "
+              f"({self.max_parallel} in parallel, {self.cores_per_trial} core(s) each)")
+
+        ctx = multiprocessing.get_context("spawn")
+        slot_counter = ctx.Value('i', 0)
+        with ProcessPoolExecutor(max_workers=self.max_parallel, mp_context=ctx,
+                                 initializer=_init_trial_worker,
+                                 initargs=(slot_counter, self.cores_per_trial)) as pool:
+            futures = {
+                pool.submit(run_trial_segment, self.store.trial_dir(trial['trial_id']),
+                            trial['config'], trial['timesteps'], target): trial
+                for trial in todo
+            }
+            for future in as_completed(futures):
+                trial = futures[future]
+                result = future.result()
+                trial['timesteps'] = result['timesteps']
+                trial['curve'].extend(result['curve'])
+                trial['scores'][str(rung)] = result['score']
+                self.store.save_trial(trial)
+                print(f"  {trial['trial_id']}: score={result['score']:.2f} ({result['seconds']:.0f}s) {trial['config']}")
+
+    def _promote(self, rung, trials):
+        ranked = sorted(trials, key=lambda trial: trial['scores'][str(rung)], reverse=True)
+        keep = max(1, math.ceil(len(ranked) / self.settings['eta']))
+        last_rung = rung == self.settings['n_rungs'] - 1
+        for position, trial in enumerate(ranked):
+            if last_rung:
+                trial['status'] = 'completed'
+            elif position >= keep:
+                trial['status'] = 'pruned'
+                trial['pruned_at_rung'] = rung
+            self.store.save_trial(trial)
+
+    def run(self):
+        trials = self._create_trials()
+
+        for rung in range(self.settings['n_rungs']):
+            # Trials that reached this rung; on resume, rungs that already have
+            # scores are not retrained and their promotions are recomputed identically
+            active = [trial for trial in trials
+                      if trial.get('pruned_at_rung', rung) >= rung
+                      and (rung == 0 or str(rung - 1) in trial['scores'])]
+            if not active:
+                break
+            self._run_rung(rung, active)
+            self._promote(rung, active)
+
+        finished = [trial for trial in trials if trial['status'] == 'completed']
+        finished.sort(key=lambda trial: trial['scores'][str(self.settings['n_rungs'] - 1)], reverse=True)
+        if finished:
+            best = finished[0]
+            print(f"\nBest trial: {best['trial_id']} score={best['scores'][str(self.settings['n_rungs'] - 1)]:.2f}")
+            print(f"Config: {best['config']}")
+            print(f"Model: {os.path.join(self.store.trials_dir, best['trial_id'], 'model.zip')}")
+        return finished
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Successive-halving PPO hyperparameter sweep")
+    parser.add_argument("--sweep-dir", default="sweeps/default")
+    parser.add_argument("--trials", type=int, default=27)
+    parser.add_argument("--min-timesteps", type=int, default=50_000, help="Budget of the first rung")
+    parser.add_argument("--eta", type=int, default=3, help="Keep the top 1/eta trials per rung")
+    parser.add_argument("--rungs", type=int, default=4)
+    parser.add_argument("--cores-per-trial", type=int, default=1)
+    parser.add_argument("--max-parallel", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    sweep = SuccessiveHalvingSweep(
+        sweep_dir=args.sweep_dir,
+        n_trials=args.trials,
+        min_timesteps=args.min_timesteps,
+        eta=args.eta,
+        n_rungs=args.rungs,
+        cores_per_trial=args.cores_per_trial,
+        max_parallel=args.max_parallel,
+        seed=args.seed,
+    )
+    sweep.run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+import argparse
+import csv
+import glob
+import json
+import multiprocessing
+import os
+import time
+from collections import OrderedDict, defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from statistics import NormalDist
+
+import numpy as np
+
+# Per-worker state: one warm env per observation layout and a few loaded policies, reused across jobs
+_worker_envs = {}
+_worker_models = OrderedDict()
+_MAX_LOADED_MODELS = 4
+
+
+def confidence_interval(values, confidence=0.95):
+    # Normal-approximation CI of the mean; returns (mean, half_width)
+    values = np.asarray(values, dtype=np.float64)
+    mean = float(values.mean())
+    if len(values) < 2:
+        return mean, 0.0
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    return mean, float(z * values.std(ddof=1) / np.sqrt(len(values)))
+
+
+def _init_worker():
+    import torch
+
+    torch.set_num_threads(1)
+
+
+def env_kwargs_for(observation_space):
+    # create_pacman_env settings whose observations a model takes: RAM bytes or unpacked bits,
+    # or pixels with as many ring-stacked frames as it was trained on
+    from frame_stack import infer_n_stack
+
+    shape = observation_space.shape
+    if len(shape) == 1:
+        return {'obs_type': "ram", 'unpack_bits': shape[0] == 128 * 8}
+    return {'frame_stack': infer_n_stack(observation_space)}
+
+
+def _get_env(model):
+    from train_agent import create_pacman_env
+
+    env_kwargs = env_kwargs_for(model.observation_space)
+    key = tuple(sorted(env_kwargs.items()))
+    if key not in _worker_envs:
+        _worker_envs[key] = create_pacman_env(**env_kwargs)
+    return _worker_envs[key]
+
+
+def _get_model(model_path):
+    from stable_baselines3 import PPO
+
+    if model_path in _worker_models:
+        _worker_models.move_to_end(model_path)
+        return _worker_models[model_path]
+    model = PPO.load(model_path, device="cpu")
+    _worker_models[model_path] = model
+    if len(_worker_models) > _MAX_LOADED_MODELS:
+        _worker_models.popitem(last=False)
+    return model
+
+
+def play_episodes(model_path, seeds):
+    from train_agent import run_episode
+
+    model = _get_model(model_path)
+    env = _get_env(model)
+    results = []
+    for seed in seeds:
+        episode_reward, episode_length = run_episode(model, env, seed=seed)
+        results.append({'seed': seed, 'reward': episode_reward, 'length': episode_length})
+    return model_path, results
+
+
+def find_models(pattern):
+    if os.path.isdir(pattern):
+        pattern = os.path.join(pattern, "*.zip")
+    return sorted(glob.glob(pattern))
+
+
+def build_leaderboard(episode_results):
+    rows = []
+    for model_path, results in episode_results.items():
+        rewards = [result['reward'] for result in sorted(results, key=lambda r: r['seed'])]
+        lengths = [result['length'] for result in results]
+        mean, half_width = confidence_interval(rewards)
+        rows.append({
+            'model': model_path,
+            'episodes': len(rewards),
+            'mean_reward': mean,
+            'std_reward': float(np.std(rewards)),
+            'ci_low': mean - half_width,
+            'ci_high': mean + half_width,
+            'mean_length': float(np.mean(lengths)),
+            'rewards': rewards,
+        })
+    rows.sort(key=lambda row: row['mean_reward'], reverse=True)
+
+    # Every model played the same seeds, so differences to the leader are paired per seed
+    leader_rewards = np.array(rows[0]['rewards'])
+    for rank, row in enumerate(rows, start=1):
+        row['rank'] = rank
+        diff_mean, diff_half_width = confidence_interval(np.array(row['rewards']) - leader_rewards)
+        row['diff_vs_leader'] = diff_mean
+        row['diff_ci_low'] = diff_mean - diff_half_width
+        row['diff_ci_high'] = diff_mean + diff_half_width
+    return rows
+
+
+def run_tournament(pattern, episodes=20, seed=0, workers=None, chunk_size=5):
+    model_paths = find_models(pattern)
+    if not model_paths:
+        print(f"No models found for '{pattern}'")
+        return []
+
+    seeds = [seed + i for i in range(episodes)]
+    workers = workers or os.cpu_count()
+    print(f"Tournament: {len(model_paths)} models x {episodes} seeds on {workers} workers")
+
+    # Jobs are (model, chunk of seeds); a chunk keeps one loaded policy busy for several episodes
+    jobs = [(model_path, seeds[i:i + chunk_size]) for model_path in model_paths
+            for i in range(0, len(seeds), chunk_size)]
+
+    episode_results = defaultdict(list)
+    start = time.time()
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx, initializer=_init_worker) as pool:
+        futures = [pool.submit(play_episodes, model_path, job_seeds) for model_path, job_seeds in jobs]
+        for completed, future in enumerate(as_completed(futures), start=1):
+            model_path, results = future.result()
+            episode_results[model_path].extend(results)
+            if completed % 10 == 0 or completed == len(futures):
+                print(f"Jobs {completed}/{len(futures)} done ({time.time() - start:.0f}s)")
+
+    return build_leaderboard(episode_results)
+
+
+def write_leaderboard(rows, csv_path, json_path):
+    fields = ['rank', 'model', 'episodes', 'mean_reward', 'std_reward', 'ci_low', 'ci_high',
+              'diff_vs_leader', 'diff_ci_low', 'diff_ci_high', 'mean_length']
+    with open(csv_path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=fields, extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(rows)
+    with open(json_path, "w") as f:
+        json.dump(rows, f, indent=2)
+
+
+def print_leaderboard(rows):
+    print(f"\n{'Rank':>4} | {'Mean Reward':>11} | {'95% CI':>17} | {'vs Leader':>9} | Model")
+    for row in rows:
+        ci = f"[{row['ci_low']:.2f}, {row['ci_high']:.2f}]"
+        print(f"{row['rank']:>4} | {row['mean_reward']:>11.2f} | {ci:>17} | "
+              f"{row['diff_vs_leader']:>+9.2f} | {row['model']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rank many Pacman checkpoints on paired seeds")
+    parser.add_argument("models", help="Directory of .zip models or a glob such as 'ppo_pacman*.zip'")
+    parser.add_argument("--episodes", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--chunk-size", type=int, default=5, help="Episodes per job")
+    parser.add_argument("--csv", default="leaderboard.csv")
+    parser.add_argument("--json", default="leaderboard.json")
+    args = parser.parse_args()
+
+    rows = run_tournament(args.models, args.episodes, args.seed, args.workers, args.chunk_size)
+    if rows:
+        write_leaderboard(rows, args.csv, args.json)
+        print_leaderboard(rows)
+        print(f"\nLeaderboard written to '{args.csv}' and '{args.json}'")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,23 @@
-import gymnasium as gym
 from stable_baselines3 import PPO
-from stable_baselines3.common.atari_wrappers import AtariWrapper
 from stable_baselines3.common.callbacks import BaseCallback
+from stable_baselines3.common.env_util import make_vec_env
+from stable_baselines3.common.vec_env import DummyVecEnv, SubprocVecEnv
 import numpy as np
 import os
-import ale_py
-
-# Register ALE environments
-gym.register_envs(ale_py)
+import time
+from eval_cache import EvaluationCache, summarize_episodes
+from checkpoint_eval import CheckpointEvalCallback
+from shm_vec_env import SharedMemoryVecEnv
+from inference_cache import CachedPolicy
+from inference_server import RemotePolicy
+from autotune import TRAIN_PROFILE_PATH, load_train_profile
+from compact_rollout import rollout_buffer_kwargs
+from cpu_learner import CpuOptimizedPPO
+from curriculum import summarize_curriculum
+from metrics_store import METRICS_DB_PATH, MetricsCallback, close_run, open_run
+from env_factory import ENV_CONFIG, create_env
+from frame_codec import FRAME_CODEC_EXTENSION, FrameWriter
+from frame_stack import RingFrameStack, saved_n_stack
 
 
 # Callback to print episode progress
@@ -63,25 +73,69 @@ class EpisodeProgressCallback(BaseCallback):
         return True
 
 
-def create_pacman_env():
-    # Create base environment
-    env = gym.make("ALE/Pacman-v5", frameskip=1)
-    
-    # Apply Atari wrapper with proper settings
-    env = AtariWrapper(
-        env,
-        frame_skip=4,
-        terminal_on_life_loss=False,  # Don't end episode on life loss
-        clip_reward=True
-    )
-    
-    return env
+# Vectorized env implementations selectable in train()
+VEC_ENV_CLASSES = {
+    'dummy': DummyVecEnv,
+    'subproc': SubprocVecEnv,
+    'shm': SharedMemoryVecEnv,
+}
+
+# PPO hyperparameters used by train()
+PPO_HYPERPARAMS = {
+    'n_steps': 128,
+    'gamma': 0.99,
+    'gae_lambda': 0.95,
+    'clip_range': 0.1,
+    'ent_coef': 0.01,
+    'vf_coef': 0.5,
+    'max_grad_norm': 0.5,
+    'learning_rate': 2.5e-4,
+}
+
+
+def get_env_config(obs_type="pixel", unpack_bits=False):
+    if obs_type == "pixel":
+        return ENV_CONFIG
+    return dict(ENV_CONFIG, obs_type=obs_type, unpack_bits=unpack_bits)
 
-def train(model_path="ppo_pacman.zip"):
+
+def create_pacman_env(obs_type="pixel", unpack_bits=False, frame_stack=1, curriculum=None):
+    # Module-level so SubprocVecEnv and the process pools can pickle it
+    return create_env("train", obs_type=obs_type, unpack_bits=unpack_bits, frame_stack=frame_stack,
+                      curriculum=curriculum)
+
+def make_training_env(n_envs, vec_env, n_workers=None, env_kwargs=None):
+    # Only the shared-memory env spreads envs over a configurable number of workers
+    vec_env_kwargs = {'n_workers': n_workers} if vec_env == "shm" and n_workers else None
+    return make_vec_env(create_pacman_env, n_envs=n_envs, env_kwargs=env_kwargs,
+                        vec_env_cls=VEC_ENV_CLASSES[vec_env], vec_env_kwargs=vec_env_kwargs)
+
+def train(model_path="ppo_pacman.zip", total_timesteps=10_000_000, hyperparams=None, resume=False,
+          eval_freq=None, eval_episodes=5, eval_workers=2, n_envs=None, vec_env=None, extra_callbacks=None,
+          obs_type="pixel", unpack_bits=False, n_workers=None, torch_threads=None,
+          profile_path=TRAIN_PROFILE_PATH, learner="default", frame_stack=1, rollout_storage="default",
+          rollout_memory_budget_mb=None, rollout_spill_dir=None, metrics_path=METRICS_DB_PATH, curriculum=None):
+    if frame_stack > 1 and obs_type == "ram":
+        # Same check as create_env; the vectorized env is stacked here, not in create_env
+        raise ValueError("Frame stacking needs preprocessed pixel observations")
     print("Starting PPO training on ALE Pacman...")
     
+    # Settings not passed explicitly come from the autotune profile of this host, if there is one
+    profile = load_train_profile(profile_path, obs_type)
+    if profile:
+        print(f"Using autotune profile '{profile_path}': {profile}")
+    n_envs = n_envs if n_envs is not None else profile.get('n_envs', 1)
+    vec_env = vec_env or profile.get('vec_env', "dummy")
+    n_workers = n_workers if n_workers is not None else profile.get('n_workers')
+    torch_threads = torch_threads if torch_threads is not None else profile.get('torch_threads')
+    hyperparams = dict(hyperparams or {})
+    if 'n_steps' in profile:
+        hyperparams.setdefault('n_steps', profile['n_steps'])
+    
     # Check GPU availability
     import torch
+    if torch_threads:
+        torch.set_num_threads(torch_threads)
     if torch.cuda.is_available():
         print(f"GPU detected: {torch.cuda.get_device_name(0)}")
         print(f"CUDA version: {torch.version.cuda}")
@@ -89,33 +143,93 @@ def train(model_path="ppo_pacman.zip"):
     else:
         print("No GPU detected, using CPU")
     
-    # Create environment
-    env = create_pacman_env()
+    # Create environment (n_envs copies, stepped by the chosen vectorized env)
+    env_kwargs = {'obs_type': obs_type, 'unpack_bits': unpack_bits}
+    # Only training episodes start from curriculum snapshots; checkpoints are evaluated from normal resets
+    train_env_kwargs = env_kwargs if curriculum is None else dict(env_kwargs, curriculum=curriculum)
+    env = make_training_env(n_envs, vec_env, n_workers, train_env_kwargs)
+    print(f"Using {n_envs} environment(s) with {VEC_ENV_CLASSES[vec_env].__name__}")
+    if frame_stack > 1:
+        # Stacked once for all envs in the main process; checkpoint evaluation stacks per env
+        env = RingFrameStack(env, frame_stack)
+        eval_env_kwargs = dict(env_kwargs, frame_stack=frame_stack)
+    else:
+        eval_env_kwargs = env_kwargs
     
     print(f"Action space: {env.action_space}")
     print(f"Observation space: {env.observation_space}")
     
-    # PPO model
-    model = PPO(
-        "CnnPolicy",
-        env,
-        n_steps=128,
-        gamma=0.99,
-        gae_lambda=0.95,
-        clip_range=0.1,
-        ent_coef=0.01,
-        vf_coef=0.5,
-        max_grad_norm=0.5,
-        learning_rate=2.5e-4,
-        verbose=0,
-    )
+    # PPO model (hyperparams override the defaults in PPO_HYPERPARAMS)
+    ppo_kwargs = dict(PPO_HYPERPARAMS, **hyperparams)
+    model_class = PPO
+    if learner == "cpu":
+        # Compiled, channels-last update phase with larger minibatches for CPU-only nodes
+        model_class = CpuOptimizedPPO
+        ppo_kwargs['intra_op_threads'] = torch_threads
+    if rollout_storage == "compact":
+        # uint8 observations, one stored frame per step when stacking, spilled to disk over budget
+        ppo_kwargs.update(rollout_buffer_kwargs(rollout_memory_budget_mb, spill_dir=rollout_spill_dir))
+    if resume and os.path.exists(model_path):
+        model = model_class.load(model_path, env=env, **ppo_kwargs)
+        print(f"Resuming training of '{model_path}' from {model.num_timesteps} timesteps")
+    else:
+        # RAM observations are flat feature vectors, so they use an MLP instead of the CNN
+        policy = "MlpPolicy" if obs_type == "ram" else "CnnPolicy"
+        model = model_class(policy, env, verbose=0, **ppo_kwargs)
+    
+    if rollout_storage == "compact":
+        storage = model.rollout_buffer.get_storage_report()
+        print(f"Rollout storage: {storage['bytes_per_transition']:.0f} bytes/transition "
+              f"(float32 buffer: {storage['rollout_buffer_bytes_per_transition']:.0f}), "
+              f"{storage['in_memory_mb']:.1f} MB in memory, {storage['spilled_mb']:.1f} MB spilled")
     
     # Create callback for episode progress tracking
-    episode_callback = EpisodeProgressCallback()
+    callbacks = [EpisodeProgressCallback()] + list(extra_callbacks or [])
+    
+    # Episodes and losses are also streamed to the metrics store, written in the background
+    metrics_store, metrics_run = open_run(metrics_path, "train", {
+        'model_path': model_path, 'total_timesteps': total_timesteps, 'resume': resume, 'n_envs': n_envs,
+        'vec_env': vec_env, 'obs_type': obs_type, 'learner': learner, 'frame_stack': frame_stack,
+        'rollout_storage': rollout_storage, 'curriculum': curriculum, 'hyperparams': ppo_kwargs,
+    })
+    if metrics_run:
+        callbacks.append(MetricsCallback(metrics_run))
+        print(f"Logging metrics to '{metrics_path}' as run {metrics_run.run_id}")
+    
+    # Optionally evaluate checkpoints in background processes while training
+    if eval_freq:
+        best_model_path = os.path.splitext(model_path)[0] + "_best.zip"
+        callbacks.append(CheckpointEvalCallback(
+            eval_freq=eval_freq,
+            eval_episodes=eval_episodes,
+            n_workers=eval_workers,
+            best_model_path=best_model_path,
+            env_kwargs=eval_env_kwargs
+        ))
     
     # Train the model
-    print("Starting training for 10M timesteps...")
-    model.learn(total_timesteps=10_000_000, callback=episode_callback)
+    print(f"Starting training for {total_timesteps:,} timesteps...")
+    start_time = time.time()
+    try:
+        model.learn(total_timesteps=total_timesteps, callback=callbacks, reset_num_timesteps=not resume)
+    finally:
+        close_run(metrics_store, metrics_run, {
+            'num_timesteps': model.num_timesteps,
+            'training_seconds': time.time() - start_time,
+            'episodes': callbacks[0].episode_count,
+        })
+    
+    if learner == "cpu":
+        update_statistics = model.get_update_statistics()
+        if update_statistics:
+            print(f"Update phase: {update_statistics['mean_update_seconds']:.3f}s per iteration "
+                  f"(first {update_statistics['first_update_seconds']:.1f}s incl. compilation, "
+                  f"batch size {update_statistics['batch_size']})")
+    
+    if curriculum is not None:
+        curriculum_statistics = summarize_curriculum(env.env_method("get_curriculum_statistics"))
+        print(f"Curriculum: episode starts {curriculum_statistics['starts']}, "
+              f"snapshots captured {curriculum_statistics['captured']}")
     
     model.save(model_path)
     print(f"Model saved as '{model_path}'")
@@ -123,59 +237,131 @@ def train(model_path="ppo_pacman.zip"):
     env.close()
     return model
 
-def evaluate_model(model_path="ppo_pacman.zip", episodes=100):
+def run_episode(model, env, seed=None, frame_writer=None):
+    obs, _ = env.reset(seed=seed)
+    episode_reward = 0
+    episode_length = 0
+    
+    while True:
+        if frame_writer is not None:
+            frame_writer.write(obs)
+        action, _ = model.predict(obs, deterministic=True)
+        obs, reward, terminated, truncated, _ = env.step(action)
+        
+        episode_reward += reward
+        episode_length += 1
+        
+        if terminated or truncated:
+            break
+    
+    return float(episode_reward), episode_length
+
+def evaluate_model(model_path="ppo_pacman.zip", episodes=100, seed=0, use_cache=True, cache_dir=".eval_cache",
+                   obs_type="pixel", unpack_bits=False, inference_cache_size=None, frame_stack=None,
+                   metrics_path=METRICS_DB_PATH, record_dir=None, inference_socket=None):
     if not os.path.exists(model_path):
         print(f"Error: Model file '{model_path}' not found!")
         return None
     
-    env = create_pacman_env()
-    
-    model = PPO.load(model_path)
-    print(f"Model loaded from '{model_path}'")
+    # Stack as many frames as the model was trained on; resolved before the cache key, which includes it
+    if frame_stack is None:
+        frame_stack = saved_n_stack(model_path)
     
-    episode_rewards = []
-    episode_lengths = []
+    # Episode i is always played with seed + i, so cached episodes can be reused
+    cached_episodes = []
+    if use_cache:
+        cache = EvaluationCache(cache_dir)
+        env_config = dict(get_env_config(obs_type, unpack_bits), frame_stack=frame_stack)
+        cache_key, key_data = cache.make_key(model_path, env_config, seed)
+        if record_dir:
+            # Cached episodes are never replayed, so they could not be recorded
+            print(f"Recording to '{record_dir}': replaying all {episodes} episodes instead of reading the cache")
+        else:
+            cached_episodes = cache.load(cache_key)[:episodes]
+        if cached_episodes:
+            print(f"Reusing {len(cached_episodes)}/{episodes} cached episodes for '{model_path}'")
     
-    print(f"Evaluating over {episodes} episodes...")
+    episode_results = list(cached_episodes)
     
-    for episode in range(episodes):
-        obs, _ = env.reset()
-        episode_reward = 0
-        episode_length = 0
+    if len(episode_results) < episodes:
+        if inference_socket:
+            # Actions from a shared InferenceServer instead of a model copy in this process
+            model = remote_policy = RemotePolicy(inference_socket)
+            if model.model_path != os.path.abspath(model_path):
+                remote_policy.close()
+                raise ValueError(f"Inference server at {inference_socket} serves '{model.model_path}', not '{model_path}'")
+            print(f"Using inference server at {inference_socket} for '{model_path}'")
+        else:
+            model = PPO.load(model_path)
+            print(f"Model loaded from '{model_path}'")
         
-        while True:
-            action, _ = model.predict(obs, deterministic=True)
-            obs, reward, terminated, truncated, _ = env.step(action)
-            
-            episode_reward += reward
-            episode_length += 1
+        env = create_env("eval", obs_type=obs_type, unpack_bits=unpack_bits, frame_stack=frame_stack)
+        
+        # Optionally skip forward passes for observations seen before
+        if inference_cache_size:
+            model = CachedPolicy(model, max_size=inference_cache_size)
+        
+        print(f"Evaluating over {episodes} episodes...")
+        
+        for episode in range(len(episode_results), episodes):
+            # Optionally keep the observations the policy saw, one frame_codec stream per episode
+            frame_writer = None
+            if record_dir:
+                frame_writer = FrameWriter(os.path.join(record_dir, f"eval_seed{seed + episode}{FRAME_CODEC_EXTENSION}"))
+            episode_reward, episode_length = run_episode(model, env, seed=seed + episode, frame_writer=frame_writer)
+            if frame_writer is not None:
+                frame_writer.close()
+            episode_results.append({'seed': seed + episode, 'reward': episode_reward, 'length': episode_length})
             
-            if terminated or truncated:
-                break
+            # Print progress every 10 episodes
+            if (episode + 1) % 10 == 0:
+                avg_reward = np.mean([ep['reward'] for ep in episode_results])
+                print(f"Episode {episode + 1}/{episodes}: Avg Reward = {avg_reward:.2f}")
+                # Checkpoint the cache so an interrupted evaluation is not lost
+                if use_cache:
+                    cache.save(cache_key, key_data, episode_results)
         
-        episode_rewards.append(episode_reward)
-        episode_lengths.append(episode_length)
+        env.close()
+        if inference_socket:
+            remote_policy.close()
         
-        # Print progress every 10 episodes
-        if (episode + 1) % 10 == 0:
-            avg_reward = np.mean(episode_rewards)
-            print(f"Episode {episode + 1}/{episodes}: Avg Reward = {avg_reward:.2f}")
+        if use_cache:
+            cache.save(cache_key, key_data, episode_results)
     
-    env.close()
+    episode_rewards = [ep['reward'] for ep in episode_results]
+    episode_lengths = [ep['length'] for ep in episode_results]
+    summary = summarize_episodes(episode_rewards, episode_lengths)
     
     # Print final statistics
     print(f"\nEvaluation Results:")
-    print(f"Mean Reward: {np.mean(episode_rewards):.2f}")
-    print(f"Mean Episode Length: {np.mean(episode_lengths):.1f}")
-    print(f"Best Episode: {max(episode_rewards):.2f}")
-    print(f"Worst Episode: {min(episode_rewards):.2f}")
+    print(f"Mean Reward: {summary['mean_reward']:.2f}")
+    print(f"Mean Episode Length: {summary['mean_length']:.1f}")
+    print(f"Best Episode: {summary['best_reward']:.2f}")
+    print(f"Worst Episode: {summary['worst_reward']:.2f}")
     
-    return {
+    results = {
         'rewards': episode_rewards,
         'lengths': episode_lengths,
-        'mean_reward': np.mean(episode_rewards),
-        'std_reward': np.std(episode_rewards)
+        'mean_reward': summary['mean_reward'],
+        'std_reward': summary['std_reward'],
+        'cached_episodes': len(cached_episodes)
     }
+    
+    if inference_cache_size and len(cached_episodes) < episodes:
+        cache_stats = model.get_statistics()
+        print(f"Skipped Forward Passes: {cache_stats['forward_passes_skipped']} "
+              f"(hit rate {cache_stats['hit_rate']:.1%}, {cache_stats['evictions']} evictions)")
+        results['inference_cache'] = cache_stats
+    
+    metrics_store, metrics_run = open_run(metrics_path, "eval", {
+        'model_path': model_path, 'episodes': episodes, 'seed': seed, 'obs_type': obs_type})
+    if metrics_run:
+        for episode in episode_results:
+            metrics_run.log('episode_reward', episode['reward'], episode['seed'])
+            metrics_run.log('episode_length', episode['length'], episode['seed'])
+        close_run(metrics_store, metrics_run, dict(summary, cached_episodes=len(cached_episodes)))
+    
+    return results
 
 if __name__ == "__main__":
     # Train the model
@@ -0,0 +1,101 @@
+import io
+import json
+import select
+import socket
+import struct
+import time
+import zlib
+
+import numpy as np
+
+# Message types exchanged between the learner and remote rollout workers
+MSG_HELLO = 1          # worker -> learner: identity and settings
+MSG_WEIGHTS = 2        # learner -> worker: policy version and state dict
+MSG_TRAJECTORIES = 3   # worker -> learner: a chunk of unrolls
+MSG_STOP = 4           # learner -> worker: training is over
+MSG_POLICY_INFO = 5    # inference server -> client: model and observation layout
+
+# type, header length, payload length; the payload is zlib-compressed .npz bytes
+FRAME_HEADER = struct.Struct("!BII")
+# Row count of a raw array frame
+ROWS_HEADER = struct.Struct("!I")
+MAX_MESSAGE_BYTES = 1 << 30
+
+
+def encode_message(msg_type, header=None, arrays=None, level=1):
+    # JSON for scalars, .npz for arrays: nothing is unpickled on the receiving side
+    header_bytes = json.dumps(header or {}).encode()
+    payload = b""
+    if arrays:
+        buffer = io.BytesIO()
+        np.savez(buffer, **arrays)
+        payload = zlib.compress(buffer.getvalue(), level)
+    return FRAME_HEADER.pack(msg_type, len(header_bytes), len(payload)) + header_bytes + payload
+
+
+def _recv_exactly(sock, n_bytes):
+    data = bytearray(n_bytes)
+    view = memoryview(data)
+    received = 0
+    while received < n_bytes:
+        n = sock.recv_into(view[received:])
+        if n == 0:
+            raise ConnectionError("Connection closed by peer")
+        received += n
+    return bytes(data)
+
+
+def send_message(sock, msg_type, header=None, arrays=None):
+    sock.sendall(encode_message(msg_type, header, arrays))
+
+
+def send_encoded(sock, message):
+    # For messages encoded once and sent to many peers, e.g. weights
+    sock.sendall(message)
+
+
+def recv_message(sock):
+    msg_type, header_length, payload_length = FRAME_HEADER.unpack(_recv_exactly(sock, FRAME_HEADER.size))
+    if header_length + payload_length > MAX_MESSAGE_BYTES:
+        raise ConnectionError(f"Message of {header_length + payload_length} bytes exceeds the limit")
+    header = json.loads(_recv_exactly(sock, header_length)) if header_length else {}
+    arrays = {}
+    if payload_length:
+        payload = zlib.decompress(_recv_exactly(sock, payload_length))
+        with np.load(io.BytesIO(payload), allow_pickle=False) as data:
+            arrays = {name: data[name] for name in data.files}
+    return msg_type, header, arrays
+
+
+# Raw frames for latency-critical request/response traffic, where the npz encoding would cost
+# more than the payload: a row count, then the rows' bytes. Both sides agree on dtype and row shape.
+def send_rows(sock, rows):
+    rows = np.ascontiguousarray(rows)
+    sock.sendall(ROWS_HEADER.pack(len(rows)) + rows.tobytes())
+
+
+def recv_rows(sock, dtype, row_shape=()):
+    (n_rows,) = ROWS_HEADER.unpack(_recv_exactly(sock, ROWS_HEADER.size))
+    dtype = np.dtype(dtype)
+    row_bytes = dtype.itemsize * int(np.prod(row_shape))
+    if n_rows * row_bytes > MAX_MESSAGE_BYTES:
+        raise ConnectionError(f"Message of {n_rows * row_bytes} bytes exceeds the limit")
+    return np.frombuffer(_recv_exactly(sock, n_rows * row_bytes), dtype=dtype).reshape((n_rows,) + tuple(row_shape))
+
+
+def has_pending_message(sock):
+    # Non-blocking check used by workers between chunks
+    readable, _, _ = select.select([sock], [], [], 0)
+    return bool(readable)
+
+
+def connect_with_backoff(host, port, initial_delay=0.5, max_delay=30.0, timeout=None, should_stop=None):
+    delay = initial_delay
+    while should_stop is None or not should_stop():
+        try:
+            return socket.create_connection((host, port), timeout=timeout)
+        except OSError as e:
+            print(f"Could not connect to {host}:{port} ({e}), retrying in {delay:.1f}s")
+            time.sleep(delay)
+            delay = min(delay * 2, max_delay)
+    return None